@@ -5,7 +5,7 @@ from fastapi import Depends, File, Form, HTTPException, APIRouter, UploadFile
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from auth import get_current_user, read_users_me
-from database import create_session, db_connect, get_db
+from database import create_session, get_db
 from schemas import DeleteRequest, UserBase
 from models import Image
 import logging
@@ -14,8 +14,6 @@ import os
 router = APIRouter(prefix="/ad", tags=["ad"]) # Create a router for authentication
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
-engine, connection = db_connect()
-session = create_session(engine)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -93,9 +91,16 @@ async def delete_expired_images(db: Session):   # Delete expired images
     
     return {"message": f"Deleted {len(expired_images)} expired images."}
 
+async def run_image_cleanup():
+    """One pass of the expired image cleanup"""
+    with create_session() as db:
+        # logging.info(f"Deleting expired images at {datetime.now()}")
+        return await delete_expired_images(db)
+
 async def periodic_cleanup():
     while True:
-        with session as db:
-            # logging.info(f"Deleting expired images at {datetime.now()}")
-            await delete_expired_images(db)
-        await asyncio.sleep(90)  # Run every 30 seconds
\ No newline at end of file
+        try:
+            await run_image_cleanup()
+        except Exception as e:
+            logger.error(f"Error deleting expired images: {e}")
+        await asyncio.sleep(90)  # Run every 90 seconds
\ No newline at end of file
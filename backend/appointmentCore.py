@@ -4,21 +4,22 @@ from uuid import UUID, uuid4
 from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, HTTPException
 from auth import get_current_user, professor_or_superuser_required, read_users_me
-from otp import get_gmail_service
+from emailOutbox import enqueue_email, notify_outbox
+from gmailClient import GmailError
+from gmailSync import changed_messages, prune_processed, record_processed, save_checkpoint
+from otp import gmail_client
 from schemas import AppointmentResponse, AppointmentCreate, AppointmentResponseForTable, AppointmentUpdate, RescheduleAppointment, UserBase
-from database import create_session, db_connect, get_db
+from database import async_db_dependency, create_session, get_db
 from models import Appointment, ProfessorInformation
-from sqlalchemy.orm import Session
-from sqlalchemy import cast, String
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import cast, func, select, String
+from sqlalchemy.exc import IntegrityError
 import base64
-from googleapiclient.errors import HttpError
 from email.message import EmailMessage
 import logging
+import os
 import re
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 
-session = create_session(db_connect()[0])
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix='/appointment', tags=['appointment'])
@@ -57,8 +58,6 @@ async def reschedule_appointment(appointment: RescheduleAppointment, db: Session
     existing_appointment.end_time = formattedEndTime
     existing_appointment.status = 'Rescheduled'
 
-    db.commit()
-    db.refresh(existing_appointment)
     professor = db.query(ProfessorInformation.first_name,
                          ProfessorInformation.last_name,
                          ProfessorInformation.title
@@ -73,7 +72,11 @@ async def reschedule_appointment(appointment: RescheduleAppointment, db: Session
         "professor_name": f"{professor.title} {professor.first_name} {professor.last_name}",
     }
 
-    await send_email_reschedule_student(app)
+    # Queued in the same transaction as the change; sent in the background
+    queue_reschedule_student_email(db, app)
+    db.commit()
+    db.refresh(existing_appointment)
+    notify_outbox()
     
     return {'message': 'Appointment rescheduled successfully', 'status': existing_appointment.status}
 
@@ -112,8 +115,6 @@ async def create_apointment(appointment: AppointmentCreate, db: Session = Depend
     )
     
     db.add(new_appointment)
-    db.commit()
-    db.refresh(new_appointment)
     uuid = str(new_appointment.uuid) # This will give the last 6 digits of uuid to users for reference
 
     professor = db.query(ProfessorInformation.email,
@@ -121,112 +122,98 @@ async def create_apointment(appointment: AppointmentCreate, db: Session = Depend
                          ProfessorInformation.last_name,
                          ProfessorInformation.title
                         ).filter(ProfessorInformation.professor_id == appointment.professor_uuid).first()
-
-    try:
-        service = get_gmail_service()
-
-        messageForStudent = EmailMessage()
-        messageForProfessor = EmailMessage()
-
-        # Create email content
-        messageForStudent.set_content(f"Dear {appointment.student_name},\n\n"
-                                      f"Good day!\n\n"
-                                      f"Your appointment with {f"{professor.title} {professor.first_name} {professor.last_name}"} has been created.\n"
-                                      f"You can view your appointment in our kiosk using the reference number.\n\n"
-                                      f"Reference Number: {uuid[-6:]}\n\n"
-                                      f"We also notified {f"{professor.title} {professor.first_name} {professor.last_name}"} about your appointment.\n\n")
+    if professor is None:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Professor not found")
+
+    messageForStudent = EmailMessage()
+    messageForProfessor = EmailMessage()
+
+    # Create email content
+    messageForStudent.set_content(f"Dear {appointment.student_name},\n\n"
+                                  f"Good day!\n\n"
+                                  f"Your appointment with {f"{professor.title} {professor.first_name} {professor.last_name}"} has been created.\n"
+                                  f"You can view your appointment in our kiosk using the reference number.\n\n"
+                                  f"Reference Number: {uuid[-6:]}\n\n"
+                                  f"We also notified {f"{professor.title} {professor.first_name} {professor.last_name}"} about your appointment.\n\n")
+    
+    # messageForProfessor.set_content(f"Dear {f"{professor.title} {professor.first_name} {professor.last_name}"},\n\n"
+    #                               f"Good day!\n\n"
+    #                               f"{appointment.student_name} made an appointment request to you. \n\n"
+    #                               f"Reference Number: {uuid[-6:]}\n\n"
+    #                               f"Date of appointment: {formattedStartTime} - {formattedEndTime}\n\n"
+    #                               f"Concern: \n"
+    #                               f"{appointment.concern}\n\n"
+    #                               f"Please see the appointment information in the kiosk admin page.\n"
+    #                               f"Confirm the appointment in the admin page once you are okay with it. Confirmation is required to finalize the appointment.\n\n"
+    #                               f"Thank you!\n\n")
+
+    messageForProfessor.set_content(f"New appointment from {appointment.student_name}. Reference: {uuid[-6:]}\n\n")
+
+    # Create a more professional HTML version for the professor
+    html_content = f"""
+    <html>
+    <head>
+        <style>
+            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
+            .header {{ font-size: 18px; color: #003366; }}
+            .appointment-details {{ background-color: #f5f5f5; padding: 15px; margin: 15px 0; }}
+            .concern {{ background-color: #fffaf0; padding: 10px; border-left: 4px solid #e6c07b; }}
+            .footer {{ margin-top: 20px; font-size: 14px; color: #666; }}
+            a {{ bakground-color: transparent; }}  /* General links */
+            .button {{ 
+                background-color: #003366; 
+                color: white !important; /* Force transparent text */
+                padding: 10px 15px; 
+                text-decoration: none; 
+                border-radius: 4px; 
+                display: inline-block; 
+            }}
+        </style>
+    </head>
+    <body>
+        <p>Dear {professor.title} {professor.first_name} {professor.last_name},</p>
+        <p>Good day!</p>
+        <p class="header">{appointment.student_name} has requested an appointment with you.</p>
         
-        # messageForProfessor.set_content(f"Dear {f"{professor.title} {professor.first_name} {professor.last_name}"},\n\n"
-        #                               f"Good day!\n\n"
-        #                               f"{appointment.student_name} made an appointment request to you. \n\n"
-        #                               f"Reference Number: {uuid[-6:]}\n\n"
-        #                               f"Date of appointment: {formattedStartTime} - {formattedEndTime}\n\n"
-        #                               f"Concern: \n"
-        #                               f"{appointment.concern}\n\n"
-        #                               f"Please see the appointment information in the kiosk admin page.\n"
-        #                               f"Confirm the appointment in the admin page once you are okay with it. Confirmation is required to finalize the appointment.\n\n"
-        #                               f"Thank you!\n\n")
-
-        messageForProfessor.set_content(f"New appointment from {appointment.student_name}. Reference: {uuid[-6:]}\n\n")
-
-        # Create a more professional HTML version for the professor
-        html_content = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .header {{ font-size: 18px; color: #003366; }}
-                .appointment-details {{ background-color: #f5f5f5; padding: 15px; margin: 15px 0; }}
-                .concern {{ background-color: #fffaf0; padding: 10px; border-left: 4px solid #e6c07b; }}
-                .footer {{ margin-top: 20px; font-size: 14px; color: #666; }}
-                a {{ bakground-color: transparent; }}  /* General links */
-                .button {{ 
-                    background-color: #003366; 
-                    color: white !important; /* Force transparent text */
-                    padding: 10px 15px; 
-                    text-decoration: none; 
-                    border-radius: 4px; 
-                    display: inline-block; 
-                }}
-            </style>
-        </head>
-        <body>
-            <p>Dear {professor.title} {professor.first_name} {professor.last_name},</p>
-            <p>Good day!</p>
-            <p class="header">{appointment.student_name} has requested an appointment with you.</p>
-            
-            <div class="appointment-details">
-                <p><strong>Reference Number:</strong> {uuid[-6:]}</p>
-                <p><strong>Date and Time:</strong> {formattedStartTime} - {formattedEndTime}</p>
-                <p><strong>Student Email:</strong> <a href="mailto:{appointment.student_email}">{appointment.student_email}</a></p>
-            </div>
-            
-            <p><strong>Student's Concern:</strong></p>
-            <div class="concern">
-                <p>{appointment.concern}</p>
-            </div>
-            
-            <p>Please review this request and <a href="http://192.168.247.203/login" class="button">Manage Appointment</a></p>
-            
-            <div class="footer">
-                <p>Thank you for using the RTU Kiosk Appointment System.</p>
-            </div>
-        </body>
-        </html>
-        """
-        messageForProfessor.add_alternative(html_content, subtype='html')
-
-
-        messageForStudent["To"] = appointment.student_email
-        messageForStudent["From"] = "2021-101043@rtu.edu.ph"
-        messageForStudent["Subject"] = "Your Appointment has been created"
-
-        messageForProfessor["To"] = professor.email
-        messageForProfessor["From"] = "2021-101043@rtu.edu.ph"
-        messageForProfessor["Subject"] = f"{appointment.student_name} has created an appointment"
-
-        # Encode and send message
-        encoded_student_message = base64.urlsafe_b64encode(messageForStudent.as_bytes()).decode()
-        encoded_professor_message = base64.urlsafe_b64encode(messageForProfessor.as_bytes()).decode()
-        part2 = MIMEText(messageForStudent.as_string(), 'html')
-        create_message_for_student = {"raw": encoded_student_message}
-        create_message_for_professor = {"raw": encoded_professor_message}
-
-        send_message_for_student = (
-            service.users()
-            .messages()
-            .send(userId="me", body=create_message_for_student)
-            .execute()
-        )
+        <div class="appointment-details">
+            <p><strong>Reference Number:</strong> {uuid[-6:]}</p>
+            <p><strong>Date and Time:</strong> {formattedStartTime} - {formattedEndTime}</p>
+            <p><strong>Student Email:</strong> <a href="mailto:{appointment.student_email}">{appointment.student_email}</a></p>
+        </div>
+        
+        <p><strong>Student's Concern:</strong></p>
+        <div class="concern">
+            <p>{appointment.concern}</p>
+        </div>
         
-        service.users()\
-            .messages()\
-            .send(userId="me", body=create_message_for_professor)\
-            .execute()
-
-        return {'message': 'Appointment created successfully', 'reference': uuid[-6:], "message_id": send_message_for_student["id"], "status": "sent"}
-    except HttpError as error:
-        raise HTTPException(status_code=500, detail=str(error))
+        <p>Please review this request and <a href="http://192.168.247.203/login" class="button">Manage Appointment</a></p>
+        
+        <div class="footer">
+            <p>Thank you for using the RTU Kiosk Appointment System.</p>
+        </div>
+    </body>
+    </html>
+    """
+    messageForProfessor.add_alternative(html_content, subtype='html')
+
+
+    messageForStudent["To"] = appointment.student_email
+    messageForStudent["From"] = "2021-101043@rtu.edu.ph"
+    messageForStudent["Subject"] = "Your Appointment has been created"
+
+    messageForProfessor["To"] = professor.email
+    messageForProfessor["From"] = "2021-101043@rtu.edu.ph"
+    messageForProfessor["Subject"] = f"{appointment.student_name} has created an appointment"
+
+    # Queued in the same transaction as the appointment; the outbox workers
+    # send them, so a slow or failing Gmail no longer affects this request
+    enqueue_email(db, messageForStudent, "appointment_created_student")
+    enqueue_email(db, messageForProfessor, "appointment_created_professor")
+    db.commit()
+    notify_outbox()
+
+    return {'message': 'Appointment created successfully', 'reference': uuid[-6:], "status": "queued"}
     
 
 @router.get('/get-appointments', response_model=List[AppointmentResponseForTable])
@@ -256,16 +243,23 @@ async def get_appointment(db: Session = Depends(get_db), current_user: UserBase
 
 
 @router.get('/get-appointment-by-reference/{appointment_reference}', response_model=AppointmentResponse)
-async def get_appointment_by_reference(appointment_reference: str, db: Session = Depends(get_db)):
+async def get_appointment_by_reference(appointment_reference: str, db: async_db_dependency):
     """Get a appointment information depending on the reference provided by the user"""
-    query = db.query(Appointment).filter(cast(Appointment.uuid, String).like(f"%{appointment_reference}")).first()
-    if query is None:
+    # Fetch the appointment and its professor in a single round trip
+    result = await db.execute(
+        select(Appointment,
+               ProfessorInformation.first_name,
+               ProfessorInformation.last_name,
+               ProfessorInformation.title)
+        .join(ProfessorInformation, ProfessorInformation.professor_id == Appointment.professor_uuid)
+        .filter(cast(Appointment.uuid, String).like(f"%{appointment_reference}"))
+        .limit(1)
+    )
+    row = result.first()
+    if row is None:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
-    professor = db.query(ProfessorInformation.first_name, 
-                         ProfessorInformation.last_name, 
-                         ProfessorInformation.title)\
-                    .filter(ProfessorInformation.professor_id == query.professor_uuid).first()
+    query, professor = row.Appointment, row
     
     professor_name = f"{professor.title} {professor.first_name} {professor.last_name}"
     return AppointmentResponse(id=query.id, uuid=str(query.uuid), student_name=query.student_name, student_id=query.student_id, student_email=query.student_email, professor_name=professor_name, start_time=format_iso_date(query.start_time), end_time=format_iso_date(query.end_time), status=query.status)
@@ -274,6 +268,9 @@ async def get_appointment_by_reference(appointment_reference: str, db: Session =
 async def action_appointment(appointment_reference: str, action: AppointmentUpdate, db: Session = Depends(get_db), current_user: UserBase = Depends(read_users_me)):
     """Accept or reject an appointment"""
     appointment = db.query(Appointment).filter(Appointment.uuid == appointment_reference).first()
+    if appointment is None:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+
     professor = db.query(ProfessorInformation.title,
                          ProfessorInformation.first_name,
                          ProfessorInformation.last_name
@@ -291,20 +288,17 @@ async def action_appointment(appointment_reference: str, action: AppointmentUpda
 
     }
 
-    if appointment is None:
-        raise HTTPException(status_code=404, detail="Appointment not found")
-    
     if action.status == 'accept':
         appointment.status = 'Accepted'
-        await send_email(action.status, appointment_details)
     elif action.status == 'reject':
         appointment.status = 'Rejected'
-        await send_email(action.status, appointment_details)
     else:
         raise HTTPException(status_code=400, detail="Invalid action")
+    queue_status_email(db, action.status, appointment_details)
 
     db.commit()
     db.refresh(appointment)
+    notify_outbox()
     
     return {'message': f'Appointment {action}ed successfully', 'status': appointment.status}
 
@@ -341,85 +335,70 @@ async def get_professor_appointments(professor_id: str, date: str, db: Session =
 @router.get('/check-email')
 async def check_email(db: Session = Depends(get_db), 
                                current_user: UserBase = Depends(get_current_user)):
-    return await check_professor_email_replies(db)
+    return await check_email_replies(db)
 
-async def send_email(status: str, appointment_details: dict):
-    """Send email to the user"""
-    try:
-        service = get_gmail_service()
-        confirmationEmail = EmailMessage()
+def queue_status_email(db: Session, status: str, appointment_details: dict):
+    """Queue the appointment status email to the student in the outbox. The caller commits."""
+    confirmationEmail = EmailMessage()
 
-        if status == "accept":
-            # Acceptance email template
+    if status == "accept":
+        # Acceptance email template
+    
+        confirmationEmail.set_content(f"Dear {appointment_details['student_name']},\n\n"
+                                      f"Good day!\n"
+                                      f"We're pleased to inform you that {appointment_details["professor_name"]} has accepted your appointment request.\n\n"
+                                      f"Appointment Details:\n"
+                                      f"- Date: {appointment_details['date']}\n"
+                                      f"- Time: {appointment_details['start_time']} to {appointment_details['end_time']}\n"
+                                      f"- Reference Number: {appointment_details['uuid']}\n\n"
+                                      f"Please arrive 5 minutes before your scheduled time. If you need to reschedule or cancel, please do so at least 24 hours in advance.\n\n"
+                                      f"Thank you for using our appointment system.\n\n"
+                                      f"Best regards,\n"
+                                      f"RTU Kiosk Appointment System")
+        confirmationEmail["Subject"] = "Appointment Accepted - Reference #" + appointment_details['uuid']
         
-            confirmationEmail.set_content(f"Dear {appointment_details['student_name']},\n\n"
-                                          f"Good day!\n"
-                                          f"We're pleased to inform you that {appointment_details["professor_name"]} has accepted your appointment request.\n\n"
-                                          f"Appointment Details:\n"
-                                          f"- Date: {appointment_details['date']}\n"
-                                          f"- Time: {appointment_details['start_time']} to {appointment_details['end_time']}\n"
-                                          f"- Reference Number: {appointment_details['uuid']}\n\n"
-                                          f"Please arrive 5 minutes before your scheduled time. If you need to reschedule or cancel, please do so at least 24 hours in advance.\n\n"
-                                          f"Thank you for using our appointment system.\n\n"
-                                          f"Best regards,\n"
-                                          f"RTU Kiosk Appointment System")
-            confirmationEmail["Subject"] = "Appointment Accepted - Reference #" + appointment_details['uuid']
-            
-        elif status == "reject":
-            # Rejection email template
-            confirmationEmail.set_content(f"Dear {appointment_details['student_name']},\n\n"
-                                        f"Good day!\n"
-                                        f"We regret to inform you that {appointment_details["professor_name"]} is unable to accommodate your appointment request at the requested time.\n\n"
-                                        f"Your Reference Number: {appointment_details['uuid']}\n\n"
-                                        f"This could be due to scheduling conflicts or prior commitments. You are welcome to schedule a new appointment at a different time that might better fit the professor's schedule.\n\n"
-                                        f"If you have any urgent matters to discuss, you may email the professor directly or visit during their regular office hours.\n\n"
-                                        f"Thank you for your understanding.\n\n"
-                                        f"Best regards,\n"
-                                        f"RTU Kiosk Appointment System")
-            confirmationEmail["Subject"] = "Appointment Request Update - Reference #" + appointment_details['uuid']
-
-        elif status == "auto_reject":
-            # Auto-rejection email template
-            confirmationEmail.set_content(f"Dear {appointment_details['student_name']},\n\n"
-                                        f"Good day!\n"
-                                        f"We regret to inform you that your appointment request with {appointment_details['professor_name']} has been automatically rejected due to no response after 3 days.\n\n"
-                                        f"Your Reference Number: {appointment_details['uuid']}\n\n"
-                                        f"The professor may be unavailable or experiencing high request volumes. You are welcome to schedule a new appointment at a different time.\n\n"
-                                        f"If you have any urgent matters to discuss, you may email the professor directly or visit during their regular office hours.\n\n"
-                                        f"Thank you for your understanding.\n\n"
-                                        f"Best regards,\n"
-                                        f"RTU Kiosk Appointment System")
-            confirmationEmail["Subject"] = "Appointment Auto-Rejected - Reference #" + appointment_details['uuid']
-
-        elif status == "reschedule":
-            confirmationEmail.set_content(f"Dear {appointment_details['student_name']},\n\n"
+    elif status == "reject":
+        # Rejection email template
+        confirmationEmail.set_content(f"Dear {appointment_details['student_name']},\n\n"
                                     f"Good day!\n"
-                                    f"{appointment_details['professor_name']} has suggested a different time for your appointment request.\n\n"
+                                    f"We regret to inform you that {appointment_details["professor_name"]} is unable to accommodate your appointment request at the requested time.\n\n"
                                     f"Your Reference Number: {appointment_details['uuid']}\n\n"
-                                    f"The professor suggested: {appointment_details['suggested_date']} {appointment_details['suggested_start_time']} - {appointment_details['suggested_end_time']}\n\n"
-                                    f"Please reply to this email to confirm or reject this suggested time.\n\n"
+                                    f"This could be due to scheduling conflicts or prior commitments. You are welcome to schedule a new appointment at a different time that might better fit the professor's schedule.\n\n"
+                                    f"If you have any urgent matters to discuss, you may email the professor directly or visit during their regular office hours.\n\n"
                                     f"Thank you for your understanding.\n\n"
                                     f"Best regards,\n"
                                     f"RTU Kiosk Appointment System")
-            confirmationEmail["Subject"] = "Appointment Reschedule Suggestion - Reference #" + appointment_details['uuid']
-            
-        confirmationEmail["To"] = appointment_details['student_email']
-        confirmationEmail["From"] = "2021-101043@rtu.edu.ph"
-        
-        # Encode and send message
-        encoded_message = base64.urlsafe_b64encode(confirmationEmail.as_bytes()).decode()
-        create_message = {"raw": encoded_message}
-        
-        send_message = (
-            service.users()
-            .messages()
-            .send(userId="me", body=create_message)
-            .execute()
-        )
+        confirmationEmail["Subject"] = "Appointment Request Update - Reference #" + appointment_details['uuid']
+
+    elif status == "auto_reject":
+        # Auto-rejection email template
+        confirmationEmail.set_content(f"Dear {appointment_details['student_name']},\n\n"
+                                    f"Good day!\n"
+                                    f"We regret to inform you that your appointment request with {appointment_details['professor_name']} has been automatically rejected due to no response after 3 days.\n\n"
+                                    f"Your Reference Number: {appointment_details['uuid']}\n\n"
+                                    f"The professor may be unavailable or experiencing high request volumes. You are welcome to schedule a new appointment at a different time.\n\n"
+                                    f"If you have any urgent matters to discuss, you may email the professor directly or visit during their regular office hours.\n\n"
+                                    f"Thank you for your understanding.\n\n"
+                                    f"Best regards,\n"
+                                    f"RTU Kiosk Appointment System")
+        confirmationEmail["Subject"] = "Appointment Auto-Rejected - Reference #" + appointment_details['uuid']
+
+    elif status == "reschedule":
+        confirmationEmail.set_content(f"Dear {appointment_details['student_name']},\n\n"
+                                f"Good day!\n"
+                                f"{appointment_details['professor_name']} has suggested a different time for your appointment request.\n\n"
+                                f"Your Reference Number: {appointment_details['uuid']}\n\n"
+                                f"The professor suggested: {appointment_details['suggested_date']} {appointment_details['suggested_start_time']} - {appointment_details['suggested_end_time']}\n\n"
+                                f"Please reply to this email to confirm or reject this suggested time.\n\n"
+                                f"Thank you for your understanding.\n\n"
+                                f"Best regards,\n"
+                                f"RTU Kiosk Appointment System")
+        confirmationEmail["Subject"] = "Appointment Reschedule Suggestion - Reference #" + appointment_details['uuid']
         
-        return {"message": send_message["id"], "status": status}
-    except HttpError as error:
-        raise HTTPException(status_code=500, detail=str(error))
+    confirmationEmail["To"] = appointment_details['student_email']
+    confirmationEmail["From"] = "2021-101043@rtu.edu.ph"
+    
+    return enqueue_email(db, confirmationEmail, f"appointment_{status}")
 
 async def auto_reject_old_appointments(db: Session):
     """
@@ -453,336 +432,355 @@ async def auto_reject_old_appointments(db: Session):
                 "end_time": format_iso_date(appointment.end_time).split(' ')[1],
             }
             
-            # Update appointment status
+            # Update appointment status and queue the notification with it
             appointment.status = "Rejected"
-            db.commit()
-            
-            # Send email notification
-            await send_email("auto_reject", appointment_details)
+            queue_status_email(db, "auto_reject", appointment_details)
             processed_count += 1
-            
+
+        db.commit()
+        if processed_count:
+            notify_outbox()
         logging.info(f"Auto-rejected {processed_count} appointments older than 3 days")
         return {"message": f"Auto-rejected {processed_count} old appointments"}
     except Exception as e:
         logging.error(f"Error in auto-rejecting appointments: {e}")
         raise HTTPException(status_code=500, detail=f"Error auto-rejecting appointments: {str(e)}")
 
-async def check_professor_email_replies(db: Session = Depends(get_db)):
+# Threads the reply poller acts on, by the subject of the email that started them
+PROFESSOR_REPLY_SUBJECT = "has created an appointment"
+STUDENT_REPLY_SUBJECT = "Appointment Reschedule Suggestion"
+# Gmail history checkpoint of the reply poller
+REPLY_SYNC_NAME = "appointment_replies"
+# Threads fetched from Gmail at once, and threads applied per transaction
+REPLY_FETCH_WORKERS = int(os.getenv("GMAIL_REPLY_WORKERS", "8"))
+REPLY_BATCH_SIZE = int(os.getenv("GMAIL_REPLY_BATCH_SIZE", "100"))
+# Outcomes of a reply that changed its appointment
+REPLY_ACTIONS = ("accept", "reject", "reschedule")
+
+async def check_email_replies(db: Session):
     """
-    Check for professor email replies to appointment requests
-    and update appointment status accordingly
+    Check for professor replies to appointment requests and student replies
+    to reschedule suggestions, and update the appointments accordingly
     """
-    max_retries = 3
-    retry_delay = 2  # Initial delay in seconds
-    for attempt in range(max_retries):
-        try:
-            service = get_gmail_service()
-            
-            # Search for emails with subject containing "has created an appointment"
-            # and that have replies
-            results = service.users().messages().list(
-                userId='me',
-                q='subject:"has created an appointment" is:unread',
-                maxResults=10  # Limit number of results to avoid timeouts
-            ).execute()
-            
-            messages = results.get('messages', [])
-            processed = 0
-
-            for message_info in messages:
+    # Throttled and failed Gmail calls are already retried by gmail_client
+    try:
+        return await sync_email_replies(db)
+    except (GmailError, TimeoutError) as error:
+        db.rollback()
+        logger.error(f"Error checking email replies: {str(error)}")
+        raise HTTPException(status_code=500, detail=f"Error checking email replies: {str(error)}")
 
-                if processed > 0:
-                    await asyncio.sleep(1)  # Avoid hitting API limits
-                message_id = message_info['id']
+async def sync_email_replies(db: Session):
+    """
+    One pass of the reply poller. Only mailbox changes since the stored
+    Gmail history checkpoint are read, so the API calls per pass follow the
+    new mail, not the mailbox size.
+
+    Changed threads are handled REPLY_BATCH_SIZE at a time: fetched
+    REPLY_FETCH_WORKERS at once within the Gmail quota, classified as each
+    arrives, then applied to their appointments in one transaction that
+    also records the replies as processed. A reply is therefore acted on
+    once, even if a pass fails before saving the checkpoint and the next
+    pass reads the same changes. Threads that could not be fetched for a
+    transient reason hold the checkpoint back, so they are tried again next
+    pass; threads Gmail no longer has, or refuses outright, are skipped.
+    """
+    messages, history_id = await changed_messages(
+        db, REPLY_SYNC_NAME, [f'subject:"{PROFESSOR_REPLY_SUBJECT}"', f'subject:"{STUDENT_REPLY_SUBJECT}"'])
+
+    threads = {}
+    for message in messages:
+        # A thread's id is its first message's id, and a first message is not a reply
+        if message['id'] != message['threadId']:
+            threads.setdefault(message['threadId'], []).append(message['id'])
+    thread_ids = list(threads)
+
+    outcomes = {}
+    acted_on = []
+    failed = 0
+    skipped = 0
+    for start in range(0, len(thread_ids), REPLY_BATCH_SIZE):
+        replies = []
+        for thread_id, reply in zip(thread_ids[start:start + REPLY_BATCH_SIZE],
+                                    await fetch_replies(thread_ids[start:start + REPLY_BATCH_SIZE])):
+            if isinstance(reply, GmailError) and reply.permanent:
+                # e.g. deleted between history.list and threads.get; retrying
+                # would only hold the checkpoint back until the history expires
+                logger.warning(f"Skipping thread {thread_id}: {reply}")
+                skipped += 1
+            elif isinstance(reply, GmailError):
+                logger.warning(f"Could not fetch thread {thread_id}: {reply}")
+                failed += 1
+            elif reply is not None:
+                reply["message_ids"] = threads[thread_id]
+                replies.append(reply)
+        if not replies:
+            continue
+
+        for reply, outcome in zip(replies, apply_replies(db, replies)):
+            if outcome is None:
+                continue   # another worker handled it first
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            if outcome in REPLY_ACTIONS:
+                acted_on.extend(reply["message_ids"])
+        notify_outbox()
+
+    if acted_on:
+        # Mark the emails as processed by marking them as read, 1000 per call at most
+        for start in range(0, len(acted_on), 1000):
+            await gmail_client.batch_modify_messages(acted_on[start:start + 1000], remove_label_ids=['UNREAD'])
+    if not failed:
+        save_checkpoint(db, REPLY_SYNC_NAME, history_id)
+    prune_processed(db)
+    db.commit()
+    return {"message": "Email replies checked successfully", "threads": len(threads), "failed": failed,
+            "skipped": skipped, "outcomes": outcomes}
 
-                try:
-                    message = service.users().messages().get(userId='me', id=message_id, format='full').execute()
-                    
-                    # Get the thread to check for replies
-                    thread_id = message['threadId']
-                    thread = service.users().threads().get(userId='me', id=thread_id).execute()
-                
-                    # Skip if there's only one message in the thread (no replies)
-                    if len(thread['messages']) <= 1:
-                        continue
-                    
-                    # Process the thread to find professor's response
-                    original_message = thread['messages'][0]
-                    reply_message = thread['messages'][-1]  # Get the latest message in the thread
-                    
-                    # Extract the student name from the original email subject
-                    subject = get_header_value(original_message['payload']['headers'], 'Subject')
-                    student_name = subject.split(' has created an appointment')[0] if subject else ""
-                    
-                    # Extract reply content
-                    reply_content = get_message_body(reply_message)
-                    clean_content = clean_reply_content(reply_content)
-                    # Look for appointment reference number in the thread
-                    ref_number = extract_reference_number(original_message)
-                    
-                    if not ref_number:
-                        continue
-                        
-                    # Check if reply contains accept/approve or reject/decline
-                    status = None
-
-                    status = determine_intent(clean_content)
-                    # logging.info(f"Email intent determined: {status} for reply: {reply_content[:50]}...")
-
-                    if status:
-                        # Find the appointment in the database using the reference number
-                        appointment = db.query(Appointment).filter(
-                            cast(Appointment.uuid, String).like(f"%{ref_number}")
-                        ).first()
-                        
-                        if appointment:
-                            # Update the appointment status
-                            professor = db.query(ProfessorInformation).filter(
-                                ProfessorInformation.professor_id == appointment.professor_uuid
-                            ).first()
-                            
-                            appointment_details = {
-                                "student_name": appointment.student_name,
-                                "student_email": appointment.student_email,
-                                "professor_name": f"{professor.title} {professor.first_name} {professor.last_name}",
-                                "uuid": str(appointment.uuid)[-6:],
-                                "date": format_iso_date(appointment.start_time).split(' ')[0],
-                                "start_time": format_iso_date(appointment.start_time).split(' ')[1],
-                                "end_time": format_iso_date(appointment.end_time).split(' ')[1],
-                            }
-                            
-                            # Update status and send confirmation email
-                            status_map = {
-                                "accept": "Accepted",
-                                "reject": "Rejected",
-                                "reschedule": "Rescheduled - Pending"
-                            }
-
-                            if status == "reschedule":
-                                # Extract the suggested date and time
-                                suggested_date, suggested_start_time, suggested_end_time = extract_datetime_from_text(reply_content)
-                                
-                                if suggested_date and suggested_start_time:
-                                    # Store the suggested date/time in the appointment details
-                                    appointment_details["suggested_date"] = suggested_date
-                                    appointment_details["suggested_start_time"] = suggested_start_time
-                                    appointment_details["suggested_end_time"] = suggested_end_time if suggested_end_time else "not specified"
-                                    
-                                    # If your Appointment model has these fields, update them:
-                                    # (You'll need to add these columns to your database model)
-                                    standard_date = standardize_date_format(suggested_date)
-                                    standard_start_time = standardize_time_format(suggested_start_time)
-                                    standard_end_time = standardize_time_format(suggested_end_time)
-
-                                    formattedStartTime = convert_time_format(f"{standard_date} {standard_start_time}")
-                                    formattedEndTime = convert_time_format(f"{standard_date} {standard_end_time}")
-
-                                    logging.info(f"suggested start time: {formattedStartTime}")
-                                    logging.info(f"suggested end time: {formattedEndTime}")
-                                    appointment.suggested_start_time = formattedStartTime
-                                    appointment.suggested_end_time = formattedEndTime
-                                    
-                                    # Add the professor's message for context
-                                    appointment_details["professor_message"] = reply_content
-                                    
-                                # Update the appointment status
-                                try: 
-                                    await send_email(status, appointment_details)
-                                    appointment.status = status_map.get(status)
-                                    db.commit()
-
-                                except Exception as e:
-                                    logging.error(e)
-                                
-
-                            
-                            appointment.status = status_map.get(status)
-                            db.commit()
-                            
-                            await send_email(status, appointment_details)
-                            
-                            # Mark the email as processed by marking as read and/or archiving
-                            service.users().messages().modify(
-                                userId='me',
-                                id=message_id,
-                                body={'removeLabelIds': ['UNREAD']}
-                            ).execute()
-
-                            processed += 1
-                except HttpError as e:
-                    logging.error(f"Error processing message {message_id}: {str(e)}")
-
-            return {"message": "Email replies checked successfully"}
-        except (HttpError, TimeoutError) as error:
-            if attempt < max_retries - 1:
-                wait_time = retry_delay * (2 ** attempt)  # Exponential backoff
-                logger.warning(f"Request failed, retrying in {wait_time}s: {str(error)}")
-                await asyncio.sleep(wait_time)
-            else:
-                logger.error(f"Error checking email replies after {max_retries} attempts: {str(error)}")
-                raise HTTPException(status_code=500, detail=f"Error checking email replies: {str(error)}")
-
-async def check_student_reschedule_replies(db: Session = Depends(get_db)):
+async def fetch_replies(thread_ids: list) -> list:
     """
-    Check for student replies to appointment reschedule suggestions
-    and update appointment status accordingly
+    The classified reply (see classify_reply) of each thread, in order, or
+    None for threads the poller doesn't act on, or the GmailError that
+    kept a thread from being fetched.
     """
-    max_retries = 3
-    retry_delay = 2  # Initial delay in seconds
-    
-    for attempt in range(max_retries):
+    semaphore = asyncio.Semaphore(REPLY_FETCH_WORKERS)
+
+    async def fetch(thread_id):
+        async with semaphore:
+            try:
+                thread = await gmail_client.get_thread(thread_id)
+            except GmailError as e:
+                return e
         try:
-            service = get_gmail_service()
-            
-            # Search for emails with subject containing "Appointment Reschedule Suggestion"
-            results = service.users().messages().list(
-                userId='me',
-                q='subject:"Appointment Reschedule Suggestion" is:unread',
-                maxResults=10
-            ).execute()
-            
-            messages = results.get('messages', [])
-            processed = 0
-
-            for message_info in messages:
-                if processed > 0:
-                    await asyncio.sleep(1)  # Avoid hitting API limits
-                    
-                message_id = message_info['id']
-                
-                try:
-                    # Get the thread to check for replies
-                    thread = service.users().threads().get(userId='me', id=message_info['threadId']).execute()
-                    
-                    # Skip if there's only one message in the thread (no replies)
-                    if len(thread['messages']) <= 1:
-                        continue
-                    
-                    # Get the original message and the reply
-                    original_message = thread['messages'][0]
-                    reply_message = thread['messages'][-1]
-                    
-                    # Extract reply content
-                    reply_content = get_message_body(reply_message)
-                    clean_content = clean_reply_content(reply_content)
-
-                    # Extract reference number from original message
-                    ref_number = extract_reference_number(original_message)
-                    
-                    if not ref_number:
-                        continue
-                        
-                    # Determine if student accepted or rejected the reschedule
-                    status = None
-                    status = determine_intent(clean_content)
-                    logging.info(f"Email intent determined: {status}, reply_content: {reply_content}")
-                    if status:
-                        # Find the appointment in database
-                        appointment = db.query(Appointment).filter(
-                            cast(Appointment.uuid, String).like(f"%{ref_number}")
-                        ).first()
-                        
-                        professor = db.query(ProfessorInformation).filter(ProfessorInformation.professor_id == appointment.professor_uuid).first()
-                        if appointment and appointment.status == "Rescheduled - Pending":
-                            # Update the appointment based on student response
-                            appointment_details = {
-                                "professor_name": f"{professor.title} {professor.first_name} {professor.last_name}",
-                                "student_name": appointment.student_name,
-                                "professor_email": professor.email,
-                                "reference_number": ref_number,
-                                "appointment_start_time": format_iso_date(appointment.start_time).split(' ')[1],
-                                "appointment_end_time": format_iso_date(appointment.end_time).split(' ')[1],
-                                "date": appointment.start_time.date(),
-                            }   
-
-                            if status == "accept":
-                                # Update the appointment with the suggested times
-                                appointment.start_time = appointment.suggested_start_time
-                                appointment.end_time = appointment.suggested_end_time
-                                appointment.status = "Accepted"
-                                await sendEmailReschedule(status, appointment_details)
-                                logging.info("Accepting Rescheduled Appointment")
-                            else:  # reject
-                                appointment.status = "Rejected"
-                                await sendEmailReschedule(status, appointment_details)
-                                logging.info("Rejecting Rescheduled Appointment")
-                                
-                            # Clear the suggested times
-                            appointment.suggested_start_time = None
-                            appointment.suggested_end_time = None
-                            
-                            db.commit()
-                            
-                            # Mark the email as processed
-                            service.users().messages().modify(
-                                userId='me',
-                                id=message_id,
-                                body={'removeLabelIds': ['UNREAD']}
-                            ).execute()
-                            
-                            processed += 1
-                
-                except HttpError as e:
-                    logging.error(f"Error processing message {message_id}: {str(e)}")
-            
-            return {"message": f"Processed {processed} student replies"}
-            
-        except (HttpError, TimeoutError) as error:
-            if attempt < max_retries - 1:
-                wait_time = retry_delay * (2 ** attempt)
-                logger.warning(f"Request failed, retrying in {wait_time}s: {str(error)}")
-                await asyncio.sleep(wait_time)
-            else:
-                logger.error(f"Error checking student replies after {max_retries} attempts: {str(error)}")
-                raise HTTPException(status_code=500, detail=f"Error checking student replies: {str(error)}")
+            return classify_reply(thread)
+        except Exception as e:
+            logging.exception(f"Error classifying reply in thread {thread_id}")
+            return {"kind": "unknown", "thread_id": thread_id, "error": str(e)}
 
+    return await asyncio.gather(*(fetch(thread_id) for thread_id in thread_ids))
 
-async def sendEmailReschedule(status: str, appointment_details: dict):
+def classify_reply(thread: dict):
+    """
+    What the latest reply in a thread asks for, read from the thread alone:
+    which kind of reply it is, the appointment reference, the intent, and
+    for a reschedule the suggested time. None if the thread is not one the
+    poller acts on.
+    """
+    # Skip if there's only one message in the thread (no replies)
+    if len(thread['messages']) <= 1:
+        return None
+    original_message = thread['messages'][0]
+    reply_message = thread['messages'][-1]  # Get the latest message in the thread
+
+    subject = get_header_value(original_message['payload']['headers'], 'Subject') or ""
+    if PROFESSOR_REPLY_SUBJECT in subject:
+        kind = "professor_reply"
+    elif STUDENT_REPLY_SUBJECT in subject:
+        kind = "student_reply"
+    else:
+        return None
+
+    # Extract reply content
+    reply_content = get_message_body(reply_message)
+    clean_content = clean_reply_content(reply_content)
+    reply = {"kind": kind, "thread_id": thread['id'], "content": reply_content, "intent": None, "suggested": None,
+             # Look for appointment reference number in the thread
+             "reference": extract_reference_number(original_message)}
+    if not reply["reference"]:
+        return reply
+
+    # Check if reply contains accept/approve or reject/decline
+    reply["intent"] = determine_intent(clean_content)
+    if kind == "professor_reply" and reply["intent"] == "reschedule":
+        # Extract the suggested date and time
+        suggested_date, suggested_start_time, suggested_end_time = extract_datetime_from_text(reply_content)
+        if suggested_date and suggested_start_time:
+            standard_date = standardize_date_format(suggested_date)
+            standard_start_time = standardize_time_format(suggested_start_time)
+            standard_end_time = standardize_time_format(suggested_end_time)
+            reply["suggested"] = {
+                "date": suggested_date,
+                "start_time": suggested_start_time,
+                "end_time": suggested_end_time if suggested_end_time else "not specified",
+                "start": convert_time_format(f"{standard_date} {standard_start_time}"),
+                "end": convert_time_format(f"{standard_date} {standard_end_time}"),
+            }
+    return reply
+
+def load_reply_appointments(db: Session, references: set) -> dict:
+    """The appointments with these 6-character references, with their professors, in one query"""
+    if not references:
+        return {}
+    reference = func.right(cast(Appointment.uuid, String), 6)
+    appointments = db.query(Appointment).options(selectinload(Appointment.professor)).filter(
+        reference.in_(references)
+    ).all()
+    return {str(appointment.uuid)[-6:]: appointment for appointment in appointments}
+
+def apply_replies(db: Session, replies: list) -> list:
+    """
+    Apply classified replies, in mailbox order, in one transaction with
+    their processed records. Returns each reply's outcome, or None for one
+    another worker already handled. If the batch fails, its replies are
+    applied one transaction each instead, so one bad reply can't hold
+    back the others.
+    """
     try:
-        service = get_gmail_service()
-        confirmationEmail = EmailMessage()
+        appointments = load_reply_appointments(db, {reply["reference"] for reply in replies if reply.get("reference")})
+        outcomes = []
+        for reply in replies:
+            outcome = apply_reply(db, reply, appointments.get(reply.get("reference")))
+            record_processed(db, reply["message_ids"], reply["thread_id"], reply["kind"], outcome)
+            outcomes.append(outcome)
+        db.commit()
+        return outcomes
+    except Exception as e:
+        db.rollback()
+        if len(replies) == 1:
+            return [apply_reply_alone(db, replies[0])]
+        logging.warning(f"Applying {len(replies)} replies together failed, applying them one at a time: {e}")
+        return [apply_reply_alone(db, reply) for reply in replies]
 
-        if status == "accept":
-            # Acceptance email template
-        
-            confirmationEmail.set_content(f"Dear {appointment_details['professor_name']},\n\n"
-                                          f"Good day!\n"
-                                          f"We're pleased to inform you that {appointment_details["student_name"]} has accepted your suggested date of appointment.\n\n"
-                                          f"Appointment Details:\n"
-                                          f"- Date: {appointment_details['date']}\n"
-                                          f"- Time: {appointment_details['appointment_start_time']} to {appointment_details['appointment_end_time']}\n"
-                                          f"- Reference Number: {appointment_details['reference_number']}\n\n"
-                                          f"Best regards,\n"
-                                          f"RTU Kiosk Appointment System")
-            confirmationEmail["Subject"] = "Appointment Reschedule Accepted - Reference #" + appointment_details['reference_number']
-            
-        elif status == "reject":
-            # Rejection email template
-            confirmationEmail.set_content(f"Dear {appointment_details['professor_name']},\n\n"
-                                        f"Good day!\n"
-                                        f"We regret to inform you that {appointment_details["student_name"]} is unable to accommodate your appointment reschedule request at your suggested time.\n\n"
-                                        f"Reference Number: {appointment_details['reference_number']}\n\n"
-                                        f"Thank you for your understanding.\n\n"
-                                        f"Best regards,\n"
-                                        f"RTU Kiosk Appointment System")
-            confirmationEmail["Subject"] = "Appointment Reschedule Update - Reference #" + appointment_details['reference_number']
-        
-        confirmationEmail["To"] = appointment_details['professor_email']
-        confirmationEmail["From"] = "2021-101043@rtu.edu.ph"
+def apply_reply_alone(db: Session, reply: dict):
+    try:
+        appointment = load_reply_appointments(db, {reply["reference"]} if reply.get("reference") else set())
+        outcome = apply_reply(db, reply, appointment.get(reply.get("reference")))
+        record_processed(db, reply["message_ids"], reply["thread_id"], reply["kind"], outcome)
+        db.commit()
+        return outcome
+    except IntegrityError:
+        db.rollback()   # another worker handled this reply first
+        return None
+    except Exception:
+        # Recorded as failed rather than retried every pass
+        db.rollback()
+        logging.exception(f"Error processing reply in thread {reply['thread_id']}")
+        record_processed(db, reply["message_ids"], reply["thread_id"], reply["kind"], "error")
+        db.commit()
+        return "error"
+
+def apply_reply(db: Session, reply: dict, appointment) -> str:
+    """Apply one classified reply to its appointment and queue the emails. Returns the outcome; the caller commits."""
+    if "error" in reply:
+        return "error"
+    if not reply["reference"]:
+        return "no_reference"
+    if not reply["intent"]:
+        return "no_intent"
+    if reply["kind"] == "professor_reply":
+        return apply_professor_reply(db, reply, appointment)
+    return apply_student_reschedule_reply(db, reply, appointment)
+
+def apply_professor_reply(db: Session, reply: dict, appointment) -> str:
+    if not appointment:
+        return "no_appointment"
+    status = reply["intent"]
+    professor = appointment.professor
 
-        encoded_message = base64.urlsafe_b64encode(confirmationEmail.as_bytes()).decode()
-        create_message = {"raw": encoded_message}
-        
-        send_message = (
-            service.users()
-            .messages()
-            .send(userId="me", body=create_message)
-            .execute()
-        )
+    appointment_details = {
+        "student_name": appointment.student_name,
+        "student_email": appointment.student_email,
+        "professor_name": f"{professor.title} {professor.first_name} {professor.last_name}",
+        "uuid": str(appointment.uuid)[-6:],
+        "date": format_iso_date(appointment.start_time).split(' ')[0],
+        "start_time": format_iso_date(appointment.start_time).split(' ')[1],
+        "end_time": format_iso_date(appointment.end_time).split(' ')[1],
+    }
+
+    # Update status and send confirmation email
+    status_map = {
+        "accept": "Accepted",
+        "reject": "Rejected",
+        "reschedule": "Rescheduled - Pending"
+    }
+
+    suggested = reply["suggested"]
+    if status == "reschedule" and suggested:
+        # Store the suggested date/time in the appointment details
+        appointment_details["suggested_date"] = suggested["date"]
+        appointment_details["suggested_start_time"] = suggested["start_time"]
+        appointment_details["suggested_end_time"] = suggested["end_time"]
+
+        logging.info(f"suggested start time: {suggested['start']}")
+        logging.info(f"suggested end time: {suggested['end']}")
+        appointment.suggested_start_time = suggested["start"]
+        appointment.suggested_end_time = suggested["end"]
+
+        # Add the professor's message for context
+        appointment_details["professor_message"] = reply["content"]
+
+    # Update status and queue the confirmation email with it
+    appointment.status = status_map.get(status)
+    queue_status_email(db, status, appointment_details)
+    return status
+
+def apply_student_reschedule_reply(db: Session, reply: dict, appointment) -> str:
+    status = reply["intent"]
+    logging.info(f"Email intent determined: {status}, reply_content: {reply['content']}")
+    if not appointment or appointment.status != "Rescheduled - Pending":
+        return "not_pending"
+
+    professor = appointment.professor
+    # Update the appointment based on student response
+    appointment_details = {
+        "professor_name": f"{professor.title} {professor.first_name} {professor.last_name}",
+        "student_name": appointment.student_name,
+        "professor_email": professor.email,
+        "reference_number": reply["reference"],
+        "appointment_start_time": format_iso_date(appointment.start_time).split(' ')[1],
+        "appointment_end_time": format_iso_date(appointment.end_time).split(' ')[1],
+        "date": appointment.start_time.date(),
+    }
+
+    if status == "accept":
+        # Update the appointment with the suggested times
+        appointment.start_time = appointment.suggested_start_time
+        appointment.end_time = appointment.suggested_end_time
+        appointment.status = "Accepted"
+        queue_reschedule_reply_email(db, status, appointment_details)
+        logging.info("Accepting Rescheduled Appointment")
+    else:  # reject
+        appointment.status = "Rejected"
+        queue_reschedule_reply_email(db, status, appointment_details)
+        logging.info("Rejecting Rescheduled Appointment")
+
+    # Clear the suggested times
+    appointment.suggested_start_time = None
+    appointment.suggested_end_time = None
+    return "accept" if status == "accept" else "reject"
+
+def queue_reschedule_reply_email(db: Session, status: str, appointment_details: dict):
+    """Queue the email telling the professor the student's answer to a reschedule. The caller commits."""
+    confirmationEmail = EmailMessage()
+
+    if status == "accept":
+        # Acceptance email template
+    
+        confirmationEmail.set_content(f"Dear {appointment_details['professor_name']},\n\n"
+                                      f"Good day!\n"
+                                      f"We're pleased to inform you that {appointment_details["student_name"]} has accepted your suggested date of appointment.\n\n"
+                                      f"Appointment Details:\n"
+                                      f"- Date: {appointment_details['date']}\n"
+                                      f"- Time: {appointment_details['appointment_start_time']} to {appointment_details['appointment_end_time']}\n"
+                                      f"- Reference Number: {appointment_details['reference_number']}\n\n"
+                                      f"Best regards,\n"
+                                      f"RTU Kiosk Appointment System")
+        confirmationEmail["Subject"] = "Appointment Reschedule Accepted - Reference #" + appointment_details['reference_number']
         
-        return {"message": send_message["id"], "status": status}
-    except HttpError as error:
-        raise HTTPException(status_code=500, detail=str(error))
+    elif status == "reject":
+        # Rejection email template
+        confirmationEmail.set_content(f"Dear {appointment_details['professor_name']},\n\n"
+                                    f"Good day!\n"
+                                    f"We regret to inform you that {appointment_details["student_name"]} is unable to accommodate your appointment reschedule request at your suggested time.\n\n"
+                                    f"Reference Number: {appointment_details['reference_number']}\n\n"
+                                    f"Thank you for your understanding.\n\n"
+                                    f"Best regards,\n"
+                                    f"RTU Kiosk Appointment System")
+        confirmationEmail["Subject"] = "Appointment Reschedule Update - Reference #" + appointment_details['reference_number']
+    
+    confirmationEmail["To"] = appointment_details['professor_email']
+    confirmationEmail["From"] = "2021-101043@rtu.edu.ph"
+
+    return enqueue_email(db, confirmationEmail, f"reschedule_{status}")
 
 
 # Helper functions for email processing
@@ -1107,56 +1105,42 @@ def standardize_date_format(date_str):
         logging.error(f"Error standardizing date format for '{date_str}': {str(e)}")
         return date_str  # Return original if parsing fails
 
-async def send_email_reschedule_student(appointment_details: dict):
+def queue_reschedule_student_email(db: Session, appointment_details: dict):
     """
-    Send email to student for reschedule confirmation
+    Queue the reschedule confirmation email to the student. The caller commits.
     """
-    try:
-        service = get_gmail_service()
-        confirmationEmail = EmailMessage()
-        
-        # Email content
-        confirmationEmail.set_content(f"Dear {appointment_details['student_name']},\n\n"
-                                      f"Good day!\n"
-                                      f"Your appointment has been rescheduled by your professor.\n\n"
-                                      f"Appointment Details:\n"
-                                      f"- Date: {appointment_details['date']}\n"
-                                      f"- Time: {appointment_details['start_time']} to {appointment_details['end_time']}\n"
-                                      f"- Reference Number: {appointment_details['uuid']}\n\n"
-                                      f"Best regards,\n"
-                                      f"RTU Kiosk Appointment System")
-        confirmationEmail["Subject"] = "Appointment Reschedule Confirmation"
-        confirmationEmail["To"] = appointment_details['student_email']
-        confirmationEmail['From'] = "2021-101043@rtu.edu.ph"
-
-        encoded_message = base64.urlsafe_b64encode(confirmationEmail.as_bytes()).decode()
-        create_message = {"raw": encoded_message}
-        
-        send_message = (
-            service.users()
-            .messages()
-            .send(userId="me", body=create_message)
-            .execute()
-        )
-        
-        return {"message": send_message["id"]}
-    except Exception as e:
-        logging.error(f"Error sending email: {e}")
-        raise HTTPException(status_code=500, detail=f"Error sending email: {str(e)}")
+    confirmationEmail = EmailMessage()
+    
+    # Email content
+    confirmationEmail.set_content(f"Dear {appointment_details['student_name']},\n\n"
+                                  f"Good day!\n"
+                                  f"Your appointment has been rescheduled by your professor.\n\n"
+                                  f"Appointment Details:\n"
+                                  f"- Date: {appointment_details['date']}\n"
+                                  f"- Time: {appointment_details['start_time']} to {appointment_details['end_time']}\n"
+                                  f"- Reference Number: {appointment_details['uuid']}\n\n"
+                                  f"Best regards,\n"
+                                  f"RTU Kiosk Appointment System")
+    confirmationEmail["Subject"] = "Appointment Reschedule Confirmation"
+    confirmationEmail["To"] = appointment_details['student_email']
+    confirmationEmail['From'] = "2021-101043@rtu.edu.ph"
+
+    return enqueue_email(db, confirmationEmail, "reschedule_student")
+
+async def run_email_check():
+    """One pass of the reply poller, then the auto-rejection of old pending appointments"""
+    with create_session() as db:
+        logging.info("Checking for email replies...")
+        await check_email_replies(db)
+
+        # Also check for old appointments to auto-reject
+        logging.info("Checking for old pending appointments...")
+        await auto_reject_old_appointments(db)
 
 async def check_email_periodically():
     while True:
         try:
-            with session as db:
-                logging.info("Checking for email replies...")
-                await check_professor_email_replies(db)
-
-                logging.info("Checking for student reschedule replies...")
-                await check_student_reschedule_replies(db)
-
-                # Also check for old appointments to auto-reject
-                logging.info("Checking for old pending appointments...")
-                await auto_reject_old_appointments(db)
+            await run_email_check()
         except Exception as e:
             logging.error(f"Error checking email replies and auto rejecting old appointments: {e}")
         await asyncio.sleep(90)  # Check every 180 seconds
\ No newline at end of file
@@ -6,7 +6,7 @@ from starlette import status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
-from otp import create_otp_secret, get_gmail_service
+from otp import create_otp_secret, gmail_client
 from models import ProfessorInformation, User
 from database import get_db, db_dependency
 import jwt
@@ -116,7 +116,6 @@ async def sendOTPTOResetPassword(request: OTPRequest, db: db_dependency):
     create_otp_secret(request.email, secret, db)
 
     try:
-        service = get_gmail_service()
         message = EmailMessage()
 
          # Create email content
@@ -128,14 +127,8 @@ async def sendOTPTOResetPassword(request: OTPRequest, db: db_dependency):
 
         # Encode and send message
         encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-        create_message = {"raw": encoded_message}
         
-        send_message = (
-            service.users()
-            .messages()
-            .send(userId="me", body=create_message)
-            .execute()
-        )
+        send_message = await gmail_client.send(encoded_message)
         return {"message_id": send_message["id"], "status": "sent"}
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to create Gmail service")
@@ -0,0 +1,81 @@
+"""
+    Concurrent-request latency of blocking vs asyncio database access.
+
+    Builds a small in-process app with two versions of the kiosk image listing:
+    the old pattern (sync Session inside an `async def` route, which blocks the
+    event loop) and the AsyncSession pattern used by the ported routes. Each
+    query is padded with pg_sleep so the effect of a slow query is visible.
+
+    Requires a reachable Postgres in SQLALCHEMY_DATABASE_URL.
+
+        python -m benchmarks.bench_async_db --concurrency 20 --requests 200 --slow-ms 20
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import select, text
+
+from benchmarks.common import print_table, summarize
+from database import async_db_dependency, db_dependency, dispose_async_engine, dispose_engine
+from models import Image
+
+
+def build_app(slow_seconds: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/blocking")
+    async def blocking_images(db: db_dependency):
+        db.execute(text("SELECT pg_sleep(:s)"), {"s": slow_seconds})
+        images = db.execute(select(Image.filename, Image.duration))
+        return [{"filename": image.filename, "duration": image.duration} for image in images]
+
+    @app.get("/async")
+    async def async_images(db: async_db_dependency):
+        await db.execute(text("SELECT pg_sleep(:s)"), {"s": slow_seconds})
+        images = await db.execute(select(Image.filename, Image.duration))
+        return [{"filename": image.filename, "duration": image.duration} for image in images]
+
+    return app
+
+async def run_mode(client: httpx.AsyncClient, path: str, concurrency: int, total: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one_request():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(path)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    # Warm the pool so connection setup is not counted
+    await client.get(path)
+    started = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(total)))
+    return summarize(latencies, time.perf_counter() - started)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--slow-ms", type=float, default=20.0, help="pg_sleep added to every request")
+    args = parser.parse_args()
+
+    app = build_app(args.slow_ms / 1000)
+    transport = httpx.ASGITransport(app=app)
+    rows = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for label, path in (("before: sync session", "/blocking"), ("after: AsyncSession", "/async")):
+            rows.append({"mode": label, **await run_mode(client, path, args.concurrency, args.requests)})
+
+    dispose_engine()
+    await dispose_async_engine()
+    print(f"concurrency={args.concurrency} requests={args.requests} slow_query={args.slow_ms}ms")
+    print_table(rows, ["mode", "count", "p50_ms", "p95_ms", "p99_ms", "max_ms", "throughput_per_s"])
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
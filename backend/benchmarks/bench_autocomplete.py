@@ -0,0 +1,88 @@
+"""
+    Per-keystroke /ray/autocomplete latency.
+
+    Every generated kiosk query is "typed" one character at a time and each
+    partial input is completed, as a kiosk sending a request per keystroke
+    would. For each corpus size this reports the build time and
+    FAQAutocomplete.complete() latency without its result cache (every
+    keystroke computed), then the route through the ASGI app with the
+    cache, as served to many kiosks typing the same questions.
+
+        python -m benchmarks.bench_autocomplete --sizes 1000 10000 100000
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+import chatcrud
+from benchmarks.bench_chat import in_memory_db
+from benchmarks.common import print_table, summarize, time_calls
+from benchmarks.corpus import generate_faqs, generate_queries
+from database import get_async_db
+from faqAutocomplete import FAQAutocomplete
+from faqIndex import FAQIndex, invalidate_faq_index
+from main import app
+
+
+def keystrokes(queries: list) -> list:
+    return [query[:length] for query in queries for length in range(1, len(query) + 1)]
+
+async def run_route(inputs: list, concurrency: int, limit: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one_request(client, text):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get("/ray/autocomplete", params={"q": text, "limit": limit})
+            latencies.append(time.perf_counter() - started)
+        response.raise_for_status()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        await client.get("/ray/autocomplete", params={"q": "a"})   # load the index and build outside the timing
+        started = time.perf_counter()
+        await asyncio.gather(*(one_request(client, text) for text in inputs))
+        return summarize(latencies, time.perf_counter() - started)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="corpus sizes in candidates (questions plus synonyms)")
+    parser.add_argument("--queries", type=int, default=200, help="queries typed out keystroke by keystroke")
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent kiosks for the route")
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        faqs = generate_faqs(size)
+        inputs = keystrokes([query for query, _ in generate_queries(faqs, args.queries)])
+        index = FAQIndex(faqs)
+
+        autocomplete = FAQAutocomplete(cache_size=0)
+        started = time.perf_counter()
+        autocomplete.sync(index)
+        build_ms = round((time.perf_counter() - started) * 1000, 1)
+        uncached = summarize(time_calls(autocomplete.complete, [(text, args.limit) for text in inputs]))
+
+        invalidate_faq_index()
+        chatcrud.faq_autocomplete = FAQAutocomplete()
+        app.dependency_overrides[get_async_db] = in_memory_db(faqs)
+        route = await run_route(inputs, args.concurrency, args.limit)
+
+        rows.append({"candidates": len(index), "keystrokes": len(inputs), "build_ms": build_ms,
+                     "fuzzy_rate": round(autocomplete.fuzzy / max(autocomplete.requests, 1), 3),
+                     "complete_p50_ms": uncached["p50_ms"], "complete_p99_ms": uncached["p99_ms"],
+                     "complete_max_ms": uncached["max_ms"], "route_p50_ms": route["p50_ms"],
+                     "route_p99_ms": route["p99_ms"], "route_per_s": route["throughput_per_s"],
+                     "cache_hit_rate": round(chatcrud.faq_autocomplete.cache_hits / max(chatcrud.faq_autocomplete.requests, 1), 3)})
+
+    app.dependency_overrides.pop(get_async_db, None)
+    print(f"limit={args.limit} concurrency={args.concurrency}")
+    print_table(rows, list(rows[0]))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
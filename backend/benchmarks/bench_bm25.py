@@ -0,0 +1,99 @@
+"""
+    BM25 shortlist relevance and latency.
+
+    For each corpus size this reports how often the FAQ a query was generated
+    from lands in the BM25 top-k (recall@k, MRR), the BM25 query latency, the
+    cost of an incremental update after one FAQ edit, and match_faq latency
+    and accuracy with and without the shortlist. It fails if the shortlist
+    changes the answer to any query.
+
+        python -m benchmarks.bench_bm25 --faqs 500 2000 5000 --k 25
+"""
+import argparse
+import time
+from types import SimpleNamespace
+
+from benchmarks.common import print_table, summarize, time_calls
+from benchmarks.corpus import generate_faqs, generate_queries
+from chatcrud import match_faq
+from faqIndex import FAQIndex
+from faqRanker import BM25Ranker, bm25_candidate_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--faqs", type=int, nargs="+", default=[500, 2000, 5000], help="corpus sizes in FAQs")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=25, help="FAQs in the shortlist")
+    args = parser.parse_args()
+
+    relevance_rows = []
+    latency_rows = []
+    changed_answers = []
+    for size in args.faqs:
+        faqs = generate_faqs(size * 3, synonyms_per_faq=1)[:size]
+        queries = generate_queries(faqs, args.queries)
+        index = FAQIndex(faqs)
+        ranker = BM25Ranker()
+
+        started = time.perf_counter()
+        ranker.sync(index)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        # One edited FAQ: only that document is re-tokenized
+        edited = list(faqs)
+        edited[0] = SimpleNamespace(**{**vars(faqs[0]), "answer": faqs[0].answer + " Updated."})
+        edited_index = FAQIndex(edited)
+        started = time.perf_counter()
+        ranker.sync(edited_index)
+        update_ms = (time.perf_counter() - started) * 1000
+        ranker.sync(index)
+
+        positions = {faq.id: position for position, faq in enumerate(faqs)}
+        known = [(query, faq_id) for query, faq_id in queries if faq_id is not None]
+        hits, reciprocal_ranks = 0, 0.0
+        for query, faq_id in known:
+            ranked = ranker.top(query, args.k)
+            if positions[faq_id] in ranked:
+                hits += 1
+                reciprocal_ranks += 1 / (ranked.index(positions[faq_id]) + 1)
+
+        answers = {faq.id: faq.answer for faq in faqs}
+        def accuracy(shortlist: bool):
+            correct = 0
+            for query, faq_id in queries:
+                candidate_ids = bm25_candidate_ids(ranker, index, query, args.k) if shortlist else None
+                correct += match_faq(query, index, candidate_ids=candidate_ids) == answers.get(faq_id)
+            return round(correct / len(queries), 4)
+
+        # The shortlist must only save work: every query gets the answer the full scan gives
+        changed = [query for query, _ in queries
+                   if match_faq(query, index, candidate_ids=bm25_candidate_ids(ranker, index, query, args.k))
+                   != match_faq(query, index)]
+        changed_answers.extend(changed)
+
+        relevance_rows.append({"faqs": size, "candidates": len(index), f"recall@{args.k}": round(hits / len(known), 4),
+                               "mrr": round(reciprocal_ranks / len(known), 4),
+                               "accuracy_full": accuracy(False), "accuracy_shortlist": accuracy(True),
+                               "answers_changed": len(changed)})
+
+        bm25 = summarize(time_calls(ranker.top, [(query, args.k) for query, _ in queries]))
+        full = summarize(time_calls(lambda q: match_faq(q, index), [(query,) for query, _ in queries]))
+        shortlisted = summarize(time_calls(lambda q: match_faq(q, index, candidate_ids=bm25_candidate_ids(ranker, index, q, args.k)),
+                                           [(query,) for query, _ in queries]))
+        latency_rows.append({"faqs": size, "bm25_build_ms": round(build_ms, 1), "bm25_update_ms": round(update_ms, 1),
+                             "bm25_p50_ms": bm25["p50_ms"], "bm25_p99_ms": bm25["p99_ms"],
+                             "match_full_p50_ms": full["p50_ms"], "match_full_p99_ms": full["p99_ms"],
+                             "match_shortlist_p50_ms": shortlisted["p50_ms"], "match_shortlist_p99_ms": shortlisted["p99_ms"]})
+
+    print("Relevance")
+    print_table(relevance_rows, list(relevance_rows[0]))
+    print("\nLatency")
+    print_table(latency_rows, list(latency_rows[0]))
+    if changed_answers:
+        raise SystemExit(f"The shortlist changed the answer to {len(changed_answers)} queries, "
+                         f"e.g. {changed_answers[0]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+    Latency and accuracy of the /ray/chat pipeline as the FAQ table grows.
+
+    For each corpus size a synthetic FAQ set (questions plus synonyms) is
+    generated and a fixed mix of verbatim, typo'd, partial and off-topic
+    kiosk queries is replayed. Two tables are printed:
+
+    - Stages: each step of answer_query timed on its own (BM25 shortlist,
+      match_faq, get_faq_suggestions_by_words, and the pg_trgm fetch when
+      --match-backend postgres), plus answer_query as a whole.
+    - Route: POST /ray/chat through the ASGI app with --concurrency clients,
+      once with an empty response cache (cold) and once replaying the same
+      queries (warm). Match, suggestion and unknown rates and match accuracy
+      come from the route responses.
+
+    With the in-memory database it then checks that answers cached by the
+    startup warm-up are still cache hits once the index's TTL has run out,
+    and in any case that the fallback's circuit breaker recovers after its
+    half-open trial call was turned away at the concurrency limit.
+
+    By default the database is an in-memory stand-in that serves the FAQ
+    query the index loader issues, so no Postgres or network is needed.
+    With --postgres the FAQs are written to the database in
+    SQLALCHEMY_DATABASE_URL and the real session is used; point it at a
+    scratch database.
+
+        python -m benchmarks.bench_chat --sizes 100 1000 10000
+        python -m benchmarks.bench_chat --postgres --replace --match-backend postgres
+"""
+import argparse
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+import httpx
+from sqlalchemy import func, insert, select, text
+
+import chatcrud
+import faqIndex
+from benchmarks.common import print_table, summarize
+from benchmarks.corpus import generate_faqs, generate_queries
+from chatcrud import answer_query, bm25_shortlist, get_faq_suggestions_by_words, match_faq
+from database import create_async_session, create_session, create_table, dispose_async_engine, dispose_engine, get_async_db, get_engine
+from faqIndex import FAQIndex, build_faq_index, faq_synonyms, invalidate_faq_index
+from faqTrigram import get_trigram_index
+from fallbackProvider import CircuitBreaker, FallbackAnswerer, StubProvider
+from main import app
+from models import FAQ, FAQSynonym
+from responseCache import ResponseCache
+
+
+class InMemorySession:
+    """Stands in for AsyncSession: answers the FAQ version and FAQ queries get_faq_index issues"""
+
+    def __init__(self, faqs, version: int = 1):
+        # Already in get_faq_index order: pinned first
+        self._faqs = faqs
+        self.version = version
+
+    async def scalar(self, statement, params=None):
+        return self.version
+
+    async def execute(self, statement, params=None):
+        faqs = self._faqs
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: list(faqs)))
+
+    async def scalars(self, statement, params=None):
+        # Ids of the most asked FAQs, the one scalars query warm_chat_cache issues
+        asked = sorted((faq for faq in self._faqs if faq.hit_count > 0), key=lambda faq: -faq.hit_count)
+        return SimpleNamespace(all=lambda: [faq.id for faq in asked])
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+def in_memory_db(faqs):
+    """get_async_db override serving `faqs` from memory"""
+    session = InMemorySession(sorted(faqs, key=lambda faq: not faq.isPinned))
+
+    async def get_in_memory_db():
+        yield session
+    return get_in_memory_db
+
+def seed_postgres(faqs, replace: bool):
+    """Write the corpus to the configured database, which must be empty unless `replace`"""
+    create_table(get_engine())
+    with create_session() as db:
+        existing = db.scalar(select(func.count()).select_from(FAQ))
+        if existing and not replace:
+            raise SystemExit(f"The faq table already has {existing} rows; use a scratch database or pass --replace")
+        db.execute(text("TRUNCATE faq_synonym, faq RESTART IDENTITY CASCADE"))
+        db.execute(insert(FAQ), [{"id": faq.id, "question": faq.question, "synonyms": faq.synonyms,
+                                  "answer": faq.answer, "isPinned": faq.isPinned} for faq in faqs])
+        synonyms = [{"faq_id": faq.id, "synonym": synonym} for faq in faqs for synonym in faq_synonyms(faq)]
+        if synonyms:
+            db.execute(insert(FAQSynonym), synonyms)
+        db.execute(text("SELECT setval(pg_get_serial_sequence('faq', 'id'), (SELECT max(id) FROM faq))"))
+        db.commit()
+
+async def check_warm_cache(faqs, asked: int = 50) -> dict:
+    """
+        Warm the chat cache with the `asked` most asked FAQs as a starting
+        worker does, let the index's TTL run out with no FAQ change, and ask
+        every warmed question again. All of them must still be cache hits.
+    """
+    faqs = [SimpleNamespace(**{**vars(faq), "hit_count": max(asked - position, 0)}) for position, faq in enumerate(faqs)]
+    session = InMemorySession(faqs)
+    create_async_session_before, ttl_before = chatcrud.create_async_session, faqIndex.FAQ_INDEX_TTL
+    chatcrud.create_async_session = lambda: session
+    invalidate_faq_index()
+    chatcrud.chat_cache.clear()
+    try:
+        warmed = await chatcrud.warm_chat_cache(asked)
+        # Every lookup now finds the index stale and checks the FAQ version
+        faqIndex.FAQ_INDEX_TTL = 0
+        hits_before = chatcrud.chat_cache.hits
+        texts = [text for faq in faqs[:asked] for text in [faq.question, *faq_synonyms(faq)]]
+        for text in texts:
+            await chatcrud.answer_chat(text, session, record=False)
+        hits = chatcrud.chat_cache.hits - hits_before
+    finally:
+        chatcrud.create_async_session, faqIndex.FAQ_INDEX_TTL = create_async_session_before, ttl_before
+        invalidate_faq_index()
+    if hits != len(texts):
+        raise SystemExit(f"Only {hits} of {len(texts)} warmed questions were cache hits after the index TTL ran out")
+    return {"warmed": warmed, "asked_after_ttl": len(texts), "cache_hits": hits}
+
+async def check_breaker_recovery() -> dict:
+    """
+        Open the fallback's breaker, let its reset timeout pass, and have the
+        half-open trial call turned away at the concurrency limit. The
+        breaker must still let the next call through and close again.
+    """
+    provider = StubProvider(delay=0.01, fail=True)
+    answerer = FallbackAnswerer(provider, budget=1, timeout=1, concurrency=1,
+                                breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05),
+                                cache=ResponseCache(maxsize=0))
+    await answerer.answer("first question")
+    opened = answerer.breaker.state
+    await asyncio.sleep(0.06)
+    async with answerer._semaphore:
+        rejected = await answerer.answer("second question")
+    provider.fail = False
+    recovered = await answerer.answer("third question")
+    if opened != "open" or rejected is not None or not recovered or answerer.breaker.state != "closed":
+        raise SystemExit(f"Fallback breaker did not recover: opened={opened} rejected={rejected!r} "
+                         f"recovered={recovered!r} state={answerer.breaker.state}")
+    return {"rejected": answerer.rejected, "state": answerer.breaker.state}
+
+def time_stage(latencies: dict, stage: str, started: float):
+    latencies.setdefault(stage, []).append(time.perf_counter() - started)
+
+async def run_stages(queries, index: FAQIndex, trigram: bool) -> dict:
+    """Per-stage latencies of answer_query for every query, in seconds"""
+    latencies = {}
+    for query, _ in queries:
+        if trigram:
+            async with create_async_session() as db:
+                started = time.perf_counter()
+                index = await get_trigram_index(db, query)
+                time_stage(latencies, "trigram_fetch", started)
+
+        started = time.perf_counter()
+        shortlist = bm25_shortlist(query, index)
+        time_stage(latencies, "bm25_shortlist", started)
+
+        started = time.perf_counter()
+        answer = match_faq(query, index, candidate_ids=shortlist)
+        time_stage(latencies, "match_faq", started)
+
+        if not answer:
+            started = time.perf_counter()
+            get_faq_suggestions_by_words(query, index)
+            time_stage(latencies, "suggestions", started)
+
+        started = time.perf_counter()
+        await answer_query(query, index)
+        time_stage(latencies, "answer_query", started)
+    return latencies
+
+async def run_route(client: httpx.AsyncClient, queries, answers: dict, concurrency: int) -> dict:
+    """Replay the queries through POST /ray/chat; latency summary plus outcome rates"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    outcomes = {"match": 0, "correct": 0, "suggestions": 0, "generated": 0, "unknown": 0}
+    faq_answers = set(answers.values())
+
+    async def one_request(query, faq_id):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/ray/chat", json={"query": query})
+            latencies.append(time.perf_counter() - started)
+        response.raise_for_status()
+        body = response.json()
+        if body["suggestions"]:
+            outcomes["suggestions"] += 1
+        elif body["response"] in faq_answers:
+            outcomes["match"] += 1
+            outcomes["correct"] += body["response"] == answers.get(faq_id)
+        elif body["response"] in chatcrud.FALLBACK_RESPONSES:
+            outcomes["unknown"] += 1
+        else:
+            outcomes["generated"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_request(query, faq_id) for query, faq_id in queries))
+    summary = summarize(latencies, time.perf_counter() - started)
+    total = len(queries)
+    summary.update({
+        "match_rate": round(outcomes["match"] / total, 4),
+        "suggestion_rate": round(outcomes["suggestions"] / total, 4),
+        "generated_rate": round(outcomes["generated"] / total, 4),
+        "unknown_rate": round(outcomes["unknown"] / total, 4),
+        "match_accuracy": round(outcomes["correct"] / outcomes["match"], 4) if outcomes["match"] else 0.0,
+    })
+    return summary
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="corpus sizes in candidates (questions plus synonyms)")
+    parser.add_argument("--synonyms", type=int, default=2, help="average synonyms per FAQ")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent /ray/chat clients")
+    parser.add_argument("--postgres", action="store_true", help="seed and query the database in SQLALCHEMY_DATABASE_URL")
+    parser.add_argument("--replace", action="store_true", help="with --postgres, replace existing FAQ rows")
+    parser.add_argument("--match-backend", choices=["memory", "postgres"], default="memory",
+                        help="FAQ_MATCH_BACKEND to benchmark; postgres needs --postgres")
+    parser.add_argument("--fallback-stub-ms", type=float, default=None,
+                        help="enable the stub generative fallback with this latency")
+    args = parser.parse_args()
+    if args.match_backend == "postgres" and not args.postgres:
+        parser.error("--match-backend postgres needs --postgres")
+
+    # Pin the configuration under test instead of whatever the environment says
+    chatcrud.FAQ_MATCH_BACKEND = args.match_backend
+    chatcrud.fallback_answerer = FallbackAnswerer(StubProvider(delay=args.fallback_stub_ms / 1000)
+                                                  if args.fallback_stub_ms is not None else None)
+    faqIndex.FAQ_INDEX_TTL = float("inf")
+
+    stage_rows = []
+    route_rows = []
+    for size in args.sizes:
+        faqs = generate_faqs(size, synonyms_per_faq=args.synonyms)
+        queries = generate_queries(faqs, args.queries)
+        random.Random(2).shuffle(queries)
+        answers = {faq.id: faq.answer for faq in faqs}
+
+        if args.postgres:
+            seed_postgres(faqs, args.replace)
+            app.dependency_overrides.pop(get_async_db, None)
+        else:
+            app.dependency_overrides[get_async_db] = in_memory_db(faqs)
+
+        invalidate_faq_index()
+        started = time.perf_counter()
+        index = build_faq_index(faqs)
+        build_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        latencies = await run_stages(queries, index, trigram=args.match_backend == "postgres")
+        for stage, values in latencies.items():
+            stage_rows.append({"candidates": len(index), "stage": stage, **summarize(values)})
+
+        # The route loads its own index through the (stand-in) session
+        invalidate_faq_index()
+        chatcrud.chat_cache.clear()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for label in ("cold", "warm"):
+                route_rows.append({"candidates": len(index), "faqs": len(faqs), "index_build_ms": build_ms, "cache": label,
+                                   **await run_route(client, queries, answers, args.concurrency)})
+
+    app.dependency_overrides.pop(get_async_db, None)
+    if args.postgres:
+        dispose_engine()
+        await dispose_async_engine()
+    warm_check = None
+    if not args.postgres and args.match_backend == "memory":
+        warm_check = await check_warm_cache(faqs)
+    breaker_check = await check_breaker_recovery()
+
+    print(f"queries={args.queries} concurrency={args.concurrency} database={'postgres' if args.postgres else 'in-memory'} "
+          f"match_backend={args.match_backend} fallback={'stub' if args.fallback_stub_ms is not None else 'none'}")
+    print("\nStages")
+    print_table(stage_rows, ["candidates", "stage", "count", "p50_ms", "p95_ms", "p99_ms", "max_ms"])
+    print("\nRoute /ray/chat")
+    print_table(route_rows, ["candidates", "faqs", "index_build_ms", "cache", "p50_ms", "p95_ms", "p99_ms",
+                             "throughput_per_s", "match_rate", "suggestion_rate", "generated_rate", "unknown_rate", "match_accuracy"])
+    print(f"Breaker check: a trial call rejected at the concurrency limit ({breaker_check['rejected']} rejected) "
+          f"did not stop the breaker from closing ({breaker_check['state']})")
+    if warm_check is not None:
+        print(f"\nWarm-up check: {warm_check['cache_hits']} of {warm_check['asked_after_ttl']} warmed questions "
+              f"({warm_check['warmed']} answers warmed) were cache hits after the index TTL ran out")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""
+    Jaccard FAQ suggestions: original linear scan vs the inverted token index.
+
+    For each corpus size the original implementation (normalizes and scans
+    every candidate per query) and get_faq_suggestions_by_words over a prebuilt
+    FAQIndex answer the same queries; the results must be identical.
+
+        python -m benchmarks.bench_faq_suggestions --sizes 100 1000 10000 100000
+"""
+import argparse
+import time
+
+from benchmarks.common import print_table, summarize, time_calls
+from benchmarks.corpus import generate_faqs, generate_queries
+from chatcrud import get_faq_suggestions_by_words
+from faqIndex import FAQIndex, normalize
+
+
+def legacy_suggestions(query: str, faqs, threshold: float = 0.3, max_suggestions: int = 3) -> list:
+    """get_faq_suggestions_by_words as it was before the inverted index"""
+    normalized_query = normalize(query)
+    query_words = set(normalized_query.split())
+    suggestions = []
+    for faq in faqs:
+        candidate_texts = [normalize(faq.question)]
+        if faq.synonyms:
+            candidate_texts.extend(normalize(syn) for syn in faq.synonyms)
+        for candidate in candidate_texts:
+            candidate_words = set(candidate.split())
+            if not candidate_words:
+                continue
+            jaccard = len(query_words & candidate_words) / len(query_words | candidate_words)
+            if jaccard >= threshold:
+                suggestions.append((candidate, jaccard))
+    suggestions.sort(key=lambda x: x[1], reverse=True)
+    return [sug[0] for sug in suggestions[:max_suggestions]]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000],
+                        help="corpus sizes in candidates (questions plus synonyms)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--legacy-queries", type=int, default=50,
+                        help="queries replayed through the slow original implementation")
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--max-suggestions", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        faqs = generate_faqs(size)
+        queries = [query for query, _ in generate_queries(faqs, args.queries)]
+
+        started = time.perf_counter()
+        index = FAQIndex(faqs)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        legacy_queries = queries[:args.legacy_queries]
+        for query in legacy_queries:
+            expected = legacy_suggestions(query, faqs, args.threshold, args.max_suggestions)
+            actual = get_faq_suggestions_by_words(query, index, args.threshold, args.max_suggestions)
+            if expected != actual:
+                raise SystemExit(f"Result mismatch for {query!r}: {expected} != {actual}")
+
+        legacy = summarize(time_calls(legacy_suggestions, [(q, faqs, args.threshold, args.max_suggestions) for q in legacy_queries]))
+        indexed = summarize(time_calls(get_faq_suggestions_by_words, [(q, index, args.threshold, args.max_suggestions) for q in queries]))
+        rows.append({"candidates": len(index), "index_build_ms": round(build_ms, 1),
+                     "legacy_p50_ms": legacy["p50_ms"], "legacy_p99_ms": legacy["p99_ms"],
+                     "indexed_p50_ms": indexed["p50_ms"], "indexed_p99_ms": indexed["p99_ms"],
+                     "speedup_p50": round(legacy["p50_ms"] / indexed["p50_ms"], 1) if indexed["p50_ms"] else "-"})
+
+    print_table(rows, ["candidates", "index_build_ms", "legacy_p50_ms", "legacy_p99_ms",
+                       "indexed_p50_ms", "indexed_p99_ms", "speedup_p50"])
+
+
+if __name__ == "__main__":
+    main()
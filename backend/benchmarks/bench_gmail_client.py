@@ -0,0 +1,142 @@
+"""
+    Async Gmail client versus the blocking googleapiclient service, against
+    the local fake Gmail API (benchmarks.fake_gmail).
+
+    The mailbox is seeded with --threads reply threads, and each mode fetches
+    every thread with threads.get, the poller's heaviest call:
+
+        sync-inline   service.threads().get().execute() in the coroutine, as
+                      the pollers did; the event loop is blocked per call
+        sync-threads  the same call in worker threads, --concurrency at once
+        async         a GmailClient like otp.gmail_client, with
+                      max_concurrency=--concurrency
+
+    Reported per mode: wall time, calls per second, new connections the
+    server accepted, and the longest stall of a 1 ms ticker running on the
+    event loop meanwhile, which is how long a request would have waited.
+
+    Before timing, every client call (send, list, get, threads.get, modify,
+    history, profile) is made once, including a 401 that must be recovered
+    from by refreshing the token through the fake token endpoint.
+
+        python -m benchmarks.bench_gmail_client --threads 200 --concurrency 8 --latency-ms 20
+"""
+import argparse
+import asyncio
+import base64
+import tempfile
+import time
+from email.message import EmailMessage
+
+import anyio
+
+from benchmarks.common import print_table
+from benchmarks.fake_gmail import FakeGmail, use_fake_gmail
+
+STALE_TOKEN = "stale-access-token"
+
+
+def seed(server: FakeGmail, count: int) -> list:
+    mailbox = server.mailbox
+    thread_ids = []
+    for i in range(count):
+        original = mailbox.add_message(f"Student {i} has created an appointment",
+                                       f"Appointment details\n\nReference Number: {i:06x}\n",
+                                       sender="appointments@example.edu", to=f"professor{i}@example.edu",
+                                       labels=("SENT",))
+        mailbox.reply(original["id"], "I accept this appointment.\n\nOn Monday, the system wrote: ...")
+        thread_ids.append(original["threadId"])
+    return thread_ids
+
+async def check_calls(server: FakeGmail, client):
+    """Make each client call once and check the fake saw it"""
+    server.revoked_tokens.add(STALE_TOKEN)
+    profile = await client.get_profile()   # rejected with 401, then retried with a fresh token
+    assert client.refreshes == 1 and server.tokens_issued == 1, "401 did not trigger a token refresh"
+
+    message = EmailMessage()
+    message["To"] = "student@example.edu"
+    message["Subject"] = "Your Verification Code"
+    message.set_content("Your verification code is: 123456")
+    sent = await client.send(base64.urlsafe_b64encode(message.as_bytes()).decode())
+    listed = await client.list_messages(q='subject:"has created an appointment" is:unread', max_results=10)
+    inbox = await client.list_messages(q="is:unread", max_results=1)
+    fetched = await client.get_message(inbox["messages"][0]["id"], format="full")
+    thread = await client.get_thread(fetched["threadId"])
+    await client.modify_message(fetched["id"], remove_label_ids=["UNREAD"])
+    history = await client.list_history(profile["historyId"], history_types=["messageAdded", "labelRemoved"])
+    assert sent["labelIds"] == ["SENT"] and len(listed["messages"]) == 10 and len(thread["messages"]) == 2
+    assert len(history["history"]) == 2, history
+    assert "UNREAD" not in server.mailbox.messages[fetched["id"]]["labelIds"]
+    print(f"checked: {', '.join(sorted(server.calls))}; http={client.stats()['http_version']}")
+
+async def loop_lag(stop: asyncio.Event) -> float:
+    longest = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        longest = max(longest, time.perf_counter() - started - 0.001)
+    return longest
+
+async def run_mode(mode: str, server: FakeGmail, client, thread_ids: list, concurrency: int) -> dict:
+    import otp
+
+    service = otp.get_gmail_service()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def fetch_sync(thread_id):
+        return service.users().threads().get(userId="me", id=thread_id).execute()
+
+    async def fetch(thread_id):
+        if mode == "sync-inline":
+            return fetch_sync(thread_id)
+        if mode == "sync-threads":
+            async with semaphore:
+                return await anyio.to_thread.run_sync(fetch_sync, thread_id)
+        return await client.get_thread(thread_id)
+
+    connections_before = server.connections
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(loop_lag(stop))
+    await asyncio.sleep(0.005)
+    started = time.perf_counter()
+    if mode == "sync-inline":
+        threads = [await fetch(thread_id) for thread_id in thread_ids]
+    else:
+        threads = await asyncio.gather(*(fetch(thread_id) for thread_id in thread_ids))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    lag = await ticker
+    assert all(len(thread["messages"]) == 2 for thread in threads)
+    return {"mode": mode, "calls": len(threads), "seconds": round(elapsed, 3),
+            "calls_per_s": round(len(threads) / elapsed, 1), "new_connections": server.connections - connections_before,
+            "max_loop_stall_ms": round(lag * 1000, 1)}
+
+async def main(args):
+    server = FakeGmail(latency=args.latency_ms / 1000).start()
+    thread_ids = seed(server, args.threads)
+    with tempfile.TemporaryDirectory() as directory:
+        use_fake_gmail(server, directory, token=STALE_TOKEN)
+        import otp
+        from gmailClient import GmailClient
+
+        client = GmailClient(otp.GMAIL_API_ENDPOINT, otp.get_gmail_access_token, otp.refresh_gmail_access_token,
+                             max_concurrency=args.concurrency)
+        await check_calls(server, client)
+        # Warm both clients' connections before timing
+        await run_mode("sync-threads", server, client, thread_ids[:args.concurrency], args.concurrency)
+        await run_mode("async", server, client, thread_ids[:args.concurrency], args.concurrency)
+        rows = [await run_mode(mode, server, client, thread_ids, args.concurrency)
+                for mode in ("sync-inline", "sync-threads", "async")]
+        await client.aclose()
+    server.shutdown()
+    print(f"threads={args.threads} concurrency={args.concurrency} latency_ms={args.latency_ms}")
+    print_table(rows, list(rows[0]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=20, help="fake Gmail time per HTTP request")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,132 @@
+"""
+    Gmail quota limiting across worker processes, against the local fake
+    Gmail API (benchmarks.fake_gmail) enforcing a per-user quota of
+    --quota units per second the way Gmail does: calls past it get a 429.
+
+    --workers processes, standing in for the gunicorn workers, each make
+    --calls threads.get calls (10 units) through a GmailClient, --concurrency
+    at a time. Modes:
+
+        none         no limiter; only the client's own retries with backoff
+        per-process  a TokenBucket of the whole quota in every process, so
+                     together they ask for --workers times too much
+        shared       one rateLimiter.SharedTokenBucket file for all of them,
+                     at --rate units per second
+
+    Reported per mode: wall time, calls completed per second, calls that
+    failed after all retries, 429s the server sent, client retries, and the
+    limiter's summed wait and backoff seconds and deepest queue.
+
+        python -m benchmarks.bench_gmail_quota --workers 4 --calls 60 --quota 250 --rate 200
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+from benchmarks.common import print_table
+from benchmarks.fake_gmail import FakeGmail
+
+TOKEN = "fake-access-token"
+
+
+async def token_source():
+    return TOKEN
+
+async def token_refresher(rejected):
+    return TOKEN
+
+async def run_worker(url: str, thread_ids: list, mode: str, args, quota_file: str) -> dict:
+    from gmailClient import GmailClient, GmailError
+    from rateLimiter import SharedTokenBucket, TokenBucket
+
+    if mode == "shared":
+        limiter = SharedTokenBucket(quota_file, args.rate, args.quota)
+    elif mode == "per-process":
+        limiter = TokenBucket(args.quota, args.quota)
+    else:
+        limiter = None
+    client = GmailClient(url, token_source, token_refresher, max_concurrency=args.concurrency, limiter=limiter)
+    failed = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def fetch(thread_id):
+        nonlocal failed
+        async with semaphore:
+            try:
+                await client.get_thread(thread_id)
+            except GmailError:
+                failed += 1
+
+    await asyncio.gather(*(fetch(thread_id) for thread_id in thread_ids))
+    await client.aclose()
+    quota = limiter.stats() if limiter else {}
+    return {"failed": failed, "retries": client.retries, "wait_seconds": quota.get("wait_seconds", 0.0),
+            "backoff_seconds": quota.get("backoff_seconds", 0.0), "max_waiting": quota.get("max_waiting", 0)}
+
+def worker(url: str, thread_ids: list, mode: str, args, quota_file: str, start, results):
+    start.wait()
+    results.put(asyncio.run(run_worker(url, thread_ids, mode, args, quota_file)))
+
+def run_mode(server: FakeGmail, thread_ids: list, mode: str, args, directory: str) -> dict:
+    context = multiprocessing.get_context("spawn")
+    start = context.Event()
+    results = context.Queue()
+    quota_file = os.path.join(directory, f"quota-{mode}")
+    processes = [context.Process(target=worker, args=(server.url, thread_ids, mode, args, quota_file, start, results))
+                 for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    time.sleep(1)   # let the workers import before starting the clock
+    throttled_before, requests_before = server.throttled, server.requests
+    started = time.perf_counter()
+    start.set()
+    rows = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    calls = args.workers * len(thread_ids)
+    failed = sum(row["failed"] for row in rows)
+    return {"mode": mode, "calls": calls, "seconds": round(elapsed, 2),
+            "ok_per_s": round((calls - failed) / elapsed, 1), "failed": failed,
+            "http_requests": server.requests - requests_before, "server_429s": server.throttled - throttled_before,
+            "retries": sum(row["retries"] for row in rows),
+            "wait_s": round(sum(row["wait_seconds"] for row in rows), 1),
+            "backoff_s": round(sum(row["backoff_seconds"] for row in rows), 1),
+            "max_queue": max(row["max_waiting"] for row in rows)}
+
+def main(args):
+    server = FakeGmail(latency=args.latency_ms / 1000).start()
+    thread_ids = []
+    for i in range(args.calls):
+        original = server.mailbox.add_message(f"Student {i} has created an appointment", f"Reference Number: {i:06x}",
+                                              sender="appointments@example.edu", to="professor@example.edu",
+                                              labels=("SENT",))
+        server.mailbox.reply(original["id"], "I accept")
+        thread_ids.append(original["threadId"])
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in args.modes:
+            # A full quota for each mode
+            time.sleep(1)
+            server.quota_rate = server.quota_tokens = args.quota
+            rows.append(run_mode(server, thread_ids, mode, args, directory))
+    server.shutdown()
+    print(f"workers={args.workers} calls/worker={args.calls} concurrency={args.concurrency} "
+          f"quota={args.quota} rate={args.rate} latency_ms={args.latency_ms}")
+    print_table(rows, list(rows[0]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--calls", type=int, default=60, help="threads.get calls per worker")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--quota", type=float, default=250, help="units per second the fake Gmail allows")
+    parser.add_argument("--rate", type=float, default=200, help="units per second the shared limiter allows")
+    parser.add_argument("--latency-ms", type=float, default=20, help="fake Gmail time per HTTP request")
+    parser.add_argument("--modes", nargs="+", default=["none", "per-process", "shared"])
+    main(parser.parse_args())
@@ -0,0 +1,89 @@
+"""
+    Email outbox delivery against a local fake Gmail API.
+
+    A fake Gmail server (benchmarks.fake_gmail), answering after
+    --latency-ms per HTTP request, runs in a thread, and the real Gmail
+    service and outbox send path (emailOutbox.send_emails) are pointed at it
+    through GMAIL_API_ENDPOINT with a throwaway token.json. Every
+    --fail-every'th message is rejected with a 429, to check that each
+    message in a batch gets its own result.
+
+    Each row sends --emails messages at one Gmail batch size and concurrency.
+    Batch size 1 at concurrency 1 is the old behaviour of one blocking send
+    per email. Reported per row: HTTP requests the server saw, wall time,
+    emails per second, and sent/failed counts, which must match what the
+    server accepted and rejected. The Gmail quota limiter is lifted, since
+    at 100 units a send it would set the pace instead of the batching
+    (benchmarks.bench_gmail_quota covers it).
+
+        python -m benchmarks.bench_outbox --emails 500 --batch-sizes 1 10 50 100 --latency-ms 50
+"""
+import argparse
+import asyncio
+import base64
+import tempfile
+import time
+import uuid
+from email.message import EmailMessage
+
+from benchmarks.common import print_table
+from benchmarks.fake_gmail import FakeGmail, use_fake_gmail
+
+
+def build_messages(count: int) -> list:
+    raws = []
+    for i in range(count):
+        message = EmailMessage()
+        message["To"] = f"student{i}@example.edu"
+        message["From"] = "me"
+        message["Subject"] = "Appointment Request Approved"
+        message.set_content(f"Dear Student {i},\n\nYour appointment request (reference {uuid.uuid4()}) "
+                            "has been approved.\n\n" + "Appointment details follow. " * 40)
+        raws.append(base64.urlsafe_b64encode(message.as_bytes()).decode())
+    return raws
+
+def run_row(server: FakeGmail, raws: list, batch_size: int, concurrency: int) -> dict:
+    import emailOutbox
+
+    emailOutbox.OUTBOX_SEND_BATCH = batch_size
+    emailOutbox.OUTBOX_CONCURRENCY = concurrency
+    requests_before, accepted_before, rejected_before = server.requests, server.accepted, server.rejected
+    started = time.perf_counter()
+    results = asyncio.run(emailOutbox.send_emails(raws))
+    elapsed = time.perf_counter() - started
+
+    sent = sum(1 for message_id, error in results if error is None and message_id)
+    failed = sum(1 for _, error in results if error is not None)
+    if sent != server.accepted - accepted_before or failed != server.rejected - rejected_before:
+        raise SystemExit(f"per-message results don't match the server: sent={sent} failed={failed}")
+    return {"batch": batch_size, "concurrency": concurrency, "emails": len(raws),
+            "http_requests": server.requests - requests_before, "seconds": round(elapsed, 3),
+            "emails_per_s": round(len(raws) / elapsed, 1), "sent": sent, "failed": failed}
+
+def main(args):
+    server = FakeGmail(latency=args.latency_ms / 1000, fail_every=args.fail_every).start()
+    with tempfile.TemporaryDirectory() as directory:
+        use_fake_gmail(server, directory)
+        import emailOutbox
+        from otp import get_gmail_service
+        from rateLimiter import TokenBucket
+
+        emailOutbox.gmail_quota = TokenBucket(1e12, 1e12, backoff_base=0)
+        get_gmail_service()
+        raws = build_messages(args.emails)
+        rows = [run_row(server, raws, 1, 1)]
+        rows += [run_row(server, raws, batch_size, concurrency)
+                 for concurrency in args.concurrency for batch_size in args.batch_sizes]
+    server.shutdown()
+    print(f"emails={args.emails} latency_ms={args.latency_ms} fail_every={args.fail_every}")
+    print_table(rows, list(rows[0]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=500)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4])
+    parser.add_argument("--latency-ms", type=float, default=50, help="fake Gmail time per HTTP request")
+    parser.add_argument("--fail-every", type=int, default=25, help="reject every Nth message with a 429; 0 never")
+    main(parser.parse_args())
@@ -0,0 +1,174 @@
+"""
+    Reply poller throughput on recorded Gmail threads, against the local
+    fake Gmail API (benchmarks.fake_gmail).
+
+    The threads in fixtures/gmail_reply_threads.json (professor replies to
+    appointment requests and student replies to reschedule suggestions,
+    multipart and quoted as mail clients send them) are loaded --copies
+    times, each copy with its own reference numbers, and every row runs one
+    appointmentCore.sync_email_replies pass over all of them from the same
+    history checkpoint.
+
+    The database is replaced by an in-memory session: checkpoints, the
+    processed-message table and the appointments live in dicts, and commits
+    are counted. Row "sequential" is the old poller: one thread fetched,
+    classified and committed at a time. The other rows use --workers
+    fetches at once and --batch-size replies per transaction, without and
+    with the Gmail quota limiter at --quota-rate units per second.
+
+    Reported per row: wall time, threads per second, Gmail HTTP requests,
+    commits, seconds spent waiting on the quota (summed over calls),
+    and the outcomes, which must be the same in every row. Fetches beyond
+    GMAIL_MAX_CONCURRENCY wait for the client's connections.
+
+        python -m benchmarks.bench_reply_sync --copies 50 --workers 4 8 16 --latency-ms 50
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from benchmarks.common import print_table
+from benchmarks.fake_gmail import FakeGmail, use_fake_gmail
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "gmail_reply_threads.json")
+REFERENCES = ("a1b2c3", "d4e5f6", "0a1b2c", "3d4e5f", "6a7b8c", "9d0e1f", "7f8e9d")
+
+
+class MemorySession:
+    """Just enough of a Session for the reply poller"""
+
+    def __init__(self, checkpoint: int):
+        self.checkpoint = checkpoint
+        self.processed = set()
+        self.pending = []
+        self.commits = 0
+
+    def add(self, row):
+        self.pending.append(row)
+
+    def scalars(self, statement):
+        return list(self.processed)
+
+    def execute(self, statement):
+        pass
+
+    def commit(self):
+        from models import GmailProcessedMessage
+
+        self.commits += 1
+        self.processed.update(row.message_id for row in self.pending if isinstance(row, GmailProcessedMessage))
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+
+def rewrite(part: dict, copy: int):
+    """Give a copy of a recorded message its own reference numbers"""
+    data = part.get("body", {}).get("data")
+    if data:
+        text = base64.urlsafe_b64decode(data).decode()
+        for reference in REFERENCES:
+            text = text.replace(reference, f"{copy:03x}{reference[3:]}")
+        part["body"] = {"size": len(text), "data": base64.urlsafe_b64encode(text.encode()).decode()}
+    for child in part.get("parts", []):
+        rewrite(child, copy)
+
+def load(server: FakeGmail, copies: int) -> int:
+    with open(FIXTURES) as file:
+        threads = json.load(file)["threads"]
+    for copy in range(copies):
+        for messages in threads:
+            messages = json.loads(json.dumps(messages))
+            for message in messages:
+                rewrite(message["payload"], copy)
+            server.mailbox.load_thread(messages)
+    return len(threads) * copies
+
+def new_appointments(copies: int) -> dict:
+    professor = SimpleNamespace(title="Prof.", first_name="Maria", last_name="Dela Cruz",
+                                email="prof@rtu.edu.ph")
+    start = datetime(2025, 10, 20, 10, 0)
+    appointments = {}
+    for copy in range(copies):
+        for reference in REFERENCES:
+            appointments[f"{copy:03x}{reference[3:]}"] = SimpleNamespace(
+                uuid=f"00000000-0000-0000-0000-000000{copy:03x}{reference[3:]}", professor=professor,
+                student_name="Student", student_email="student@rtu.edu.ph", start_time=start,
+                end_time=start + timedelta(hours=1),
+                # The fixtures' student replies answer suggestions already made, except 0a1b2c's,
+                # whose suggestion is made by a professor reply earlier in the mailbox
+                status="Rescheduled - Pending" if reference == "7f8e9d" else "Pending",
+                suggested_start_time=start + timedelta(days=1), suggested_end_time=start + timedelta(days=1, hours=1))
+    return appointments
+
+async def run_row(name: str, server: FakeGmail, checkpoint: int, copies: int, workers: int, batch_size: int,
+                  limiter) -> dict:
+    import appointmentCore
+    import otp
+
+    appointments = new_appointments(copies)
+    appointmentCore.load_reply_appointments = lambda db, references: {
+        reference: appointments[reference] for reference in references if reference in appointments}
+    appointmentCore.REPLY_FETCH_WORKERS = workers
+    appointmentCore.REPLY_BATCH_SIZE = batch_size
+    otp.gmail_client.limiter = limiter
+
+    db = MemorySession(checkpoint)
+    requests_before = server.requests
+    started = time.perf_counter()
+    result = await appointmentCore.sync_email_replies(db)
+    elapsed = time.perf_counter() - started
+    return {"mode": name, "workers": workers, "batch": batch_size, "threads": result["threads"],
+            "seconds": round(elapsed, 3), "threads_per_s": round(result["threads"] / elapsed, 1),
+            "gmail_requests": server.requests - requests_before, "commits": db.commits,
+            "quota_wait_s": round(limiter.wait_seconds, 2) if limiter else 0.0,
+            "outcomes": " ".join(f"{key}={value}" for key, value in sorted(result["outcomes"].items()))}
+
+async def main(args):
+    logging.disable(logging.INFO)
+    server = FakeGmail(latency=args.latency_ms / 1000).start()
+    checkpoint = server.mailbox.history_id
+    count = load(server, args.copies)
+    with tempfile.TemporaryDirectory() as directory:
+        use_fake_gmail(server, directory)
+        import appointmentCore
+        import gmailSync
+        from rateLimiter import TokenBucket
+
+        gmailSync.get_checkpoint = lambda db, name: db.checkpoint
+        appointmentCore.save_checkpoint = lambda db, name, history_id: None
+        # Connect before timing
+        await appointmentCore.gmail_client.get_profile()
+
+        rows = [await run_row("sequential", server, checkpoint, args.copies, 1, 1, None)]
+        for workers in args.workers:
+            rows.append(await run_row("batched", server, checkpoint, args.copies, workers, args.batch_size, None))
+        for workers in args.workers:
+            limiter = TokenBucket(args.quota_rate, args.quota_burst)
+            rows.append(await run_row("batched+quota", server, checkpoint, args.copies, workers, args.batch_size,
+                                      limiter))
+        await appointmentCore.gmail_client.aclose()
+    server.shutdown()
+    if len({row["outcomes"] for row in rows}) != 1:
+        raise SystemExit("outcomes differ between rows")
+    print(f"threads={count} latency_ms={args.latency_ms} quota_rate={args.quota_rate}")
+    print_table(rows, list(rows[0]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, default=50, help="times each recorded thread is loaded")
+    parser.add_argument("--workers", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=50, help="fake Gmail time per HTTP request")
+    parser.add_argument("--quota-rate", type=float, default=250, help="quota units per second; Gmail allows 250")
+    parser.add_argument("--quota-burst", type=float, default=250)
+    asyncio.run(main(parser.parse_args()))
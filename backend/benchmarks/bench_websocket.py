@@ -0,0 +1,149 @@
+"""
+    Load test for the /ray/ws kiosk WebSocket on a single worker.
+
+    A uvicorn worker serving the app with an in-memory FAQ corpus (see
+    bench_chat) is started in a subprocess, so the clients don't share its
+    CPU. For each connection count, that many kiosk sockets connect at once
+    and each sends --messages messages, keeping up to --window unanswered at
+    a time (pipelining). Messages are generated kiosk queries, with
+    --autocomplete-rate of them sent as autocomplete requests instead.
+
+    Reported per row: connect time for all sockets, messages per second
+    through the worker, and reply latency from send to reply. --window 1
+    gives request/response behaviour for comparison.
+
+        python -m benchmarks.bench_websocket --connections 10 100 500 --size 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import websockets
+
+from benchmarks.common import print_table, summarize
+from benchmarks.corpus import generate_faqs, generate_queries
+
+
+def serve(size: int, port: int):
+    import uvicorn
+
+    import chatcrud
+    from benchmarks.bench_chat import in_memory_db
+    from database import get_async_db
+    from main import app
+
+    app.dependency_overrides[get_async_db] = in_memory_db(generate_faqs(size))
+    # Nothing to poll without a database; the corpus never changes
+    chatcrud.chat_hub.version_source = None
+    uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, lifespan="off", log_level="warning")).run()
+
+def start_server(size: int, max_connections: int) -> tuple:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    env = dict(os.environ, FAQ_INDEX_TTL="inf", WS_MAX_CONNECTIONS=str(max_connections),
+               WS_IDLE_TIMEOUT="600", WS_FAQ_POLL_INTERVAL="0")
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_websocket", "--serve",
+                               "--size", str(size), "--port", str(port)], env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server, port
+        except OSError:
+            if server.poll() is not None:
+                raise SystemExit("benchmark server exited during startup")
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit("benchmark server did not start")
+
+def build_messages(queries: list, count: int, autocomplete_rate: float) -> list:
+    messages = []
+    for i in range(count):
+        query = queries[i % len(queries)]
+        if (i * 7919 % 100) < autocomplete_rate * 100:
+            messages.append({"type": "autocomplete", "id": i, "q": query[:max(len(query) // 2, 1)]})
+        else:
+            messages.append({"type": "chat", "id": i, "query": query})
+    return messages
+
+async def run_kiosk(url: str, messages: list, window: int, latencies: list, connected: list, ready: asyncio.Event) -> int:
+    async with websockets.connect(url, max_queue=None, open_timeout=60) as ws:
+        connected.append(ws)
+        await ready.wait()
+        sent_at = {}
+        next_message = 0
+        errors = 0
+        while next_message < len(messages) or sent_at:
+            while next_message < len(messages) and len(sent_at) < window:
+                message = messages[next_message]
+                sent_at[message["id"]] = time.perf_counter()
+                await ws.send(json.dumps(message))
+                next_message += 1
+            reply = json.loads(await ws.recv())
+            started = sent_at.pop(reply.get("id"), None)
+            if started is None or reply["type"] == "error":
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+        return errors
+
+async def run_round(port: int, connections: int, messages: list, window: int) -> dict:
+    url = f"ws://127.0.0.1:{port}/ray/ws"
+    latencies = []
+    connected = []
+    ready = asyncio.Event()
+    connect_started = time.perf_counter()
+    kiosks = [asyncio.create_task(run_kiosk(url, messages, window, latencies, connected, ready))
+              for _ in range(connections)]
+    while len(connected) < connections:
+        done = [kiosk for kiosk in kiosks if kiosk.done()]
+        if done:
+            await done[0]   # raises the connection error
+        await asyncio.sleep(0.01)
+    connect_ms = round((time.perf_counter() - connect_started) * 1000, 1)
+
+    started = time.perf_counter()
+    ready.set()
+    errors = sum(await asyncio.gather(*kiosks))
+    summary = summarize(latencies, time.perf_counter() - started)
+    return {"connections": connections, "messages": summary["count"], "errors": errors, "connect_ms": connect_ms,
+            "msgs_per_s": summary["throughput_per_s"], "p50_ms": summary["p50_ms"],
+            "p95_ms": summary["p95_ms"], "p99_ms": summary["p99_ms"], "max_ms": summary["max_ms"]}
+
+async def main(args):
+    faqs = generate_faqs(args.size)
+    queries = [query for query, _ in generate_queries(faqs, 500)]
+    messages = build_messages(queries, args.messages, args.autocomplete_rate)
+    server, port = start_server(args.size, max(args.connections) + 1)
+    try:
+        # Load the index and autocomplete structures outside the timing
+        await run_round(port, 1, messages[:50], 1)
+        rows = [await run_round(port, connections, messages, args.window) for connections in args.connections]
+    finally:
+        server.terminate()
+        server.wait()
+    print(f"candidates~{args.size} messages/connection={args.messages} window={args.window} "
+          f"autocomplete_rate={args.autocomplete_rate}")
+    print_table(rows, list(rows[0]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--messages", type=int, default=100, help="messages sent by each connection")
+    parser.add_argument("--window", type=int, default=8, help="unanswered messages a connection keeps in flight")
+    parser.add_argument("--autocomplete-rate", type=float, default=0.5)
+    parser.add_argument("--size", type=int, default=10000, help="corpus size in candidates")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.size, args.port)
+    else:
+        asyncio.run(main(args))
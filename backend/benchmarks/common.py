@@ -0,0 +1,49 @@
+"""
+    Helpers shared by the benchmark scripts.
+
+    Run the benchmarks from the backend directory, e.g.
+    `python -m benchmarks.bench_async_db`, so the application modules import.
+"""
+import math
+import statistics
+import time
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def summarize(latencies_s, elapsed_s: float = None) -> dict:
+    """Latency summary in milliseconds plus throughput when the wall time is known"""
+    values = sorted(latency * 1000 for latency in latencies_s)
+    summary = {
+        "count": len(values),
+        "mean_ms": round(statistics.fmean(values), 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(values[-1], 3) if values else 0.0,
+    }
+    if elapsed_s:
+        summary["throughput_per_s"] = round(len(values) / elapsed_s, 1)
+    return summary
+
+def time_calls(func, args_list):
+    """Call func once per argument tuple and return the per-call latencies in seconds"""
+    latencies = []
+    for args in args_list:
+        started = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+def print_table(rows, columns):
+    """Print a list of dicts as an aligned text table"""
+    widths = {col: max(len(col), *(len(str(row.get(col, ""))) for row in rows)) for col in columns}
+    print("  ".join(col.ljust(widths[col]) for col in columns))
+    print("  ".join("-" * widths[col] for col in columns))
+    for row in rows:
+        print("  ".join(str(row.get(col, "")).ljust(widths[col]) for col in columns))
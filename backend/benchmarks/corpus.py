@@ -0,0 +1,120 @@
+"""
+    Synthetic FAQ corpora and kiosk queries for the benchmarks.
+
+    Everything is generated from a seed so runs are reproducible and need no
+    database or network.
+"""
+import random
+import string
+from types import SimpleNamespace
+
+PLACES = ["cashier", "registrar", "library", "clinic", "canteen", "gym", "chapel", "guidance office",
+          "scholarship office", "cpe department", "ece department", "dean's office", "president's office",
+          "cooperative office", "alumni office", "mic building", "engineering lab", "wellness building",
+          "old building", "main academic building", "parking area", "admission office", "it office"]
+ACTIONS = ["enroll in", "pay for", "request", "apply for", "claim", "replace", "drop", "add", "renew", "print"]
+THINGS = ["tuition", "my id", "transcript of records", "good moral certificate", "scholarship", "subjects",
+          "library card", "parking permit", "diploma", "form 137", "cor", "uniform", "locker", "wifi access"]
+EVENTS = ["enrollment", "intramurals", "graduation", "orientation", "midterm exams", "final exams",
+          "foundation day", "job fair", "org fair", "sem break", "class opening"]
+ROLES = ["dean", "chairperson", "registrar", "adviser", "president", "coordinator"]
+
+QUESTION_TEMPLATES = [
+    "Where is the {place}?",
+    "How do I {action} {thing}?",
+    "What time does the {place} open?",
+    "When is the {event}?",
+    "Who is the {role} of the {place}?",
+    "How much does it cost to {action} {thing}?",
+    "Where can I {action} {thing}?",
+    "What are the requirements to {action} {thing}?",
+]
+SYNONYM_TEMPLATES = [
+    "{place} location",
+    "where {place}",
+    "{action} {thing}",
+    "{event} schedule",
+    "{role} {place}",
+    "{thing} requirements",
+    "{thing} fee",
+]
+
+UNKNOWN_QUERIES = ["what is the weather today", "tell me a joke", "asdfgh", "who won the game last night",
+                   "recommend a movie", "how to cook adobo", "what is love", "play some music"]
+
+
+def _fill(template: str, rng: random.Random) -> str:
+    return template.format(place=rng.choice(PLACES), action=rng.choice(ACTIONS), thing=rng.choice(THINGS),
+                           event=rng.choice(EVENTS), role=rng.choice(ROLES))
+
+def _qualifier(i: int) -> str:
+    """A unique, pronounceable tag so large corpora keep distinct questions"""
+    syllables = ["ka", "lo", "mi", "ra", "te", "su", "no", "bi", "ge", "pa"]
+    word = ""
+    while True:
+        word += syllables[i % len(syllables)]
+        i //= len(syllables)
+        if i == 0:
+            return word
+
+def generate_faqs(candidates: int, synonyms_per_faq: int = 2, seed: int = 0) -> list:
+    """
+        FAQ-like records (id, question, synonyms, answer, isPinned) totalling
+        roughly `candidates` questions plus synonyms.
+    """
+    rng = random.Random(seed)
+    faqs = []
+    total = 0
+    seen = set()
+    while total < candidates:
+        faq_id = len(faqs) + 1
+        question = _fill(rng.choice(QUESTION_TEMPLATES), rng)
+        if question in seen:
+            question = f"{question[:-1]} {_qualifier(faq_id)}?"
+        seen.add(question)
+        synonym_count = min(rng.randint(0, synonyms_per_faq * 2), candidates - total - 1)
+        synonyms = [_fill(rng.choice(SYNONYM_TEMPLATES), rng) for _ in range(max(synonym_count, 0))]
+        faqs.append(SimpleNamespace(id=faq_id, question=question, synonyms=synonyms or None,
+                                    answer=f"Answer for FAQ {faq_id}.", isPinned=faq_id % 50 == 0, hit_count=0))
+        total += 1 + len(synonyms)
+    return faqs
+
+def add_typo(text: str, rng: random.Random) -> str:
+    """Delete, swap, replace or insert one letter, like a rushed kiosk user"""
+    if len(text) < 3:
+        return text
+    i = rng.randrange(1, len(text) - 1)
+    kind = rng.randrange(4)
+    if kind == 0:
+        return text[:i] + text[i + 1:]
+    if kind == 1:
+        return text[:i - 1] + text[i] + text[i - 1] + text[i + 1:]
+    letter = rng.choice(string.ascii_lowercase)
+    if kind == 2:
+        return text[:i] + letter + text[i + 1:]
+    return text[:i] + letter + text[i:]
+
+def generate_queries(faqs: list, count: int, typo_rate: float = 0.3, unknown_rate: float = 0.15,
+                     partial_rate: float = 0.15, seed: int = 1) -> list:
+    """
+        Kiosk queries as (query, expected FAQ id or None) pairs: verbatim
+        questions and synonyms, typo'd variants, partial questions and
+        off-topic questions.
+    """
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < unknown_rate:
+            queries.append((rng.choice(UNKNOWN_QUERIES), None))
+            continue
+        faq = rng.choice(faqs)
+        text = rng.choice([faq.question, *(faq.synonyms or [])])
+        roll = rng.random()
+        if roll < typo_rate:
+            text = add_typo(text.lower(), rng)
+        elif roll < typo_rate + partial_rate:
+            words = text.split()
+            text = " ".join(words[:max(1, len(words) - 2)])
+        queries.append((text, faq.id))
+    return queries
@@ -0,0 +1,404 @@
+"""
+    A local stand-in for the Gmail API, for running the mail code offline.
+
+    FakeMailbox keeps messages, threads, labels and a history log in memory
+    and answers the calls the app makes (messages send/list/get/modify/
+    batchModify, threads.get, history.list, profile). FakeGmail serves it over HTTP,
+    along with batch requests and an OAuth token endpoint, adding
+    `latency` seconds to every request. use_fake_gmail() points the app's
+    Gmail settings at a running server; it must run before otp is imported.
+"""
+import base64
+import email
+import email.parser
+import email.policy
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+API_PREFIX = "/gmail/v1/users/me/"
+BATCH_PATH = "/batch/gmail/v1"
+TOKEN_PATH = "/token"
+ADDRESS = "appointments@example.edu"
+# Gmail's documented quota units per call
+QUOTA_UNITS = {"messages.send": 100, "messages.list": 5, "messages.get": 5, "messages.modify": 5,
+               "messages.batchModify": 50, "threads.get": 10, "history.list": 2, "getProfile": 1}
+
+
+def encode(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+class FakeMailbox:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.messages = {}
+        self.threads = {}
+        self.history = []
+        self.history_id = 1000
+        # history.list before this returns 404, as Gmail does once history expires
+        self.oldest_history_id = 1000
+        self._ids = itertools.count(0x18f0000000000000)
+
+    def _new_id(self) -> str:
+        return format(next(self._ids), "x")
+
+    def _record(self, **changes) -> int:
+        self.history_id += 1
+        self.history.append({"id": self.history_id, **changes})
+        return self.history_id
+
+    def add_message(self, subject: str, body: str, sender: str = "student@example.edu", to: str = ADDRESS,
+                    thread_id: str = None, labels=("INBOX", "UNREAD")) -> dict:
+        """Deliver a plain-text message, to a new thread unless thread_id is given"""
+        with self.lock:
+            message_id = self._new_id()
+            thread_id = thread_id or message_id
+            message = {
+                "id": message_id,
+                "threadId": thread_id,
+                "labelIds": list(labels),
+                "snippet": body[:100],
+                "internalDate": str(int(time.time() * 1000)),
+                "payload": {
+                    "mimeType": "text/plain",
+                    "headers": [{"name": "Subject", "value": subject}, {"name": "From", "value": sender},
+                                {"name": "To", "value": to}],
+                    "body": {"size": len(body), "data": encode(body)},
+                },
+            }
+            self.messages[message_id] = message
+            self.threads.setdefault(thread_id, []).append(message_id)
+            message["historyId"] = str(self._record(messagesAdded=[{"message": self._minimal(message)}]))
+            return message
+
+    def reply(self, message_id: str, body: str, sender: str = None) -> dict:
+        """A reply in the thread of message_id, from its recipient unless sender is given"""
+        with self.lock:
+            original = self.messages[message_id]
+            headers = {header["name"]: header["value"] for header in original["payload"]["headers"]}
+            return self.add_message("Re: " + headers["Subject"], body, sender=sender or headers["To"],
+                                    to=headers["From"], thread_id=original["threadId"])
+
+    def load_thread(self, messages: list) -> str:
+        """
+            Deliver a recorded thread: Gmail message resources (labelIds,
+            snippet, payload) without ids, oldest first. Returns the thread id.
+        """
+        with self.lock:
+            thread_id = None
+            for recorded in messages:
+                message_id = self._new_id()
+                thread_id = thread_id or message_id
+                message = {**json.loads(json.dumps(recorded)), "id": message_id, "threadId": thread_id,
+                           "internalDate": str(int(time.time() * 1000))}
+                self.messages[message_id] = message
+                self.threads.setdefault(thread_id, []).append(message_id)
+                message["historyId"] = str(self._record(messagesAdded=[{"message": self._minimal(message)}]))
+            return thread_id
+
+    def send(self, raw: str, thread_id: str = None) -> dict:
+        parsed = email.message_from_bytes(base64.urlsafe_b64decode(raw), policy=email.policy.default)
+        part = parsed.get_body(("plain",)) if parsed.is_multipart() else parsed
+        message = self.add_message(parsed["Subject"] or "", part.get_content() if part else "", sender=ADDRESS,
+                                   to=parsed["To"] or "", thread_id=thread_id, labels=("SENT",))
+        return self._minimal(message)
+
+    def modify(self, message_id: str, add: list, remove: list) -> dict:
+        with self.lock:
+            message = self.messages[message_id]
+            added = [label for label in add if label not in message["labelIds"]]
+            removed = [label for label in remove if label in message["labelIds"]]
+            message["labelIds"] = [label for label in message["labelIds"] if label not in removed] + added
+            changes = {}
+            if added:
+                changes["labelsAdded"] = [{"message": self._minimal(message), "labelIds": added}]
+            if removed:
+                changes["labelsRemoved"] = [{"message": self._minimal(message), "labelIds": removed}]
+            if changes:
+                message["historyId"] = str(self._record(**changes))
+            return self._minimal(message)
+
+    def list(self, q: str = None, label_ids: list = None, max_results: int = 100, page_token: str = None) -> dict:
+        with self.lock:
+            found = [message for message in reversed(self.messages.values())
+                     if self._matches(message, q or "") and all(label in message["labelIds"] for label in label_ids or [])]
+        start = int(page_token or 0)
+        page = found[start:start + max_results]
+        result = {"messages": [{"id": m["id"], "threadId": m["threadId"]} for m in page],
+                  "resultSizeEstimate": len(found)}
+        if start + max_results < len(found):
+            result["nextPageToken"] = str(start + max_results)
+        if not page:
+            del result["messages"]
+        return result
+
+    def _matches(self, message: dict, q: str) -> bool:
+        subject = next((h["value"] for h in message["payload"]["headers"] if h["name"] == "Subject"), "")
+        for term in re.findall(r'subject:"[^"]*"|\S+', q):
+            if term.startswith("subject:"):
+                if term[9:-1].lower() not in subject.lower():
+                    return False
+            elif term == "is:unread" and "UNREAD" not in message["labelIds"]:
+                return False
+            elif term == "in:inbox" and "INBOX" not in message["labelIds"]:
+                return False
+        return True
+
+    def get(self, message_id: str, format: str = "full") -> dict:
+        with self.lock:
+            message = self.messages.get(message_id)
+            if message is None:
+                return None
+            if format == "minimal":
+                return self._minimal(message)
+            if format == "metadata":
+                return {**message, "payload": {**message["payload"], "body": {"size": 0}}}
+            return json.loads(json.dumps(message))
+
+    def thread(self, thread_id: str, format: str = "full") -> dict:
+        with self.lock:
+            ids = self.threads.get(thread_id)
+            if ids is None:
+                return None
+            messages = [self.get(message_id, format) for message_id in ids]
+            return {"id": thread_id, "historyId": messages[-1]["historyId"], "messages": messages}
+
+    def history_list(self, start_history_id: int, history_types: list = None, label_id: str = None,
+                     max_results: int = 100, page_token: str = None) -> dict:
+        with self.lock:
+            if start_history_id < self.oldest_history_id:
+                return None
+            keys = {"messageAdded": "messagesAdded", "labelAdded": "labelsAdded", "labelRemoved": "labelsRemoved"}
+            wanted = [keys[history_type] for history_type in history_types] if history_types else list(keys.values())
+            records = []
+            for record in self.history:
+                if record["id"] <= start_history_id:
+                    continue
+                changes = {key: [change for change in record.get(key, [])
+                                 if not label_id or label_id in change["message"]["labelIds"]]
+                           for key in wanted}
+                changes = {key: value for key, value in changes.items() if value}
+                if changes:
+                    messages = [change["message"] for value in changes.values() for change in value]
+                    records.append({"id": str(record["id"]), "messages": messages, **changes})
+            current = self.history_id
+        start = int(page_token or 0)
+        result = {"historyId": str(current)}
+        if records[start:start + max_results]:
+            result["history"] = records[start:start + max_results]
+        if start + max_results < len(records):
+            result["nextPageToken"] = str(start + max_results)
+        return result
+
+    def profile(self) -> dict:
+        with self.lock:
+            return {"emailAddress": ADDRESS, "messagesTotal": len(self.messages),
+                    "threadsTotal": len(self.threads), "historyId": str(self.history_id)}
+
+    def _minimal(self, message: dict) -> dict:
+        minimal = {"id": message["id"], "threadId": message["threadId"], "labelIds": list(message["labelIds"])}
+        if "historyId" in message:
+            minimal["historyId"] = message["historyId"]
+        return minimal
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class FakeGmail(ThreadingHTTPServer):
+    """
+        Serves a FakeMailbox on a free local port. Every fail_every'th send is
+        rejected with a 429; requests carrying a token in revoked_tokens get
+        a 401, and POST /token hands out fresh ones. With quota_rate, calls
+        past that many QUOTA_UNITS per second are refused with a 429, as
+        Gmail does per user.
+    """
+    daemon_threads = True
+
+    def __init__(self, mailbox: FakeMailbox = None, latency: float = 0.0, fail_every: int = 0,
+                 quota_rate: float = 0):
+        super().__init__(("127.0.0.1", 0), FakeGmailHandler)
+        self.mailbox = mailbox or FakeMailbox()
+        self.latency = latency
+        self.fail_every = fail_every
+        self.revoked_tokens = set()
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.calls = {}
+        self.sends = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.tokens_issued = 0
+        self.quota_rate = quota_rate
+        self.quota_tokens = quota_rate
+        self.quota_updated = time.monotonic()
+        self.throttled = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def start(self) -> "FakeGmail":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def count(self, call: str):
+        with self.lock:
+            self.calls[call] = self.calls.get(call, 0) + 1
+            if self.quota_rate:
+                now = time.monotonic()
+                self.quota_tokens = min(self.quota_rate,
+                                        self.quota_tokens + (now - self.quota_updated) * self.quota_rate)
+                self.quota_updated = now
+                if self.quota_tokens < QUOTA_UNITS[call]:
+                    self.throttled += 1
+                    raise QuotaExceeded()
+                self.quota_tokens -= QUOTA_UNITS[call]
+
+    def call(self, method: str, path: str, query: dict, body: bytes) -> tuple:
+        """(status, JSON reply) for one API call"""
+        try:
+            return self._call(method, path, query, body)
+        except QuotaExceeded:
+            return 429, {"error": {"code": 429, "message": "User-rate limit exceeded.",
+                                   "errors": [{"reason": "rateLimitExceeded"}]}}
+
+    def _call(self, method: str, path: str, query: dict, body: bytes) -> tuple:
+        mailbox = self.mailbox
+        param = lambda name, default=None: query.get(name, [default])[0]
+        parts = path[len(API_PREFIX):].split("/")
+        if method == "POST" and parts == ["messages", "send"]:
+            self.count("messages.send")
+            request = json.loads(body)
+            with self.lock:
+                self.sends += 1
+                rejected = self.fail_every and self.sends % self.fail_every == 0
+                if rejected:
+                    self.rejected += 1
+                else:
+                    self.accepted += 1
+            if rejected:
+                return 429, {"error": {"code": 429, "message": "Rate Limit Exceeded",
+                                       "errors": [{"reason": "rateLimitExceeded"}]}}
+            return 200, mailbox.send(request["raw"], request.get("threadId"))
+        if method == "GET" and parts == ["messages"]:
+            self.count("messages.list")
+            return 200, mailbox.list(param("q"), query.get("labelIds"), int(param("maxResults", 100)),
+                                     param("pageToken"))
+        if method == "GET" and len(parts) == 2 and parts[0] == "messages":
+            self.count("messages.get")
+            message = mailbox.get(parts[1], param("format", "full"))
+            return (200, message) if message else (404, {"error": {"code": 404, "message": "Not Found"}})
+        if method == "POST" and len(parts) == 3 and parts[0] == "messages" and parts[2] == "modify":
+            self.count("messages.modify")
+            request = json.loads(body or b"{}")
+            if parts[1] not in mailbox.messages:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            return 200, mailbox.modify(parts[1], request.get("addLabelIds", []), request.get("removeLabelIds", []))
+        if method == "POST" and parts == ["messages", "batchModify"]:
+            self.count("messages.batchModify")
+            request = json.loads(body)
+            for message_id in request["ids"]:
+                if message_id in mailbox.messages:
+                    mailbox.modify(message_id, request.get("addLabelIds", []), request.get("removeLabelIds", []))
+            return 204, None
+        if method == "GET" and len(parts) == 2 and parts[0] == "threads":
+            self.count("threads.get")
+            thread = mailbox.thread(parts[1], param("format", "full"))
+            return (200, thread) if thread else (404, {"error": {"code": 404, "message": "Not Found"}})
+        if method == "GET" and parts == ["history"]:
+            self.count("history.list")
+            history = mailbox.history_list(int(param("startHistoryId")), query.get("historyTypes"),
+                                           param("labelId"), int(param("maxResults", 100)), param("pageToken"))
+            return (200, history) if history else (404, {"error": {"code": 404, "message": "Requested entity was not found."}})
+        if method == "GET" and parts == ["profile"]:
+            self.count("getProfile")
+            return 200, mailbox.profile()
+        return 404, {"error": {"code": 404, "message": f"no fake for {method} {path}"}}
+
+
+class FakeGmailHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Without these, headers and body go out as separate packets and
+    # delayed ACKs add ~40 ms to every keep-alive request
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def handle_request(self, method: str):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with server.lock:
+            server.requests += 1
+        time.sleep(server.latency)
+        url = urlsplit(self.path)
+        if url.path == TOKEN_PATH:
+            with server.lock:
+                server.tokens_issued += 1
+                token = f"fake-access-token-{server.tokens_issued}"
+            return self.reply(200, "application/json", json.dumps({"access_token": token, "expires_in": 3600,
+                                                                   "token_type": "Bearer"}).encode())
+        if self.headers.get("Authorization", "").removeprefix("Bearer ") in server.revoked_tokens:
+            return self.reply(401, "application/json", b'{"error": {"code": 401, "message": "Invalid Credentials"}}')
+        if url.path == BATCH_PATH:
+            return self.reply_batch(body)
+        status, reply = server.call(method, url.path, parse_qs(url.query), body)
+        self.reply(status, "application/json", json.dumps(reply).encode() if reply is not None else b"")
+
+    def reply_batch(self, body: bytes):
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+        batch = email.parser.BytesParser().parsebytes(header + body)
+        boundary = uuid.uuid4().hex
+        parts = []
+        for part in batch.get_payload():
+            # Each part is a whole HTTP request: request line, headers, JSON body
+            request_line, inner = part.get_payload().split("\n", 1)
+            method, target, _ = request_line.split(" ", 2)
+            target = urlsplit(target)
+            inner_body = email.parser.Parser().parsestr(inner).get_payload().encode()
+            status, reply = self.server.call(method, target.path, parse_qs(target.query), inner_body)
+            parts.append(f"--{boundary}\r\nContent-Type: application/http\r\n"
+                         f"Content-ID: <response-{part['Content-ID'][1:]}\r\n\r\n"
+                         f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                         f"Content-Type: application/json; charset=UTF-8\r\n\r\n{json.dumps(reply)}\r\n")
+        self.reply(200, f"multipart/mixed; boundary={boundary}", ("".join(parts) + f"--{boundary}--\r\n").encode())
+
+    def reply(self, status: int, content_type: str, content: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def use_fake_gmail(server: FakeGmail, directory: str, token: str = "fake-access-token"):
+    """Point the Gmail settings at the fake server; must run before otp is imported"""
+    token_file = os.path.join(directory, "token.json")
+    with open(token_file, "w") as f:
+        json.dump({"token": token, "refresh_token": "fake-refresh-token", "client_id": "fake-client",
+                   "client_secret": "fake-secret", "expiry": "2099-01-01T00:00:00Z"}, f)
+    os.environ["GMAIL_TOKEN_FILE"] = token_file
+    os.environ["GMAIL_TOKEN_URI"] = server.url.rstrip("/") + TOKEN_PATH
+    os.environ["GMAIL_API_ENDPOINT"] = server.url
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import os
+
+from fastapi import WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
+
+logger = logging.getLogger(__name__)
+
+# Seconds without a message from the kiosk before the connection is closed
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "300"))
+# Messages read ahead of the one being answered; past this the socket is not
+# read, so a kiosk pipelining faster than it is served slows down
+WS_MAX_PENDING = int(os.getenv("WS_MAX_PENDING", "32"))
+# Replies and pushes waiting to be written; pushes are dropped when full
+WS_MAX_OUTBOUND = int(os.getenv("WS_MAX_OUTBOUND", "64"))
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "1000"))
+WS_MAX_MESSAGE_BYTES = 4096
+# Seconds between FAQ version checks while kiosks are connected; 0 disables
+WS_FAQ_POLL_INTERVAL = float(os.getenv("WS_FAQ_POLL_INTERVAL", "30"))
+
+# Close codes
+IDLE_CLOSE = 4000
+TRY_AGAIN_LATER = 1013
+
+
+class SocketConnection:
+    """
+        One kiosk's WebSocket. A reader, a processor and a writer task are
+        joined by two bounded queues, so a kiosk can pipeline questions
+        while the server answers them in order.
+    """
+
+    def __init__(self, hub: "ChatHub", websocket: WebSocket, db=None):
+        self.hub = hub
+        self.websocket = websocket
+        # Session for the handler, which releases its connection after each message
+        self.db = db
+        self.inbound = asyncio.Queue(maxsize=hub.max_pending)
+        self.outbound = asyncio.Queue(maxsize=hub.max_outbound)
+        # (message id, query, outcome) of the last question answered without
+        # an FAQ match, re-checked when the FAQs change
+        self.unresolved = None
+        self.received = 0
+        self.sent = 0
+        self.dropped = 0
+
+    async def run(self):
+        tasks = [asyncio.create_task(self._read()), asyncio.create_task(self._process()),
+                 asyncio.create_task(self._write())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def send(self, message: dict):
+        """Queue a reply, waiting for room"""
+        await self.outbound.put(message)
+
+    def push(self, message: dict) -> bool:
+        """Queue a server push unless the kiosk is too far behind to take it"""
+        try:
+            self.outbound.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def _read(self):
+        while True:
+            try:
+                text = await asyncio.wait_for(self.websocket.receive_text(), self.hub.idle_timeout)
+            except asyncio.TimeoutError:
+                await self.close(IDLE_CLOSE, "idle timeout")
+                return
+            except (WebSocketDisconnect, RuntimeError):
+                return
+            self.received += 1
+            self.hub.received += 1
+            try:
+                if len(text) > WS_MAX_MESSAGE_BYTES:
+                    raise ValueError("message too large")
+                message = json.loads(text)
+                if not isinstance(message, dict):
+                    raise ValueError("expected a JSON object")
+            except ValueError as e:
+                await self.send({"type": "error", "detail": str(e)})
+                continue
+            # Blocks while the kiosk is WS_MAX_PENDING messages ahead
+            await self.inbound.put(message)
+
+    async def _process(self):
+        while True:
+            message = await self.inbound.get()
+            try:
+                reply = await self.hub.handler(self, message)
+            except Exception as e:
+                logger.exception("WebSocket message failed")
+                reply = {"type": "error", "id": message.get("id"), "detail": str(e)}
+            if reply is not None:
+                await self.send(reply)
+
+    async def _write(self):
+        while True:
+            message = await self.outbound.get()
+            try:
+                await self.websocket.send_json(message)
+            except (WebSocketDisconnect, RuntimeError):
+                return
+            self.sent += 1
+            self.hub.sent += 1
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        if self.websocket.application_state == WebSocketState.CONNECTED:
+            try:
+                await self.websocket.close(code=code, reason=reason)
+            except (WebSocketDisconnect, RuntimeError):
+                pass   # the kiosk went first
+
+
+class ChatHub:
+    """
+        Tracks this worker's kiosk WebSockets and pushes FAQ changes to them.
+
+        handler(connection, message) answers one message and returns the
+        reply (or None). While kiosks are connected the hub polls
+        version_source() every poll_interval seconds, and right away after
+        poke(); when the version moves, on_change(version, connections)
+        runs to push updates to them.
+    """
+
+    def __init__(self, handler, version_source=None, on_change=None, idle_timeout: float = WS_IDLE_TIMEOUT,
+                 max_pending: int = WS_MAX_PENDING, max_outbound: int = WS_MAX_OUTBOUND,
+                 max_connections: int = WS_MAX_CONNECTIONS, poll_interval: float = WS_FAQ_POLL_INTERVAL):
+        self.handler = handler
+        self.version_source = version_source
+        self.on_change = on_change
+        self.idle_timeout = idle_timeout
+        self.max_pending = max_pending
+        self.max_outbound = max_outbound
+        self.max_connections = max_connections
+        self.poll_interval = poll_interval
+        self.connections = set()
+        self.faq_version = None
+        self._wakeup = asyncio.Event()
+        self._watcher = None
+        self.accepted = 0
+        self.rejected = 0
+        self.received = 0
+        self.sent = 0
+        self.pushes = 0
+
+    async def serve(self, websocket: WebSocket, db=None):
+        if len(self.connections) >= self.max_connections:
+            self.rejected += 1
+            await websocket.close(code=TRY_AGAIN_LATER, reason="too many connections")
+            return
+        await websocket.accept()
+        connection = SocketConnection(self, websocket, db)
+        self.connections.add(connection)
+        self.accepted += 1
+        self._start_watcher()
+        try:
+            await connection.run()
+        finally:
+            self.connections.discard(connection)
+            await connection.close()
+            if not self.connections:
+                self.poke()   # lets the watcher see there is no one left to watch for
+
+    def poke(self):
+        """Check the FAQ version now instead of at the next poll"""
+        self._wakeup.set()
+
+    def push_all(self, message: dict):
+        for connection in list(self.connections):
+            if connection.push(message):
+                self.pushes += 1
+
+    def _start_watcher(self):
+        if self.version_source is None or (self._watcher is not None and not self._watcher.done()):
+            return
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        while self.connections:
+            # Cleared before reading the version, so a poke() during the
+            # check below triggers another check rather than being lost
+            self._wakeup.clear()
+            try:
+                version = await self.version_source()
+                if self.faq_version is None:
+                    self.faq_version = version
+                elif version != self.faq_version:
+                    self.faq_version = version
+                    await self.on_change(version, list(self.connections))
+            except Exception as e:
+                logger.error("FAQ version check failed: %s", e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval if self.poll_interval > 0 else None)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.connections),
+            "max_connections": self.max_connections,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "received": self.received,
+            "sent": self.sent,
+            "pushes": self.pushes,
+            "dropped_pushes": sum(connection.dropped for connection in self.connections),
+            "pending": sum(connection.inbound.qsize() for connection in self.connections),
+            "faq_version": self.faq_version,
+        }
@@ -1,24 +1,72 @@
+import csv
+import gzip
+import heapq
 import logging
-from typing import List
+from collections import Counter
+from typing import List, Literal
 import anyio
 import os
-import string
 from sqlalchemy.orm import Session
-from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile, WebSocket
+from fastapi.responses import StreamingResponse
+import numpy as np
 from rapidfuzz import fuzz, process
-from google import genai
 from auth import read_users_me
-from database import get_db
+from chatSocket import ChatHub, SocketConnection
+from database import async_db_dependency, create_async_session, get_db
+from faqBulk import FORMATS as FAQ_FILE_FORMATS, export_faqs, import_faqs
+from faqAutocomplete import AUTOCOMPLETE_MAX_LIMIT, FAQAutocomplete
+from fallbackProvider import FallbackAnswerer, get_fallback_provider
+from faqHits import faq_hits
+from faqIndex import as_faq_index, get_faq_index, invalidate_faq_index, normalize, set_faq_version_source
+from faqSnapshot import current_faq_version, get_faq_delta, get_faq_snapshot, snapshot_etag
+from faqRanker import BM25Ranker, bm25_candidate_ids
+from faqTrigram import get_trigram_index, set_faq_synonyms
+from responseCache import ResponseCache
+from unknownQueries import unknown_queries
 from models import FAQ, UserFAQ
 import random
-from schemas import FAQCreate, FAQOut, FAQUpdate, QueryRequest, QueryResponse, StarFAQ, UserBase
-from sqlalchemy import desc
+from schemas import AutocompleteResponse, BatchQueryRequest, BatchQueryResponse, BatchQueryResult, FAQCreate, FAQImportResult, FAQOut, FAQUpdate, QueryRequest, QueryResponse, StarFAQ, UserBase, UserFAQOut
+from sqlalchemy import desc, func, select
 
 router = APIRouter(prefix="/ray", tags=["ray"])
-# client = genai.Client(api_key=os.getenv("GEMINI_API"))
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+CLARIFICATION_TEXT = "I couldn't clearly understand your question. Did you mean one of the following?"
+MAX_BATCH_QUERIES = int(os.getenv("CHAT_BATCH_MAX_QUERIES", "500"))
+MAX_USER_FAQ_PAGE_SIZE = 500
+# rapidfuzz cdist worker threads for batch matching; -1 uses every core
+BATCH_MATCH_WORKERS = int(os.getenv("CHAT_BATCH_WORKERS", "-1"))
+# Queries scored per cdist call, bounding the score matrix for large corpora
+BATCH_MATCH_CHUNK = 64
+
+# "memory" matches against this worker's FAQIndex; "postgres" lets pg_trgm
+# shortlist the FAQs per query, for corpora too large to hold in every worker
+FAQ_MATCH_BACKEND = os.getenv("FAQ_MATCH_BACKEND", "memory").lower()
+
+# BM25 shortlists this many FAQs for fuzzy matching once the index has at
+# least BM25_MIN_CANDIDATES candidates; 0 disables the shortlist
+BM25_SHORTLIST = int(os.getenv("FAQ_BM25_SHORTLIST", "25"))
+BM25_MIN_CANDIDATES = int(os.getenv("FAQ_BM25_MIN_CANDIDATES", "1000"))
+
+# Most asked FAQs whose answers are cached when a worker starts; 0 only loads the index
+CHAT_CACHE_WARM_FAQS = int(os.getenv("CHAT_CACHE_WARM_FAQS", "100"))
+
+# A stale FAQ index reloads the FAQs only when the snapshot version moved
+set_faq_version_source(current_faq_version)
+
+faq_ranker = BM25Ranker()
+faq_autocomplete = FAQAutocomplete()
+
+chat_cache = ResponseCache(maxsize=int(os.getenv("CHAT_CACHE_SIZE", "1024")),
+                           ttl=float(os.getenv("CHAT_CACHE_TTL", "300")))
+
+# Generated answers for questions the FAQs don't cover; disabled unless
+# CHAT_FALLBACK_PROVIDER is set
+fallback_answerer = FallbackAnswerer(get_fallback_provider())
+
 FALLBACK_RESPONSES = [
     "Oops! I can only chat about RTU. Got any questions about that? I'd love to help!",
     "I'm not sure I understand. Could you ask me something about RTU?",
@@ -40,35 +88,217 @@ async def delete_user_faq(faq_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/chat", response_model=QueryResponse)
-async def chat(query_request: QueryRequest, db: Session = Depends(get_db)):
+async def chat(query_request: QueryRequest, db: async_db_dependency):
     query = query_request.query
     logger.info("Received query: %s", query)
-    faqs = get_all_faqs(db)
-    
+    response, _ = await answer_chat(query, db)
+    return response
+
+async def answer_chat(query: str, db: AsyncSession, record: bool = True):
+    """
+        The chat response for a query and its outcome, as served by /ray/chat
+        and the WebSocket: match, suggestions, unknown or generated.
+        record=False re-asks without counting the query again, as an unknown
+        query or as a hit on the FAQ it matched.
+    """
+    if FAQ_MATCH_BACKEND == "postgres":
+        # No local index version to key on; edits in this worker clear the cache
+        # and the TTL bounds staleness from edits elsewhere.
+        response, outcome, faq_id = await chat_cache.get_or_compute(("postgres", normalize(query)), lambda: answer_query_trigram(query, db))
+    else:
+        index = await get_faq_index(db)
+
+        # Repeated questions are served from the cache. The key includes the FAQ
+        # content version, so answers computed before an FAQ edit are never
+        # returned, while an index reloaded with no edit keeps its answers.
+        response, outcome, faq_id = await chat_cache.get_or_compute((index.content_version, normalize(query)), lambda: answer_query(query, index))
+
+    # Counted on cache hits too, so the counts reflect how often it was asked
+    if record:
+        if outcome == "match":
+            faq_hits.record(faq_id)
+        elif outcome == "unknown":
+            unknown_queries.record(query)
+
+    # Without an FAQ match, try the generative fallback. If it has nothing
+    # within its latency budget the suggestions (or canned reply) go out as is.
+    if outcome != "match" and fallback_answerer.enabled:
+        generated = await fallback_answerer.answer(query)
+        if generated:
+            return QueryResponse(response=generated, suggestions=response.suggestions), "generated"
+    return response, outcome
+
+async def warm_chat_cache(limit: int = CHAT_CACHE_WARM_FAQS) -> int:
+    """
+        Load the FAQ index and cache the answers to the `limit` most asked
+        FAQs' questions and synonyms, so a new worker's first kiosks don't
+        pay for the index, the BM25 ranker or the autocomplete build.
+        Returns the number of answers cached.
+    """
+    async with create_async_session() as db:
+        index = await get_faq_index(db)
+        top = (await db.scalars(select(FAQ.id).where(FAQ.hit_count > 0)
+                                .order_by(desc(FAQ.hit_count)).limit(limit))).all() if limit > 0 else []
+    await anyio.to_thread.run_sync(faq_autocomplete.sync, index)
+    if FAQ_MATCH_BACKEND != "memory":
+        return 0
+
+    positions = {faq_id: position for position, faq_id in enumerate(index.faq_ids)}
+    warmed = 0
+    for faq_id in top:
+        position = positions.get(faq_id)
+        if position is None:
+            continue
+        for candidate_id in index.candidates_of(position):
+            text = index.candidate_texts[candidate_id]   # already normalized
+            await chat_cache.get_or_compute((index.content_version, text), lambda text=text: answer_query(text, index))
+            warmed += 1
+    return warmed
+
+async def answer_query_trigram(query: str, db: AsyncSession):
+    # Postgres returns the closest FAQs; fuzz.ratio and Jaccard re-rank them as usual.
+    return await answer_query(query, await get_trigram_index(db, query))
+
+async def answer_query(query: str, index):
+    """
+        The FAQ response for a query, its outcome (match, suggestions or
+        unknown) and the id of the FAQ that answered it, if any
+    """
     # Try to find an FAQ answer if there is a clear match.
-    answer = match_faq(query, faqs)
-    if answer:
+    candidate_id = match_faq_candidate(query, index, candidate_ids=bm25_shortlist(query, index))
+    if candidate_id is not None:
         logger.info("FAQ match found.")
-        return QueryResponse(response=answer)
+        return QueryResponse(response=index.answer_for(candidate_id)), "match", index.faq_ids[index.candidate_faq[candidate_id]]
     
     # Otherwise, look for ambiguous suggestions.
-    suggestions = get_faq_suggestions_by_words(query, faqs)
+    suggestions = get_faq_suggestions_by_words(query, index)
     if suggestions:
         logger.info("Sending suggestions for fallback response.")
-        clarification_text = "I couldn't clearly understand your question. Did you mean one of the following?"
-        return QueryResponse(response=clarification_text, suggestions=suggestions)
+        return QueryResponse(response=CLARIFICATION_TEXT, suggestions=suggestions), "suggestions", None
     
-    add_unknown_faq(query, db)
-    return QueryResponse(response=random.choice(FALLBACK_RESPONSES))
-
-    # Fallback: Call Gemini API if no suggestions are found.
-    # try:
-    #     logger.info("Calling Google Gemini API for fallback response.")
-    #     gemini_response = await get_gemini_response(query)
-    #     return QueryResponse(response=gemini_response)
-    # except Exception as e:
-    #     logger.error("Gemini API error: %s", str(e))
-    #     raise HTTPException(status_code=500, detail="Gemini API call failed: " + str(e))
+    return QueryResponse(response=random.choice(FALLBACK_RESPONSES)), "unknown", None
+
+@router.post("/chat/batch", response_model=BatchQueryResponse)
+async def chat_batch(batch: BatchQueryRequest, db: async_db_dependency):
+    """
+        Answer many questions in one call, e.g. questions a kiosk queued while
+        offline, or a replay set for tuning the match threshold.
+    """
+    if len(batch.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+    index = await get_faq_index(db)
+    # Matching and suggestions both run off the event loop, so a large batch
+    # doesn't hold up the worker's other requests
+    answers = await anyio.to_thread.run_sync(answer_faq_batch, batch.queries, index, batch.threshold)
+
+    results = []
+    for query, (match, suggestions) in zip(batch.queries, answers):
+        if match:
+            candidate_id, score = match
+            if batch.record:
+                faq_hits.record(index.faq_ids[index.candidate_faq[candidate_id]])
+            results.append(BatchQueryResult(query=query, response=index.answer_for(candidate_id),
+                                            matched_question=index.question_for(candidate_id), score=score))
+            continue
+        if suggestions:
+            results.append(BatchQueryResult(query=query, response=CLARIFICATION_TEXT, suggestions=suggestions))
+            continue
+        if batch.record:
+            unknown_queries.record(query)
+        results.append(BatchQueryResult(query=query, response=random.choice(FALLBACK_RESPONSES)))
+
+    return BatchQueryResponse(results=results)
+
+def answer_faq_batch(queries: List[str], index, threshold: float) -> list:
+    """Per query, its match_faq_batch match and, when it has none, its word suggestions"""
+    matches = match_faq_batch(queries, index, threshold)
+    return [(match, None if match else get_faq_suggestions_by_words(query, index))
+            for query, match in zip(queries, matches)]
+
+@router.get("/autocomplete", response_model=AutocompleteResponse)
+async def autocomplete(db: async_db_dependency, q: str = Query("", max_length=200),
+                       limit: int = Query(5, ge=1, le=AUTOCOMPLETE_MAX_LIMIT)):
+    """
+        FAQ questions for what the user has typed so far, sent on every
+        keystroke. Sending the chosen question to /ray/chat is an exact match.
+    """
+    return AutocompleteResponse(query=q, suggestions=await complete_faqs(q, limit, db))
+
+async def complete_faqs(text: str, limit: int, db: AsyncSession) -> List[str]:
+    index = await get_faq_index(db)
+    if not faq_autocomplete.is_synced(index):
+        # Rebuilt after an FAQ change; off the event loop so other requests keep flowing
+        await anyio.to_thread.run_sync(faq_autocomplete.sync, index)
+    return faq_autocomplete.complete(text, limit)
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket, db: async_db_dependency):
+    """
+        One connection per kiosk session. Messages are JSON objects answered
+        in order, so a kiosk may send several before the first reply:
+
+            {"type": "chat", "id": 1, "query": "..."}
+            {"type": "autocomplete", "id": 2, "q": "...", "limit": 5}
+            {"type": "ping", "id": 3}
+
+        Replies carry the same type and id. When the FAQs change the server
+        pushes {"type": "faqs_changed", "version": n}, and re-answers the
+        kiosk's last unmatched question, pushing it again with "update": true
+        if the outcome changed.
+    """
+    await chat_hub.serve(websocket, db)
+
+async def handle_socket_message(connection: SocketConnection, message: dict):
+    kind = message.get("type", "chat")
+    message_id = message.get("id")
+    try:
+        if kind == "chat":
+            query = message.get("query")
+            if not isinstance(query, str) or not query.strip():
+                return {"type": "error", "id": message_id, "detail": "query must be a non-empty string"}
+            response, outcome = await answer_chat(query, connection.db)
+            connection.unresolved = None if outcome == "match" else (message_id, query, outcome)
+            return {"type": "chat", "id": message_id, "outcome": outcome, **response.model_dump()}
+        if kind == "autocomplete":
+            text = message.get("q", "")
+            limit = message.get("limit", 5)
+            if not isinstance(text, str) or len(text) > 200:
+                return {"type": "error", "id": message_id, "detail": "q must be a string of at most 200 characters"}
+            if not isinstance(limit, int) or not 1 <= limit <= AUTOCOMPLETE_MAX_LIMIT:
+                return {"type": "error", "id": message_id, "detail": f"limit must be 1 to {AUTOCOMPLETE_MAX_LIMIT}"}
+            return {"type": "autocomplete", "id": message_id, "query": text,
+                    "suggestions": await complete_faqs(text, limit, connection.db)}
+        if kind == "ping":
+            return {"type": "pong", "id": message_id}
+        return {"type": "error", "id": message_id, "detail": f"unknown message type {kind!r}"}
+    finally:
+        # Hand the pooled connection back between messages; an idle kiosk holds none
+        await connection.db.close()
+
+async def socket_faq_version():
+    async with create_async_session() as db:
+        return await current_faq_version(db)
+
+async def on_socket_faqs_changed(version: int, connections: list):
+    """Tell connected kiosks the FAQs changed and re-answer their unmatched questions"""
+    # The edit may have come from another worker, whose faqs_changed() only cleared its own caches
+    invalidate_faq_index()
+    chat_cache.clear()
+    chat_hub.push_all({"type": "faqs_changed", "version": version})
+    async with create_async_session() as db:
+        for connection in connections:
+            if connection.unresolved is None:
+                continue
+            message_id, query, outcome = connection.unresolved
+            response, new_outcome = await answer_chat(query, db, record=False)
+            if new_outcome == outcome:
+                continue
+            connection.unresolved = None if new_outcome == "match" else (message_id, query, new_outcome)
+            if connection.push({"type": "chat", "id": message_id, "outcome": new_outcome, "update": True,
+                                **response.model_dump()}):
+                chat_hub.pushes += 1
+
+chat_hub = ChatHub(handle_socket_message, version_source=socket_faq_version, on_change=on_socket_faqs_changed)
 
 @router.get("/faqs", response_model=List[FAQOut])
 async def read_faqs(db: Session = Depends(get_db)):
@@ -80,16 +310,74 @@ async def read_faqs(db: Session = Depends(get_db)):
             synonyms=faq.synonyms if isinstance(faq.synonyms, list) else ([] if faq.synonyms is None else [faq.synonyms]),
             question=faq.question,
             answer=faq.answer,
-            isPinned=faq.isPinned
+            isPinned=faq.isPinned,
+            hit_count=faq.hit_count
         ) for faq in result
     ]
 
+@router.get("/faqs/snapshot")
+async def faq_snapshot(request: Request, db: async_db_dependency):
+    """
+        Every FAQ with its normalized question and synonyms, for kiosks that
+        match locally. Gzipped, with the FAQ version as ETag so an unchanged
+        corpus costs a 304. Keep it current with /ray/faqs/delta.
+    """
+    version = await current_faq_version(db)
+    etag = snapshot_etag(version)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    body = await get_faq_snapshot(db, version)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(body, media_type="application/json", headers={**headers, "Content-Encoding": "gzip"})
+    return Response(gzip.decompress(body), media_type="application/json", headers=headers)
+
+@router.get("/faqs/delta")
+async def faq_delta(db: async_db_dependency, since: int = Query(..., ge=0)):
+    """FAQs added or changed and ids deleted since a snapshot or delta version"""
+    version = await current_faq_version(db)
+    if since > version:
+        raise HTTPException(status_code=409, detail="Unknown FAQ version, fetch a new snapshot")
+    return await get_faq_delta(db, since, version)
+
+@router.post("/faqs/import", response_model=FAQImportResult)
+async def import_faq_file(file: UploadFile = File(...), format: Literal["csv", "jsonl"] = Query(None),
+                          dry_run: bool = False, db: Session = Depends(get_db),
+                          current_user: UserBase = Depends(read_users_me)):
+    """
+        Add FAQs from a CSV or JSONL file (the format of /ray/faqs/export;
+        CSV synonyms are |-separated). The format is taken from the file
+        name unless given. Invalid and duplicate rows are skipped and
+        reported; dry_run validates without writing.
+    """
+    fmt = format or os.path.splitext(file.filename or "")[1].lstrip(".").lower()
+    if fmt not in FAQ_FILE_FORMATS:
+        raise HTTPException(status_code=400, detail="Upload a .csv or .jsonl file or pass format")
+    try:
+        # Parsing and inserting are blocking; a large file must not stall the event loop
+        result = await anyio.to_thread.run_sync(import_faqs, db, file.file, fmt, dry_run)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Could not read the file: {e}")
+    logger.info("Imported %d of %d FAQ rows in %.2fs", result["inserted"], result["rows"], result["seconds"])
+    if result["inserted"] and not dry_run:
+        faqs_changed()
+    return result
+
+@router.get("/faqs/export")
+async def export_faq_file(format: Literal["csv", "jsonl"] = "csv", current_user: UserBase = Depends(read_users_me)):
+    """Every FAQ as CSV or JSONL, streamed"""
+    return StreamingResponse(export_faqs(format), media_type=FAQ_FILE_FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="faqs.{format}"'})
+
 @router.post("/faqs", response_model=FAQCreate)
 async def add_faq(faq: FAQCreate, db: Session = Depends(get_db), current_user: UserBase = Depends(read_users_me)):
     existing = get_faq_by_question(db, faq.question)
     if existing:
         raise HTTPException(status_code=400, detail="FAQ with that question already exists")
     new_faq = create_faq(db, faq)
+    faqs_changed()
     return new_faq
 
 @router.put("/faqs", response_model=FAQOut)
@@ -100,14 +388,17 @@ async def update_faq(params: FAQUpdate, db: Session = Depends(get_db)):
     existing.question = params.question
     existing.synonyms = params.synonyms
     existing.answer = params.answer
+    set_faq_synonyms(db, existing)
     db.commit()
     db.refresh(existing)
+    faqs_changed()
     return existing
 
 @router.delete("/faqs/{faq_id}")
 async def delete_faq(faq_id: int, db: Session = Depends(get_db), current_user: UserBase = Depends(read_users_me)):
     faq = db.query(FAQ).filter(FAQ.id == faq_id).delete()
     db.commit()
+    faqs_changed()
     return {"message": f"Deleted FAQ with ID {faq_id}"}
 
 @router.put("/start-faq")
@@ -118,16 +409,45 @@ async def starFAQ(id: StarFAQ, db: Session = Depends(get_db), current_user: User
 
     db.commit()
     db.refresh(faq)
+    faqs_changed()
 
     return {"message": f"test"}
 
-@router.get("/user-faqs")
-async def get_all_user_faqs(db: Session = Depends(get_db), current_user: UserBase = Depends(read_users_me)):
-    user_faqs = db.query(UserFAQ).all()
-    return [faq for faq in user_faqs]
+@router.get("/cache-stats")
+async def get_cache_stats(current_user: UserBase = Depends(read_users_me)):
+    """Chat response cache counters for this worker"""
+    return {"pid": os.getpid(), **chat_cache.stats(), "unknown_queries": unknown_queries.stats(),
+            "faq_hits": faq_hits.stats(), "fallback": fallback_answerer.stats(), "autocomplete": faq_autocomplete.stats(),
+            "websocket": chat_hub.stats()}
+
+@router.get("/user-faqs", response_model=List[UserFAQOut])
+async def get_all_user_faqs(response: Response, db: async_db_dependency,
+                            page: int = Query(1, ge=1),
+                            page_size: int = Query(100, ge=1, le=MAX_USER_FAQ_PAGE_SIZE),
+                            sort: Literal["frequency", "recent"] = "frequency",
+                            current_user: UserBase = Depends(read_users_me)):
+    """
+        One page of unknown questions, most asked (or most recently asked)
+        first. The total row count is returned in the X-Total-Count header.
+    """
+    if sort == "frequency":
+        order = (desc(UserFAQ.count), desc(UserFAQ.last_seen), UserFAQ.id)
+    else:
+        order = (desc(UserFAQ.last_seen), UserFAQ.id)
+    total = await db.scalar(select(func.count()).select_from(UserFAQ))
+    result = await db.execute(select(UserFAQ).order_by(*order).offset((page - 1) * page_size).limit(page_size))
+    response.headers["X-Total-Count"] = str(total)
+    return result.scalars().all()
+
+def faqs_changed():
+    """Drop everything derived from the FAQ table. Call after any FAQ edit."""
+    invalidate_faq_index()
+    chat_cache.clear()
+    # Connected kiosks hear about it now rather than at the next version poll
+    chat_hub.poke()
 
 def get_all_faqs(db: Session):
-    return db.query(FAQ).order_by(desc(FAQ.isPinned)).all()
+    return db.query(FAQ).order_by(desc(FAQ.isPinned), desc(FAQ.hit_count), FAQ.id).all()
 
 def get_faq_by_question(db: Session, question: str):
     return db.query(FAQ).filter(FAQ.question.ilike(question)).first()
@@ -140,38 +460,89 @@ def create_faq(db: Session, faq: FAQCreate):
         isPinned=False
     )
     db.add(new_faq)
+    db.flush()
+    set_faq_synonyms(db, new_faq)
     db.commit()
     db.refresh(new_faq)
     return new_faq
 
-# def normalize(text: str) -> str:
-#     return text.strip().lower()
-
-def normalize(text: str) -> str:
-    # Remove punctuation, trim whitespace, and convert to lowercase.
-    return text.strip().lower().translate(str.maketrans('', '', string.punctuation))
+def bm25_shortlist(query: str, index) -> list:
+    """BM25 shortlist of candidate ids for match_faq, or None to scan everything"""
+    if BM25_SHORTLIST <= 0 or len(index) < BM25_MIN_CANDIDATES:
+        return None
+    return bm25_candidate_ids(faq_ranker, index, query, BM25_SHORTLIST)
 
-def match_faq(query: str, faqs, threshold: float = 70) -> str:
+def match_faq(query: str, faqs, threshold: float = 70, candidate_ids: list = None) -> str:
     """
     Find the best FAQ answer if the highest match score is above the given threshold.
+
+    `faqs` is an FAQIndex, or a list of FAQ records to index on the fly.
+    `candidate_ids` (e.g. a BM25 shortlist) are scored first, and the best
+    of them raises the score the full candidate scan must beat. The answer
+    is the one a full scan gives, including for typo'd questions the
+    shortlist cannot see; the shortlist only makes the scan cheaper.
     """
-    normalized_query = normalize(query)
-    candidate_tuples = []
-    for faq in faqs:
-        candidate_tuples.append((normalize(faq.question), faq))
-        if faq.synonyms:
-            for syn in faq.synonyms:
-                candidate_tuples.append((normalize(syn), faq))
-    if not candidate_tuples:
+    index = as_faq_index(faqs)
+    candidate_id = match_faq_candidate(query, index, threshold, candidate_ids)
+    return index.answer_for(candidate_id) if candidate_id is not None else None
+
+def match_faq_candidate(query: str, index, threshold: float = 70, candidate_ids: list = None) -> int:
+    """The candidate id match_faq answers from, or None"""
+    if not len(index):
         return None
-    candidate_texts = [text for text, _ in candidate_tuples]
-    best_match = process.extractOne(normalized_query, candidate_texts, scorer=fuzz.ratio)
-    if best_match and best_match[1] >= threshold:
-        matched_text = best_match[0]
-        for text, faq in candidate_tuples:
-            if text == matched_text:
-                return faq.answer
-    return None
+    normalized_query = normalize(query)
+
+    # An identical candidate scores 100, so skip the fuzzy scan for it.
+    exact = index.exact.get(normalized_query)
+    if exact is not None and threshold <= 100:
+        return exact
+
+    score_cutoff = threshold
+    shortlisted = None
+    if candidate_ids:
+        shortlist = [index.candidate_texts[candidate_id] for candidate_id in candidate_ids]
+        best_match = process.extractOne(normalized_query, shortlist, scorer=fuzz.ratio, score_cutoff=threshold)
+        if best_match:
+            # A candidate the shortlist missed may still score higher, so the
+            # full scan still decides, but only needs to look for one at
+            # least this good, which lets rapidfuzz skip most candidates.
+            # extractOne checks the cutoff as a rounded distance, so a cutoff
+            # equal to the score can reject the candidate itself; the slack
+            # only admits candidates that then lose to the best one anyway.
+            shortlisted = candidate_ids[best_match[2]]
+            score_cutoff = best_match[1] - 0.01
+
+    # Candidates are in FAQ order, so on a tie the pinned and most asked FAQ wins
+    best_match = process.extractOne(normalized_query, index.candidate_texts, scorer=fuzz.ratio, score_cutoff=score_cutoff)
+    if best_match:
+        return best_match[2]
+    return shortlisted
+
+def match_faq_batch(queries: List[str], faqs, threshold: float = 70, workers: int = BATCH_MATCH_WORKERS) -> list:
+    """
+    Score many queries against every FAQ candidate at once.
+
+    Returns, per query, (candidate_id, score) of the best candidate scoring at
+    least `threshold`, or None. Picks the same candidate match_faq would.
+    """
+    index = as_faq_index(faqs)
+    if not len(index):
+        return [None] * len(queries)
+    normalized_queries = [normalize(query) for query in queries]
+
+    matches = []
+    for start in range(0, len(normalized_queries), BATCH_MATCH_CHUNK):
+        scores = process.cdist(normalized_queries[start:start + BATCH_MATCH_CHUNK], index.candidate_texts,
+                               scorer=fuzz.ratio, score_cutoff=threshold, dtype=np.float64, workers=workers)
+        best_ids = scores.argmax(axis=1)
+        for row, candidate_id in enumerate(best_ids):
+            score = float(scores[row, candidate_id])
+            # Scores under the cutoff come back as 0
+            if score >= threshold and (score > 0 or threshold <= 0):
+                matches.append((int(candidate_id), score))
+            else:
+                matches.append(None)
+    return matches
 
 def get_faq_suggestions_by_words(query: str, faqs, threshold: float = 0.3, max_suggestions: int = 3) -> list:
     """
@@ -179,60 +550,32 @@ def get_faq_suggestions_by_words(query: str, faqs, threshold: float = 0.3, max_s
     
     Parameters:
       - query (str): The user's query.
-      - faqs: List of FAQ records.
+      - faqs: FAQIndex, or a list of FAQ records.
       - threshold (float): Minimum Jaccard similarity required (0 to 1).
       - max_suggestions (int): Maximum number of suggestions to return.
       
     Returns:
       - List of candidate FAQ texts (questions or synonyms) that meet the threshold.
     """
+    index = as_faq_index(faqs)
     normalized_query = normalize(query)
     query_words = set(normalized_query.split())
-    suggestions = []
-    
-    for faq in faqs:
-        candidate_texts = [normalize(faq.question)]
-        if faq.synonyms:
-            candidate_texts.extend(normalize(syn) for syn in faq.synonyms)
-            
-        for candidate in candidate_texts:
-            candidate_words = set(candidate.split())
-            if not candidate_words:
-                continue
-            jaccard = len(query_words & candidate_words) / len(query_words | candidate_words)
-            if jaccard >= threshold:
-                suggestions.append((candidate, jaccard))
-                
-    # Sort suggestions by similarity score in descending order and limit the count.
-    suggestions.sort(key=lambda x: x[1], reverse=True)
-    return [sug[0] for sug in suggestions[:max_suggestions]]
-
-def add_unknown_faq(query: str, db: Session):
-    user_faq = UserFAQ(query=query.strip())
-    db.add(user_faq)
-    db.commit()
-    db.refresh(user_faq)
 
-# def ge
-# async def get_gemini_response(query: str, history: list = None) -> str:
-#     """
-#     Get an AI-generated response from Google Gemini.
-
-#     This function starts a chat session with the Gemini model using the provided conversation history,
-#     then sends the prompt and returns the response text.
-#     """
-#     history = history or []
-    
-#     def sync_get_response():
-#         # Create a chat session that remembers conversation history.
-#         # Adjust the code below based on the actual genai API:
-#         chat_session = client.chats.create(model='gemini-2.0-flash', history=history)
-#         response = chat_session.send_message(query)
-
-#         return response.text.strip()
-    
-#     try:
-#         return await anyio.to_thread.run_sync(sync_get_response)
-#     except Exception as e:
-#         raise Exception("Gemini API error: " + str(e))
+    if threshold > 0:
+        # Only candidates sharing a word with the query can reach the threshold,
+        # so count the shared words through the inverted index.
+        shared_words = Counter()
+        for word in query_words:
+            postings = index.postings.get(word)
+            if postings:
+                shared_words.update(postings)
+        query_size = len(query_words)
+        scored = ((candidate_id, shared / (query_size + index.candidate_sizes[candidate_id] - shared))
+                  for candidate_id, shared in shared_words.items())
+    else:
+        scored = ((candidate_id, len(query_words & candidate_words) / len(query_words | candidate_words))
+                  for candidate_id, candidate_words in enumerate(index.candidate_tokens) if candidate_words)
 
+    # Highest similarity first; ties keep FAQ order like a stable sort would.
+    best = heapq.nsmallest(max_suggestions, ((-jaccard, candidate_id) for candidate_id, jaccard in scored if jaccard >= threshold))
+    return [index.candidate_texts[candidate_id] for _, candidate_id in best]
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import threading
+
+from database import create_async_session
+
+logger = logging.getLogger(__name__)
+
+
+class CountBuffer:
+    """
+        Counts kept in memory by key between flushes to the database.
+
+        record() is cheap and never touches the database; drain() hands the
+        pending counts to the flusher and starts counting afresh. An entry is
+        [count, *fields]; subclasses with fields fold a new record's fields
+        into a pending entry in merge(). With `max_pending`, new keys past
+        that many are dropped.
+    """
+
+    def __init__(self, max_pending: int = None):
+        self.max_pending = max_pending
+        self._pending = {}    # key -> [count, *fields]
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, key, count: int = 1, *fields):
+        if key is None:
+            return
+        with self._lock:
+            if self._add(key, count, fields):
+                self.recorded += count
+
+    def _add(self, key, count: int, fields: tuple) -> bool:
+        entry = self._pending.get(key)
+        if entry is None:
+            if self.max_pending is not None and len(self._pending) >= self.max_pending:
+                self.dropped += count
+                return False
+            self._pending[key] = [count, *fields]
+        else:
+            entry[0] += count
+            self.merge(entry, fields)
+        return True
+
+    def merge(self, entry: list, fields: tuple):
+        """Fold a new record's fields into its pending entry"""
+
+    def drain(self) -> list:
+        """
+            Pending entries as (key, count, *fields), by key. Flushing in key
+            order locks rows in the same order in every worker, so workers
+            flushing at once can't deadlock.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return [(key, *entry) for key, entry in sorted(pending.items())]
+
+    def restore(self, entries: list):
+        """Put drained entries back after a failed flush"""
+        with self._lock:
+            for key, count, *fields in entries:
+                self._add(key, count, tuple(fields))
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "max_pending": self.max_pending, "recorded": self.recorded,
+                "dropped": self.dropped, "flushed": self.flushed, "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes}
+
+
+async def flush_counts(buffer: CountBuffer, statement, batch_size: int) -> int:
+    """
+        Write the buffered counts in one transaction, `statement(entries)`
+        for every `batch_size` drained entries. On failure the entries go
+        back into the buffer. Returns the number of entries written.
+    """
+    entries = buffer.drain()
+    if not entries:
+        return 0
+    try:
+        async with create_async_session() as db:
+            for start in range(0, len(entries), batch_size):
+                await db.execute(statement(entries[start:start + batch_size]))
+            await db.commit()
+    except Exception:
+        buffer.failed_flushes += 1
+        buffer.restore(entries)
+        raise
+    buffer.flushes += 1
+    buffer.flushed += len(entries)
+    return len(entries)
+
+async def flush_periodically(flush, interval: float, name: str):
+    """Background task: `await flush()` every `interval` seconds, logging what `name`d counts it wrote"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            written = await flush()
+            if written:
+                logger.info("Flushed %d %s", written, name)
+        except Exception as e:
+            logger.error("Error flushing %s: %s", name, e)
@@ -1,7 +1,7 @@
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy import Column, Integer, String, DateTime, Boolean, func, ForeignKey
 from sqlalchemy.dialects.postgresql import JSONB, UUID
-from database import create_session, create_table, db_connect
+from database import create_session, create_table, get_engine
 from datetime import datetime, timedelta
 
 Base = declarative_base()
@@ -86,7 +86,7 @@ class OTPSecret(Base):
         return cls(email=email, secret=secret, expires_at=expires_at, is_used=False)
         
 
-engine, _ = db_connect()
+engine = get_engine()
 session = create_session(engine)
 create_table(engine)
 Base.metadata.create_all(engine, checkfirst=True)
@@ -1,10 +1,14 @@
 import os
+import threading
+import time
 from typing import Annotated
 from dotenv import load_dotenv
 from fastapi import Depends
 from sqlalchemy.orm import Session
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, make_url, MetaData
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 # Load environment variables
 load_dotenv()
@@ -12,29 +16,210 @@ load_dotenv()
 Base = declarative_base()
 metadata = MetaData()
 
+# Connection pool settings, tunable per deployment without code changes
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+_async_engine = None
+_async_engine_pid = None
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+
+class _TimedPool:
+    """
+        Pool mixin that records how long callers wait to check out a connection.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def recreate(self):
+        # Keep the timing counters when the engine recreates its pool on dispose()
+        new_pool = super().recreate()
+        new_pool.checkouts = self.checkouts
+        new_pool.total_wait = self.total_wait
+        new_pool.max_wait = self.max_wait
+        new_pool.timeouts = self.timeouts
+        return new_pool
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(_TimedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def get_database_url():
+    DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URL")
+    if not DATABASE_URL:
+        raise ValueError("DATABASE_URL environment variable not set")
+    return DATABASE_URL
+
+def get_async_database_url():
+    """
+        URL for the asyncio engine. Defaults to the sync URL with the asyncpg driver.
+    """
+    ASYNC_DATABASE_URL = os.getenv("SQLALCHEMY_ASYNC_DATABASE_URL")
+    if ASYNC_DATABASE_URL:
+        return ASYNC_DATABASE_URL
+    url = make_url(get_database_url())
+    if url.get_backend_name() == "postgresql":
+        url = url.set(drivername="postgresql+asyncpg")
+    return url
+
+def get_engine():
+    """
+        Return the engine shared by every request in this process.
+
+        The engine is built on first use. A forked child (e.g. a gunicorn worker
+        started with --preload) never reuses the parent's pooled connections.
+    """
+    global _engine, _engine_pid
+    if _engine is not None and _engine_pid == os.getpid():
+        return _engine
+
+    with _engine_lock:
+        if _engine is not None and _engine_pid != os.getpid():
+            _engine.dispose(close=False)
+            _engine = None
+        if _engine is None:
+            _engine = create_engine(
+                get_database_url(),
+                poolclass=TimedQueuePool,
+                pool_size=POOL_SIZE,
+                max_overflow=POOL_MAX_OVERFLOW,
+                pool_timeout=POOL_TIMEOUT,
+                pool_recycle=POOL_RECYCLE,
+                pool_pre_ping=POOL_PRE_PING,
+            )
+            _engine_pid = os.getpid()
+    return _engine
+
+def get_async_engine():
+    """
+        Return the asyncio engine shared by every request in this process.
+
+        Same pool settings and fork handling as get_engine().
+    """
+    global _async_engine, _async_engine_pid
+    if _async_engine is not None and _async_engine_pid == os.getpid():
+        return _async_engine
+
+    with _engine_lock:
+        if _async_engine is not None and _async_engine_pid != os.getpid():
+            _async_engine.sync_engine.dispose(close=False)
+            _async_engine = None
+        if _async_engine is None:
+            _async_engine = create_async_engine(
+                get_async_database_url(),
+                poolclass=TimedAsyncQueuePool,
+                pool_size=POOL_SIZE,
+                max_overflow=POOL_MAX_OVERFLOW,
+                pool_timeout=POOL_TIMEOUT,
+                pool_recycle=POOL_RECYCLE,
+                pool_pre_ping=POOL_PRE_PING,
+            )
+            _async_engine_pid = os.getpid()
+    return _async_engine
+
+def dispose_engine():
+    """Close every pooled connection, e.g. on application shutdown."""
+    global _engine, _engine_pid
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+        _engine = None
+        _engine_pid = None
+
+async def dispose_async_engine():
+    global _async_engine, _async_engine_pid
+    if _async_engine is not None and _async_engine_pid == os.getpid():
+        await _async_engine.dispose()
+    _async_engine = None
+    _async_engine_pid = None
+
+def _dispose_engine_after_fork():
+    # Connections inherited from the parent belong to the parent; drop them
+    # without closing so the parent's sockets are left untouched.
+    global _engine, _engine_pid, _async_engine, _async_engine_pid
+    if _engine is not None:
+        _engine.dispose(close=False)
+    if _async_engine is not None:
+        _async_engine.sync_engine.dispose(close=False)
+    _engine = None
+    _engine_pid = None
+    _async_engine = None
+    _async_engine_pid = None
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_dispose_engine_after_fork)
+
+def pool_stats():
+    """Current usage of the connection pools, for sizing them under load."""
+    return {
+        "sync": _pool_stats(_engine if _engine_pid == os.getpid() else None),
+        "async": _pool_stats(_async_engine.sync_engine if _async_engine is not None and _async_engine_pid == os.getpid() else None),
+    }
+
+def _pool_stats(engine):
+    if engine is None:
+        return {"initialized": False}
+    pool = engine.pool
+    return {
+        "initialized": True,
+        "pool_size": pool.size(),
+        "max_overflow": POOL_MAX_OVERFLOW,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "checkouts": pool.checkouts,
+        "timeouts": pool.timeouts,
+        "avg_wait_ms": round(pool.total_wait / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+        "max_wait_ms": round(pool.max_wait * 1000, 3),
+    }
+
 
 def get_db():
-    engine, _ = db_connect()
-    session = create_session(engine)
+    session = create_session()
     try:
         yield session
     finally:
         session.close()
 
-def db_connect():
-
-    DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URL")
-    if not DATABASE_URL:
-        raise ValueError("DATABASE_URL environment variable not set")
-    engine = create_engine(DATABASE_URL)
-    connection = engine.connect()
+async def get_async_db():
+    async with create_async_session() as session:
+        yield session
 
-    return engine, connection
+def create_session(engine=None):
+    return SessionLocal(bind=engine or get_engine())
 
-def create_session(engine):
-    Session = sessionmaker(autocommit=False, autoflush=False,bind=engine)
-    session = Session()
-    return session
+def create_async_session(engine=None):
+    return AsyncSessionLocal(bind=engine or get_async_engine())
 
 def create_table(engine):
     # Base.metadata.drop_all(engine, checkfirst=True)
@@ -42,6 +227,7 @@ def create_table(engine):
 
 
 db_dependency = Annotated[Session, Depends(get_db)]
+async_db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
 
 
 
@@ -0,0 +1,214 @@
+import asyncio
+import base64
+import logging
+import os
+import random
+from email.message import EmailMessage
+
+import anyio
+from googleapiclient.errors import HttpError
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from database import create_async_session
+from models import EmailOutbox
+from gmailClient import GMAIL_QUOTA_UNITS, should_back_off
+from otp import GMAIL_BATCH_LIMIT, get_gmail_service, gmail_quota, new_gmail_batch
+
+logger = logging.getLogger(__name__)
+
+# Delivery tasks per process; rows are claimed with SKIP LOCKED, so any
+# number of tasks across workers can drain the table together
+OUTBOX_WORKERS = int(os.getenv("EMAIL_OUTBOX_WORKERS", "2"))
+# Seconds between checks for due emails when nothing wakes the workers sooner
+OUTBOX_POLL_INTERVAL = float(os.getenv("EMAIL_OUTBOX_POLL_INTERVAL", "5"))
+# Emails claimed per round
+OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "100"))
+# Emails per Gmail batch request, and batch requests in flight at once
+OUTBOX_SEND_BATCH = min(int(os.getenv("EMAIL_OUTBOX_SEND_BATCH", "50")), GMAIL_BATCH_LIMIT)
+OUTBOX_CONCURRENCY = int(os.getenv("EMAIL_OUTBOX_CONCURRENCY", "4"))
+# Attempts before an email is marked dead
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "8"))
+# Retry delay doubles from the base up to the cap, with jitter
+OUTBOX_BACKOFF_BASE = float(os.getenv("EMAIL_OUTBOX_BACKOFF_BASE", "30"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("EMAIL_OUTBOX_BACKOFF_MAX", "3600"))
+# Seconds a claimed email stays with its worker; if the worker dies it is
+# retried after this, so an email is sent at least once (rarely twice)
+OUTBOX_LEASE = float(os.getenv("EMAIL_OUTBOX_LEASE", "300"))
+
+# Gmail statuses retrying won't fix
+PERMANENT_STATUSES = {400, 404}
+
+_wakeup = asyncio.Event()
+
+outbox_stats = {
+    "claimed": 0,
+    "sent": 0,
+    "retried": 0,
+    "dead": 0,
+    "rounds": 0,
+    "requests": 0,
+    "throttled": 0,
+}
+
+
+def enqueue_email(db: Session, message: EmailMessage, kind: str) -> EmailOutbox:
+    """
+        Add an email to the outbox in the caller's transaction, so it is sent
+        if and only if the change it announces commits. Call notify_outbox()
+        after the commit to send it right away.
+    """
+    row = EmailOutbox(kind=kind, recipient=message["To"], subject=message["Subject"] or "",
+                      raw=base64.urlsafe_b64encode(message.as_bytes()).decode())
+    db.add(row)
+    return row
+
+def notify_outbox():
+    """Wake this process's outbox workers instead of waiting for the next poll"""
+    _wakeup.set()
+
+def claim_statement(limit: int):
+    """Claim up to `limit` due emails, and any whose worker's lease ran out"""
+    due = or_(
+        and_(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= func.now()),
+        and_(EmailOutbox.status == "sending", EmailOutbox.locked_until < func.now()),
+    )
+    claimable = (select(EmailOutbox.id).where(due).order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+                 .limit(limit).with_for_update(skip_locked=True).scalar_subquery())
+    return (update(EmailOutbox).where(EmailOutbox.id.in_(claimable))
+            .values(status="sending", attempts=EmailOutbox.attempts + 1,
+                    locked_until=func.now() + func.make_interval(0, 0, 0, 0, 0, 0, OUTBOX_LEASE))
+            .returning(EmailOutbox.id, EmailOutbox.raw, EmailOutbox.attempts)
+            .execution_options(synchronize_session=False))
+
+def retry_delay(attempts: int) -> float:
+    delay = min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+def is_throttled(error: Exception) -> bool:
+    """Whether a send failed because Gmail wants us to slow down"""
+    if not isinstance(error, HttpError):
+        return False
+    details = error.error_details if isinstance(error.error_details, list) else []
+    reason = details[0].get("reason") if details and isinstance(details[0], dict) else None
+    return should_back_off(error.resp.status, reason)
+
+def send_raw(raw: str) -> str:
+    """Send an encoded message through Gmail; returns its message id. Blocking."""
+    sent = get_gmail_service().users().messages().send(userId="me", body={"raw": raw}).execute()
+    return sent["id"]
+
+def send_raw_batch(raws: list) -> list:
+    """
+        Send encoded messages through Gmail in one HTTP round trip. Returns
+        (message id, None) or (None, error) for each, in order, since every
+        message in a batch succeeds or fails on its own. Blocking.
+    """
+    outbox_stats["requests"] += 1
+    if len(raws) == 1:
+        # A batch of one only adds the multipart wrapping
+        try:
+            return [(send_raw(raws[0]), None)]
+        except Exception as e:
+            return [(None, e)]
+
+    results = [(None, None)] * len(raws)
+
+    def collect(request_id, response, exception):
+        results[int(request_id)] = (None, exception) if exception is not None else (response["id"], None)
+
+    messages = get_gmail_service().users().messages()
+    batch = new_gmail_batch(collect)
+    for index, raw in enumerate(raws):
+        batch.add(messages.send(userId="me", body={"raw": raw}), request_id=str(index))
+    batch.execute()
+    return results
+
+async def send_emails(raws: list) -> list:
+    """
+        Send encoded messages in Gmail batches of OUTBOX_SEND_BATCH, up to
+        OUTBOX_CONCURRENCY batches at a time. Returns (message id, error)
+        for each message, in order.
+
+        Each batch first takes its sends' units from the shared Gmail quota,
+        and a batch Gmail throttled pauses the quota for every caller.
+        Throttled messages are retried by the outbox like any failure.
+    """
+    semaphore = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+
+    async def attempt(batch):
+        await gmail_quota.acquire(GMAIL_QUOTA_UNITS["messages.send"] * len(batch))
+        async with semaphore:
+            try:
+                # The Gmail client blocks; keep it off the event loop
+                results = await anyio.to_thread.run_sync(send_raw_batch, batch)
+            except Exception as e:
+                # The batch request itself failed, so every message in it did
+                results = [(None, e)] * len(batch)
+        throttled = [error for _, error in results if is_throttled(error)]
+        if throttled:
+            outbox_stats["throttled"] += len(throttled)
+            gmail_quota.throttled()
+        else:
+            gmail_quota.succeeded()
+        return results
+
+    batches = await asyncio.gather(*(attempt(raws[start:start + OUTBOX_SEND_BATCH])
+                                     for start in range(0, len(raws), OUTBOX_SEND_BATCH)))
+    return [result for batch in batches for result in batch]
+
+async def deliver_outbox_batch(limit: int = OUTBOX_BATCH_SIZE) -> int:
+    """Claim and send one round of due emails. Returns the number claimed."""
+    async with create_async_session() as db:
+        claimed = (await db.execute(claim_statement(limit))).all()
+        await db.commit()
+    if not claimed:
+        return 0
+    outbox_stats["rounds"] += 1
+    outbox_stats["claimed"] += len(claimed)
+
+    results = await send_emails([raw for _, raw, _ in claimed])
+
+    async with create_async_session() as db:
+        for (email_id, _, attempts), (message_id, error) in zip(claimed, results):
+            await db.execute(outcome_statement(email_id, attempts, message_id, error))
+        await db.commit()
+    return len(claimed)
+
+def outcome_statement(email_id: int, attempts: int, message_id: str, error: Exception):
+    statement = update(EmailOutbox).where(EmailOutbox.id == email_id).execution_options(synchronize_session=False)
+    if error is None:
+        outbox_stats["sent"] += 1
+        return statement.values(status="sent", gmail_message_id=message_id, sent_at=func.now(),
+                                locked_until=None, last_error=None)
+
+    permanent = isinstance(error, HttpError) and error.resp.status in PERMANENT_STATUSES
+    if permanent or attempts >= OUTBOX_MAX_ATTEMPTS:
+        outbox_stats["dead"] += 1
+        logger.error("Email %s is dead after %d attempts: %s", email_id, attempts, error)
+        return statement.values(status="dead", locked_until=None, last_error=str(error))
+
+    delay = retry_delay(attempts)
+    outbox_stats["retried"] += 1
+    logger.warning("Email %s failed (attempt %d), retrying in %.0fs: %s", email_id, attempts, delay, error)
+    return statement.values(status="pending", locked_until=None, last_error=str(error),
+                            next_attempt_at=func.now() + func.make_interval(0, 0, 0, 0, 0, 0, delay))
+
+async def run_outbox_worker():
+    """Background task: send due emails, draining the outbox before waiting again"""
+    while True:
+        try:
+            if await deliver_outbox_batch():
+                continue
+        except Exception as e:
+            logger.error("Error delivering outbox emails: %s", e)
+        try:
+            await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+
+async def count_outbox_by_status() -> dict:
+    async with create_async_session() as db:
+        result = await db.execute(select(EmailOutbox.status, func.count()).group_by(EmailOutbox.status))
+        return dict(result.all())
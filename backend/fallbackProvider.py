@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+
+from faqIndex import normalize
+from responseCache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+# "none" keeps /ray/chat purely FAQ-based; "gemini" or "stub" answer what the FAQs can't
+FALLBACK_PROVIDER = os.getenv("CHAT_FALLBACK_PROVIDER", "none").lower()
+# Seconds a chat request waits for a generated answer before replying without one
+FALLBACK_BUDGET = float(os.getenv("CHAT_FALLBACK_BUDGET", "2.0"))
+# Hard limit on one provider call; a call past the budget keeps running up to
+# this long so its answer can still be cached for the next asker
+FALLBACK_TIMEOUT = float(os.getenv("CHAT_FALLBACK_TIMEOUT", "10"))
+FALLBACK_CONCURRENCY = int(os.getenv("CHAT_FALLBACK_CONCURRENCY", "4"))
+# Consecutive failures that open the breaker, and seconds it stays open
+FALLBACK_BREAKER_FAILURES = int(os.getenv("CHAT_FALLBACK_BREAKER_FAILURES", "5"))
+FALLBACK_BREAKER_RESET = float(os.getenv("CHAT_FALLBACK_BREAKER_RESET", "30"))
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+GEMINI_INSTRUCTION = ("You are Ray, the RTU (Rizal Technological University) kiosk assistant. "
+                      "Answer in at most three short sentences. If the question is not about "
+                      "the university, politely say you can only help with RTU topics.")
+
+
+class FallbackUnavailable(Exception):
+    """The provider was not called: breaker open, at the concurrency limit, or nothing to say"""
+
+
+class FallbackProvider(ABC):
+    """Answers questions the FAQs don't cover. Subclasses implement answer()."""
+
+    name = "base"
+
+    @abstractmethod
+    async def answer(self, query: str) -> str:
+        """The generated answer to `query`; empty when the provider has none"""
+
+
+class GeminiProvider(FallbackProvider):
+    name = "gemini"
+
+    def __init__(self, api_key: str = None, model: str = GEMINI_MODEL):
+        from google import genai
+        from google.genai import types
+
+        self.model = model
+        self._client = genai.Client(api_key=api_key or os.getenv("GEMINI_API"))
+        self._config = types.GenerateContentConfig(system_instruction=GEMINI_INSTRUCTION, max_output_tokens=256)
+
+    async def answer(self, query: str) -> str:
+        response = await self._client.aio.models.generate_content(model=self.model, contents=query, config=self._config)
+        return (response.text or "").strip()
+
+
+class StubProvider(FallbackProvider):
+    """Canned answers after a fixed delay, for local testing and benchmarks"""
+
+    name = "stub"
+
+    def __init__(self, delay: float = None, fail: bool = False):
+        self.delay = float(os.getenv("CHAT_FALLBACK_STUB_DELAY", "0.05")) if delay is None else delay
+        self.fail = fail
+
+    async def answer(self, query: str) -> str:
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("stub provider failure")
+        return f"(stub) I don't have an FAQ for \"{query.strip()}\" yet."
+
+
+PROVIDERS = {"gemini": GeminiProvider, "stub": StubProvider}
+
+def get_fallback_provider(name: str = FALLBACK_PROVIDER) -> FallbackProvider:
+    """The configured provider, or None when the fallback is disabled"""
+    if name in ("", "none"):
+        return None
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown CHAT_FALLBACK_PROVIDER {name!r}, expected one of {', '.join(PROVIDERS)} or none")
+    return PROVIDERS[name]()
+
+
+class CircuitBreaker:
+    """
+        Opens after `failure_threshold` consecutive failures. Once `reset_timeout`
+        seconds have passed a single trial call is let through; its outcome
+        closes the breaker or opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = FALLBACK_BREAKER_FAILURES, reset_timeout: float = FALLBACK_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._trial or time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if not self._trial and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._trial = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._trial = False
+            self.opened += 1
+
+
+class FallbackAnswerer:
+    """
+        Wraps a FallbackProvider for use on the request path.
+
+        answer() waits at most `budget` seconds and returns None rather than
+        an error whenever no generated answer is available in time. Calls are
+        capped at `concurrency` (extra requests are turned away, not queued),
+        time out after `timeout` seconds, and are skipped while the circuit
+        breaker is open. Answers are cached per normalized query, and
+        concurrent requests for one query share a single provider call.
+    """
+
+    def __init__(self, provider: FallbackProvider, budget: float = FALLBACK_BUDGET, timeout: float = FALLBACK_TIMEOUT,
+                 concurrency: int = FALLBACK_CONCURRENCY, breaker: CircuitBreaker = None, cache: ResponseCache = None):
+        self.provider = provider
+        self.budget = budget
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.breaker = breaker or CircuitBreaker()
+        self.cache = cache or ResponseCache(maxsize=int(os.getenv("CHAT_FALLBACK_CACHE_SIZE", "512")),
+                                            ttl=float(os.getenv("CHAT_FALLBACK_CACHE_TTL", "3600")))
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.calls = 0
+        self.finished = 0
+        self.failures = 0
+        self.over_budget = 0
+        self.rejected = 0
+        self.short_circuited = 0
+        self.call_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.provider is not None
+
+    async def answer(self, query: str) -> str:
+        """A generated answer, or None if there is none within the budget"""
+        if not self.enabled:
+            return None
+        key = normalize(query)
+        # Answer cache hits without scheduling a task
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache.hits += 1
+            return cached
+        call = asyncio.ensure_future(self.cache.get_or_compute(key, lambda: self._generate(query)))
+        try:
+            # Shielded so a call that overruns the budget still finishes and fills the cache
+            return await asyncio.wait_for(asyncio.shield(call), self.budget)
+        except asyncio.TimeoutError:
+            self.over_budget += 1
+            call.add_done_callback(_consume_result)
+            return None
+        except FallbackUnavailable:
+            return None
+        except Exception as e:
+            logger.warning("Fallback provider %s failed: %r", self.provider.name, e)
+            return None
+
+    async def _generate(self, query: str) -> str:
+        # Checked before the breaker: a half-open breaker's one trial call,
+        # once allowed, must happen, or the breaker never closes again
+        if self._semaphore.locked():
+            self.rejected += 1
+            raise FallbackUnavailable("at concurrency limit")
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            raise FallbackUnavailable("circuit open")
+        # Not locked, so this takes a slot without yielding
+        async with self._semaphore:
+            self.calls += 1
+            started = time.perf_counter()
+            try:
+                text = await asyncio.wait_for(self.provider.answer(query), self.timeout)
+            except Exception:
+                self.failures += 1
+                self.breaker.record_failure()
+                raise
+            finally:
+                self.finished += 1
+                self.call_seconds += time.perf_counter() - started
+        self.breaker.record_success()
+        if not text:
+            raise FallbackUnavailable("empty answer")
+        return text
+
+    def stats(self) -> dict:
+        return {
+            "provider": self.provider.name if self.provider else None,
+            "budget_seconds": self.budget,
+            "timeout_seconds": self.timeout,
+            "concurrency": self.concurrency,
+            "calls": self.calls,
+            "failures": self.failures,
+            "over_budget": self.over_budget,
+            "rejected": self.rejected,
+            "short_circuited": self.short_circuited,
+            "mean_call_ms": round(self.call_seconds / self.finished * 1000, 1) if self.finished else 0.0,
+            "breaker": {"state": self.breaker.state, "failures": self.breaker.failures, "opened": self.breaker.opened},
+            "cache": self.cache.stats(),
+        }
+
+
+def _consume_result(task: asyncio.Future):
+    # Nobody awaits a call that overran the budget; retrieve its error so asyncio doesn't log it
+    if not task.cancelled():
+        task.exception()
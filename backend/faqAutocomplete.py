@@ -0,0 +1,225 @@
+import bisect
+import heapq
+import os
+import threading
+from array import array
+from collections import Counter, OrderedDict
+
+from rapidfuzz import fuzz, process
+
+from faqIndex import FAQIndex, normalize
+
+# Most suggestions one request can ask for
+AUTOCOMPLETE_MAX_LIMIT = 10
+# Prefixes this short match most of the corpus, so their results are precomputed
+AUTOCOMPLETE_MEMO_DEPTH = 3
+# Suffixes are cut to this length; longer inputs only use their first characters for the prefix lookup
+AUTOCOMPLETE_MAX_SUFFIX = 64
+# Inputs shorter than this get no fuzzy fallback
+AUTOCOMPLETE_FUZZY_MIN_LENGTH = 3
+AUTOCOMPLETE_WORD_CUTOFF = 75
+AUTOCOMPLETE_FUZZY_CUTOFF = 70
+# Candidates re-scored with fuzz.partial_ratio by the fuzzy fallback
+AUTOCOMPLETE_FUZZY_SHORTLIST = 200
+AUTOCOMPLETE_CACHE_SIZE = int(os.getenv("AUTOCOMPLETE_CACHE_SIZE", "4096"))
+
+
+class _Completions:
+    """Lookup structures for one FAQIndex version; replaced as a whole on sync"""
+
+    def __init__(self, index: FAQIndex):
+        self.index = index
+        self.vocabulary = sorted(index.postings)
+        faq_count = max(len(index.faq_ids), 1)
+
+        # Every word-start suffix of every question and synonym, so "lib" finds
+        # "where is the library". Ranked by: suffix starts the text, question
+        # before synonym, then FAQ order (pinned first).
+        entries = []
+        for candidate_id, text in enumerate(index.candidate_texts):
+            position = index.candidate_faq[candidate_id]
+            is_synonym = candidate_id != index.faq_candidate_start[position]
+            for start in _word_starts(text):
+                rank = position + faq_count * (is_synonym + 2 * (start > 0))
+                entries.append((text[start:start + AUTOCOMPLETE_MAX_SUFFIX], rank, position))
+        entries.sort()
+        self.suffixes = [suffix for suffix, _, _ in entries]
+        self.ranks = array('q', (rank for _, rank, _ in entries))
+        self.positions = array('I', (position for _, _, position in entries))
+
+        # A flattened trie: the sorted suffixes sharing a prefix form one
+        # contiguous range. The widest ranges, for the shortest prefixes, get
+        # their top results computed once here.
+        self.memo = {}
+        for depth in range(1, AUTOCOMPLETE_MEMO_DEPTH + 1):
+            lo = 0
+            while lo < len(self.suffixes):
+                prefix = self.suffixes[lo][:depth]
+                if len(prefix) < depth:
+                    # A suffix shorter than the depth; longer ones sharing it follow
+                    lo = bisect.bisect_right(self.suffixes, prefix, lo)
+                    continue
+                hi = bisect.bisect_left(self.suffixes, prefix + "\uffff", lo)
+                self.memo[prefix] = self.top(lo, hi, AUTOCOMPLETE_MAX_LIMIT)
+                lo = hi
+
+        self.cache = OrderedDict()
+
+    def top(self, lo: int, hi: int, limit: int) -> list:
+        """Best-ranked FAQ positions among suffixes lo..hi, one per FAQ"""
+        best = {}
+        ranks, positions = self.ranks, self.positions
+        for i in range(lo, hi):
+            position = positions[i]
+            rank = ranks[i]
+            if rank < best.get(position, rank + 1):
+                best[position] = rank
+        return [position for position, _ in heapq.nsmallest(limit, best.items(), key=lambda item: (item[1], item[0]))]
+
+    def prefix_matches(self, prefix: str, limit: int) -> list:
+        if len(prefix) <= AUTOCOMPLETE_MEMO_DEPTH:
+            return self.memo.get(prefix, [])[:limit]
+        prefix = prefix[:AUTOCOMPLETE_MAX_SUFFIX]
+        lo = bisect.bisect_left(self.suffixes, prefix)
+        hi = bisect.bisect_left(self.suffixes, prefix + "\uffff", lo)
+        return self.top(lo, hi, limit)
+
+    def corrected(self, prefix: str) -> str:
+        """
+            The input with each unknown word replaced by its closest FAQ word.
+            The last word may still be half typed, so it is kept when some
+            FAQ word starts with it.
+        """
+        words = prefix.split()
+        for i, word in enumerate(words):
+            if word in self.index.postings:
+                continue
+            if i == len(words) - 1:
+                lo = bisect.bisect_left(self.vocabulary, word)
+                if lo < len(self.vocabulary) and self.vocabulary[lo].startswith(word):
+                    continue
+            match = process.extractOne(word, self.vocabulary, scorer=fuzz.ratio, score_cutoff=AUTOCOMPLETE_WORD_CUTOFF)
+            if match:
+                words[i] = match[0]
+        return " ".join(words)
+
+    def fuzzy_matches(self, prefix: str, limit: int, exclude) -> list:
+        """
+            Typo-tolerant matches: a prefix lookup of the corrected input,
+            then fuzz.partial_ratio over the candidates sharing its words.
+        """
+        index = self.index
+        corrected = self.corrected(prefix)
+        results = []
+        if corrected != prefix:
+            results = [position for position in self.prefix_matches(corrected, limit + len(exclude))
+                       if position not in exclude][:limit]
+            if len(results) == limit:
+                return results
+            exclude = set(exclude) | set(results)
+            limit -= len(results)
+
+        words = corrected.split()
+        # Words in most candidates say little and cost the most to count
+        common = max(len(index) // 10, 50)
+        shared = Counter()
+        for i, word in enumerate(words):
+            matches = [word] if word in index.postings else []
+            if i == len(words) - 1:
+                lo = bisect.bisect_left(self.vocabulary, word)
+                hi = bisect.bisect_left(self.vocabulary, word + "\uffff", lo)
+                matches.extend(self.vocabulary[lo:min(hi, lo + 3)])
+            for match in set(matches):
+                postings = index.postings[match]
+                if len(postings) <= common or len(words) == 1:
+                    shared.update(postings)
+        if not shared:
+            return results
+
+        shortlist = [candidate_id for candidate_id, _ in shared.most_common(AUTOCOMPLETE_FUZZY_SHORTLIST)
+                     if index.candidate_faq[candidate_id] not in exclude]
+        scored = process.extract(corrected, [index.candidate_texts[candidate_id] for candidate_id in shortlist],
+                                 scorer=fuzz.partial_ratio, limit=None, score_cutoff=AUTOCOMPLETE_FUZZY_CUTOFF)
+        fuzzy = []
+        for _, _, i in sorted(scored, key=lambda match: (-match[1], shortlist[match[2]])):
+            position = index.candidate_faq[shortlist[i]]
+            if position not in fuzzy:
+                fuzzy.append(position)
+                if len(fuzzy) == limit:
+                    break
+        return results + fuzzy
+
+
+class FAQAutocomplete:
+    """
+        Type-ahead FAQ questions for partial input, served from memory.
+
+        A prefix lookup over word-start suffixes of the normalized questions
+        and synonyms comes first; when it finds fewer than `limit` FAQs a
+        fuzzy pass fills the rest, so typos still get suggestions. Results
+        are cached per input until the FAQs change.
+    """
+
+    def __init__(self, cache_size: int = AUTOCOMPLETE_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._completions = None
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.requests = 0
+        self.cache_hits = 0
+        self.fuzzy = 0
+
+    def is_synced(self, index: FAQIndex) -> bool:
+        completions = self._completions
+        return completions is not None and completions.index.version == index.version
+
+    def sync(self, index: FAQIndex):
+        """Rebuild for `index` unless already built from it"""
+        if self.is_synced(index):
+            return
+        with self._lock:
+            if not self.is_synced(index):
+                self._completions = _Completions(index)
+                self.builds += 1
+
+    def complete(self, text: str, limit: int = 5) -> list:
+        """Up to `limit` FAQ questions for the partial input, best first"""
+        completions = self._completions
+        prefix = normalize(text)
+        if completions is None or not prefix:
+            return []
+        self.requests += 1
+        key = (prefix, limit)
+        cached = completions.cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            completions.cache.move_to_end(key)
+            return cached
+
+        positions = completions.prefix_matches(prefix, limit)
+        if len(positions) < limit and len(prefix) >= AUTOCOMPLETE_FUZZY_MIN_LENGTH:
+            self.fuzzy += 1
+            positions = positions + completions.fuzzy_matches(prefix, limit - len(positions), set(positions))
+        questions = [completions.index.questions[position] for position in positions]
+
+        completions.cache[key] = questions
+        if len(completions.cache) > self.cache_size:
+            completions.cache.popitem(last=False)
+        return questions
+
+    def stats(self) -> dict:
+        completions = self._completions
+        return {
+            "index_version": completions.index.version if completions else None,
+            "suffixes": len(completions.suffixes) if completions else 0,
+            "memoized_prefixes": len(completions.memo) if completions else 0,
+            "cached_inputs": len(completions.cache) if completions else 0,
+            "builds": self.builds,
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "fuzzy": self.fuzzy,
+        }
+
+
+def _word_starts(text: str) -> list:
+    return [i for i, char in enumerate(text) if char != " " and (i == 0 or text[i - 1] == " ")]
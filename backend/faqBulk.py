@@ -0,0 +1,171 @@
+import csv
+import io
+import json
+import os
+import time
+
+from pydantic import ValidationError
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from database import create_session
+from faqIndex import faq_synonyms
+from models import FAQ, FAQSynonym
+from schemas import FAQCreate
+
+# Rows written per INSERT round trip
+IMPORT_BATCH_SIZE = int(os.getenv("FAQ_IMPORT_BATCH_SIZE", "1000"))
+# Rows fetched per server-side cursor round trip while exporting
+EXPORT_BATCH_SIZE = int(os.getenv("FAQ_EXPORT_BATCH_SIZE", "1000"))
+# Row errors listed in the import result; the rest are only counted
+MAX_REPORTED_ERRORS = 50
+# Synonyms share one CSV cell
+CSV_SYNONYM_SEPARATOR = "|"
+CSV_FIELDS = ["id", "question", "synonyms", "answer", "isPinned"]
+
+FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def read_rows(file, fmt: str):
+    """(line number, dict or error message) for each row of an uploaded CSV or JSONL file"""
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        if not reader.fieldnames or not {"question", "answer"} <= set(reader.fieldnames):
+            raise ValueError("CSV header must include question and answer columns")
+        for row in reader:
+            synonyms = row.get("synonyms") or ""
+            row["synonyms"] = [synonym.strip() for synonym in synonyms.split(CSV_SYNONYM_SEPARATOR) if synonym.strip()]
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, f"invalid JSON: {e}"
+            continue
+        yield line_number, row if isinstance(row, dict) else "expected a JSON object"
+
+def validate_row(row) -> tuple:
+    """(FAQCreate, isPinned) for a parsed row; raises ValueError with what is wrong"""
+    if isinstance(row, str):
+        raise ValueError(row)
+    if isinstance(row.get("synonyms"), str):
+        row["synonyms"] = [row["synonyms"]]
+    try:
+        faq = FAQCreate(question=row.get("question"), answer=row.get("answer"), synonyms=row.get("synonyms") or [])
+    except ValidationError as e:
+        raise ValueError("; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()))
+    faq.question = faq.question.strip()
+    faq.answer = faq.answer.strip()
+    faq.synonyms = [synonym.strip() for synonym in faq.synonyms if synonym.strip()]
+    if not faq.question or not faq.answer:
+        raise ValueError("question and answer must not be empty")
+    pinned = row.get("isPinned") or False
+    if isinstance(pinned, str):
+        pinned = pinned.strip().lower() in ("1", "true", "yes")
+    return faq, bool(pinned)
+
+def import_faqs(db: Session, file, fmt: str, dry_run: bool = False) -> dict:
+    """
+        Insert the FAQs of an uploaded CSV or JSONL file in batches of
+        IMPORT_BATCH_SIZE, in one transaction. Rows take the export's
+        fields; an id column is ignored and new ids are assigned.
+
+        Rows whose question already exists (case-insensitively, as
+        POST /ray/faqs checks) or repeats an earlier row are skipped, as are
+        invalid rows; both are reported with their line numbers. Existing
+        questions are read in a single query up front instead of one lookup
+        per row.
+
+        A dry run only validates and de-duplicates: it writes nothing, and
+        reports in would_insert the rows that passed both checks.
+    """
+    started = time.perf_counter()
+    existing = set(db.scalars(select(func.lower(FAQ.question))))
+    result = {"format": fmt, "rows": 0, "inserted": 0, "would_insert": 0, "duplicates": 0, "invalid": 0, "errors": [],
+              "dry_run": dry_run}
+
+    def report(line_number, detail):
+        if len(result["errors"]) < MAX_REPORTED_ERRORS:
+            result["errors"].append({"line": line_number, "detail": detail})
+
+    batch = []
+    for line_number, row in read_rows(file, fmt):
+        result["rows"] += 1
+        try:
+            faq, pinned = validate_row(row)
+        except ValueError as e:
+            result["invalid"] += 1
+            report(line_number, str(e))
+            continue
+        key = faq.question.lower()
+        if key in existing:
+            result["duplicates"] += 1
+            report(line_number, "duplicate question")
+            continue
+        existing.add(key)
+        if dry_run:
+            result["would_insert"] += 1
+            continue
+        batch.append((faq, pinned))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            result["inserted"] += insert_batch(db, batch)
+            batch = []
+    if batch:
+        result["inserted"] += insert_batch(db, batch)
+
+    if dry_run:
+        # Ends the read-only transaction of the duplicate check
+        db.rollback()
+    else:
+        db.commit()
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    result["rows_per_second"] = round(result["rows"] / result["seconds"], 1) if result["seconds"] else 0.0
+    return result
+
+def insert_batch(db: Session, faqs: list) -> int:
+    """Multi-row INSERT of the FAQs and their faq_synonym rows; returns the FAQs written"""
+    # ON CONFLICT covers a question added by someone else since the duplicate check
+    statement = (pg_insert(FAQ).on_conflict_do_nothing(index_elements=[FAQ.question])
+                 .returning(FAQ.id, FAQ.question))
+    rows = db.execute(statement, [{"question": faq.question, "synonyms": faq.synonyms, "answer": faq.answer,
+                                   "isPinned": pinned} for faq, pinned in faqs]).all()
+    ids = {question: faq_id for faq_id, question in rows}
+    synonyms = [{"faq_id": ids[faq.question], "synonym": synonym}
+                for faq, _ in faqs if faq.question in ids for synonym in faq.synonyms]
+    if synonyms:
+        db.execute(insert(FAQSynonym), synonyms)
+    return len(rows)
+
+def export_faqs(fmt: str):
+    """
+        Every FAQ as CSV or JSONL chunks, read through a server-side cursor
+        EXPORT_BATCH_SIZE rows at a time so memory stays flat. Opens its own
+        session, since the response streams after the request's session is
+        closed.
+    """
+    with create_session() as db:
+        result = db.execute(select(FAQ).order_by(FAQ.id).execution_options(yield_per=EXPORT_BATCH_SIZE))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == "csv":
+            writer.writerow(CSV_FIELDS)
+        for partition in result.scalars().partitions():
+            for faq in partition:
+                if fmt == "csv":
+                    writer.writerow([faq.id, faq.question, CSV_SYNONYM_SEPARATOR.join(faq_synonyms(faq)),
+                                     faq.answer, faq.isPinned])
+                else:
+                    buffer.write(json.dumps({"id": faq.id, "question": faq.question, "synonyms": faq_synonyms(faq),
+                                             "answer": faq.answer, "isPinned": faq.isPinned}, ensure_ascii=False))
+                    buffer.write("\n")
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
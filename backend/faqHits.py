@@ -0,0 +1,29 @@
+import os
+
+from sqlalchemy import BigInteger, Integer, column, update, values
+
+from countBuffer import CountBuffer, flush_counts, flush_periodically
+from models import FAQ
+
+# Seconds between flushes of the buffered FAQ hits
+FLUSH_INTERVAL = float(os.getenv("FAQ_HIT_FLUSH_INTERVAL", "60"))
+# FAQs updated per UPDATE ... FROM (VALUES ...) statement
+FLUSH_BATCH_SIZE = 1000
+
+# How many chat queries each FAQ answered since the last flush, by FAQ id
+faq_hits = CountBuffer()
+
+
+def increment_statement(entries: list):
+    """One UPDATE adding the hits of `entries`, (faq id, hits) pairs, to faq.hit_count"""
+    hits = values(column("faq_id", Integer), column("hits", BigInteger), name="hits").data(entries)
+    faq = FAQ.__table__
+    return update(faq).where(faq.c.id == hits.c.faq_id).values(hit_count=faq.c.hit_count + hits.c.hits)
+
+async def flush_faq_hits(counter: CountBuffer = faq_hits) -> int:
+    """Write the buffered hits to faq.hit_count. Returns the number of FAQs updated."""
+    return await flush_counts(counter, increment_statement, FLUSH_BATCH_SIZE)
+
+async def flush_faq_hits_periodically():
+    """Background task: flush the FAQ hit counts every FLUSH_INTERVAL seconds"""
+    await flush_periodically(flush_faq_hits, FLUSH_INTERVAL, "FAQ hit counts")
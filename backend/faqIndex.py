@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import os
+import string
+import time
+from array import array
+
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import FAQ
+
+logger = logging.getLogger(__name__)
+
+# How long a worker trusts its index before checking the FAQs again. Edits made
+# through this worker invalidate it right away; this bounds how stale the other
+# workers can be.
+FAQ_INDEX_TTL = float(os.getenv("FAQ_INDEX_TTL", "60"))
+
+_PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+_versions = itertools.count(1)
+
+_index = None
+_index_lock = asyncio.Lock()
+# Coroutine function (db) -> a number that changes with every FAQ edit; see set_faq_version_source()
+_version_source = None
+
+
+def normalize(text: str) -> str:
+    # Remove punctuation, trim whitespace, and convert to lowercase.
+    return text.strip().lower().translate(_PUNCTUATION_TABLE)
+
+def faq_synonyms(faq) -> list:
+    """Synonyms of an FAQ row as a list, whatever shape the JSONB column holds"""
+    if isinstance(faq.synonyms, list):
+        return faq.synonyms
+    return [] if faq.synonyms is None else [faq.synonyms]
+
+
+class FAQIndex:
+    """
+        Pre-normalized FAQ questions and synonyms ready for matching.
+
+        Every question and synonym becomes a candidate. Candidates are kept in
+        flat arrays in FAQ order (question first, then its synonyms), so a
+        candidate id is a position in candidate_texts and maps to its FAQ via
+        candidate_faq. An FAQ's candidates are the ids from its
+        faq_candidate_start up to the next FAQ's. `postings` maps every token
+        to the ids of the candidates containing it.
+    """
+
+    def __init__(self, faqs, faq_version: int = None):
+        self.version = next(_versions)
+        # The database FAQ version the rows were read at, when known
+        self.faq_version = faq_version
+        self.built_at = time.monotonic()
+
+        self.faq_ids = array('q')
+        self.questions = []
+        self.answers = []
+        self.faq_candidate_start = array('I')
+
+        self.candidate_texts = []
+        self.candidate_tokens = []
+        self.candidate_sizes = array('I')
+        self.candidate_faq = array('I')
+        self.exact = {}
+        self.postings = {}
+
+        digest = hashlib.blake2b(digest_size=16)
+        for faq in faqs:
+            digest.update(faq_digest(faq))
+            position = len(self.answers)
+            self.faq_ids.append(faq.id if faq.id is not None else -1)
+            self.questions.append(faq.question)
+            self.answers.append(faq.answer)
+            self.faq_candidate_start.append(len(self.candidate_texts))
+            for text in [faq.question, *faq_synonyms(faq)]:
+                self._add_candidate(normalize(text), position)
+        # Compared with reloaded rows, to keep the index when nothing changed
+        self.fingerprint = digest.digest()
+
+    def _add_candidate(self, text: str, position: int):
+        candidate_id = len(self.candidate_texts)
+        tokens = frozenset(text.split())
+        self.candidate_texts.append(text)
+        self.candidate_tokens.append(tokens)
+        self.candidate_sizes.append(len(tokens))
+        self.candidate_faq.append(position)
+        self.exact.setdefault(text, candidate_id)
+        for token in tokens:
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = array('I')
+            postings.append(candidate_id)
+
+    def __len__(self):
+        return len(self.candidate_texts)
+
+    def answer_for(self, candidate_id: int) -> str:
+        return self.answers[self.candidate_faq[candidate_id]]
+
+    def question_for(self, candidate_id: int) -> str:
+        return self.questions[self.candidate_faq[candidate_id]]
+
+    def candidates_of(self, position: int) -> range:
+        """Candidate ids of the FAQ at `position`"""
+        start = self.faq_candidate_start[position]
+        end = self.faq_candidate_start[position + 1] if position + 1 < len(self.faq_candidate_start) else len(self.candidate_texts)
+        return range(start, end)
+
+    @property
+    def content_version(self):
+        """
+            Names the FAQ content the index holds: the database FAQ version
+            when known, otherwise this build. Unlike `version`, it stays the
+            same across rebuilds that found no FAQ change.
+        """
+        return ("faq", self.faq_version) if self.faq_version is not None else ("index", self.version)
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() - self.built_at < FAQ_INDEX_TTL
+
+    def refresh(self):
+        """Trust the index for another FAQ_INDEX_TTL, after checking no FAQ changed"""
+        self.built_at = time.monotonic()
+
+
+def faq_digest(faq) -> bytes:
+    """What of an FAQ row goes into the index, as bytes for the index's fingerprint"""
+    return repr((faq.id, faq.question, faq_synonyms(faq), faq.answer)).encode()
+
+def faq_fingerprint(faqs) -> bytes:
+    """Digest of FAQ rows in index order; equal for rows that build the same index"""
+    digest = hashlib.blake2b(digest_size=16)
+    for faq in faqs:
+        digest.update(faq_digest(faq))
+    return digest.digest()
+
+def as_faq_index(faqs) -> FAQIndex:
+    """Accept either a built index or a list of FAQ rows"""
+    return faqs if isinstance(faqs, FAQIndex) else FAQIndex(faqs)
+
+def build_faq_index(faqs, faq_version: int = None) -> FAQIndex:
+    """Build the index from FAQ rows and make it this worker's current index"""
+    global _index
+    _index = FAQIndex(faqs, faq_version)
+    logger.info("Built FAQ index v%s with %s FAQs and %s candidates", _index.version, len(_index.answers), len(_index))
+    return _index
+
+def current_faq_index():
+    """This worker's index if it is still fresh, without touching the database"""
+    if _index is not None and _index.is_fresh():
+        return _index
+    return None
+
+def set_faq_version_source(source):
+    """
+        Have a stale index check `await source(db)`, a cheap FAQ version,
+        before reloading the rows: while it is unchanged the index is kept
+        without reading any FAQs.
+    """
+    global _version_source
+    _version_source = source
+
+def invalidate_faq_index():
+    """Drop the index so the next query reloads the FAQs. Call after any FAQ edit."""
+    global _index
+    _index = None
+
+async def get_faq_index(db: AsyncSession) -> FAQIndex:
+    """
+        Return this worker's FAQ index, loading the FAQs only when it is
+        missing or stale. A stale index whose rows turn out unchanged is
+        kept, version and all, so everything keyed on it stays valid; only
+        an FAQ change, here or in another worker, rebuilds it.
+    """
+    index = current_faq_index()
+    if index is not None:
+        return index
+
+    async with _index_lock:
+        index = current_faq_index()
+        if index is not None:
+            return index
+        # Read before the rows: a change committed in between is in the rows
+        # and, having a higher version, is checked for again next time
+        faq_version = await _version_source(db) if _version_source is not None else None
+        if _index is not None and faq_version is not None and _index.faq_version == faq_version:
+            _index.refresh()
+            return _index
+        # Popular FAQs first, so they win ties and are tried first
+        result = await db.execute(select(FAQ).order_by(desc(FAQ.isPinned), desc(FAQ.hit_count), FAQ.id))
+        faqs = result.scalars().all()
+        if _index is not None and _index.fingerprint == faq_fingerprint(faqs):
+            _index.faq_version = faq_version
+            _index.refresh()
+            return _index
+        return build_faq_index(faqs, faq_version)
@@ -0,0 +1,115 @@
+import threading
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+from faqIndex import FAQIndex, normalize
+
+
+class BM25Ranker:
+    """
+        BM25 retrieval over FAQs, used to shortlist candidates for fuzzy matching.
+
+        Each FAQ is one document made of its normalized question, synonyms and
+        answer. Term weights live in a sparse (FAQ x term) CSC matrix, so a
+        query only touches the columns of its own tokens.
+
+        sync() brings the ranker up to date with an FAQIndex. Only FAQs whose
+        text changed are re-tokenized; the weight matrix is then rebuilt from
+        the cached term counts with NumPy.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary = {}
+        self._documents = {}    # faq id -> (text signature, term ids, term counts)
+        self._index_version = None
+        # (weights, FAQIndex position of each row), swapped together on rebuild
+        self._matrix = (sparse.csc_matrix((0, 0)), np.zeros(0, dtype=np.int64))
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def sync(self, index: FAQIndex):
+        """Update the ranker to the FAQs of `index`; a no-op if already synced to it"""
+        if self._index_version == index.version:
+            return
+        with self._lock:
+            if self._index_version == index.version:
+                return
+            current = {}
+            for position, faq_id in enumerate(index.faq_ids):
+                candidates = index.candidates_of(position)
+                signature = (tuple(index.candidate_texts[c] for c in candidates), index.answers[position])
+                document = self._documents.get(faq_id)
+                if document is None or document[0] != signature:
+                    document = self._tokenize(signature, [index.candidate_tokens[c] for c in candidates], index.answers[position])
+                current[faq_id] = document
+            self._documents = current
+            self._rebuild(index)
+            self._index_version = index.version
+
+    def _tokenize(self, signature, candidate_tokens, answer: str):
+        counts = Counter()
+        for tokens in candidate_tokens:
+            counts.update(tokens)
+        counts.update(normalize(answer).split())
+        term_ids = np.fromiter((self.vocabulary.setdefault(token, len(self.vocabulary)) for token in counts),
+                               dtype=np.int64, count=len(counts))
+        term_counts = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        return signature, term_ids, term_counts
+
+    def _rebuild(self, index: FAQIndex):
+        positions = {faq_id: position for position, faq_id in enumerate(index.faq_ids)}
+        faq_ids = list(self._documents)
+        documents = [self._documents[faq_id] for faq_id in faq_ids]
+        row_positions = np.fromiter((positions[faq_id] for faq_id in faq_ids), dtype=np.int64, count=len(faq_ids))
+        if not documents:
+            self._matrix = (sparse.csc_matrix((0, len(self.vocabulary))), row_positions)
+            return
+
+        lengths = np.array([doc[2].sum() for doc in documents])
+        rows = np.repeat(np.arange(len(documents)), [len(doc[1]) for doc in documents])
+        cols = np.concatenate([doc[1] for doc in documents])
+        tf = np.concatenate([doc[2] for doc in documents])
+
+        n_docs = len(documents)
+        df = np.bincount(cols, minlength=len(self.vocabulary))
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+        avg_length = lengths.mean() or 1.0
+        norm = self.k1 * (1 - self.b + self.b * lengths[rows] / avg_length)
+        weights = idf[cols] * tf * (self.k1 + 1) / (tf + norm)
+        self._matrix = (sparse.csc_matrix((weights, (rows, cols)), shape=(n_docs, len(self.vocabulary))), row_positions)
+
+    def top(self, query: str, k: int) -> list:
+        """Positions in the synced FAQIndex of the k best FAQs for the query, best first"""
+        weights, row_positions = self._matrix
+        columns = [self.vocabulary[token] for token in set(normalize(query).split()) if token in self.vocabulary]
+        columns = [column for column in columns if column < weights.shape[1]]
+        if not columns or k <= 0:
+            return []
+
+        indptr = weights.indptr
+        slices = [slice(indptr[column], indptr[column + 1]) for column in columns]
+        rows = np.concatenate([weights.indices[s] for s in slices])
+        if not len(rows):
+            return []
+        scores = np.bincount(rows, weights=np.concatenate([weights.data[s] for s in slices]), minlength=weights.shape[0])
+
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.lexsort((best, -scores[best]))]
+        return [int(row_positions[row]) for row in best if scores[row] > 0]
+
+    def stats(self) -> dict:
+        return {"documents": len(self._documents), "vocabulary": len(self.vocabulary),
+                "nonzero_weights": int(self._matrix[0].nnz), "index_version": self._index_version}
+
+
+def bm25_candidate_ids(ranker: BM25Ranker, index: FAQIndex, query: str, k: int) -> list:
+    """Candidate ids of the k best BM25 FAQs, best FAQ first"""
+    ranker.sync(index)
+    return [candidate_id for position in ranker.top(query, k) for candidate_id in index.candidates_of(position)]
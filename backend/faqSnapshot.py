@@ -0,0 +1,74 @@
+import gzip
+import json
+from datetime import datetime, timezone
+
+import anyio
+from sqlalchemy import desc, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from faqIndex import faq_synonyms, normalize
+from models import FAQ, FAQTombstone
+
+SNAPSHOT_FORMAT = 1
+# Each FAQ is one row in this column order, which keeps the payload compact.
+# "normalized" is the normalized question followed by the normalized synonyms,
+# exactly what the server matches against.
+FAQ_FIELDS = ["id", "version", "isPinned", "question", "synonyms", "answer", "normalized"]
+
+# (version, gzipped JSON) of the last snapshot this worker built
+_snapshot = None
+
+
+def faq_row(faq) -> list:
+    synonyms = faq_synonyms(faq)
+    return [faq.id, faq.version, faq.isPinned, faq.question, synonyms, faq.answer,
+            [normalize(faq.question), *(normalize(synonym) for synonym in synonyms)]]
+
+def snapshot_etag(version: int) -> str:
+    return f'"faq-{version}"'
+
+async def current_faq_version(db: AsyncSession) -> int:
+    """Highest version of any committed FAQ change, deletions included"""
+    faq_version = select(func.coalesce(func.max(FAQ.version), 0)).scalar_subquery()
+    tombstone_version = select(func.coalesce(func.max(FAQTombstone.version), 0)).scalar_subquery()
+    return await db.scalar(select(func.greatest(faq_version, tombstone_version)))
+
+async def get_faq_snapshot(db: AsyncSession, version: int) -> bytes:
+    """
+        Gzipped JSON of every FAQ as of `version`, built once per version.
+
+        `version` is read before the rows, so the rows may include a newer
+        change; a kiosk then receives it again in its next delta, which is
+        harmless because rows replace by id.
+    """
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is not None and snapshot[0] == version:
+        return snapshot[1]
+
+    result = await db.execute(select(FAQ).order_by(desc(FAQ.isPinned), FAQ.id))
+    document = {
+        "format": SNAPSHOT_FORMAT,
+        "version": version,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "fields": FAQ_FIELDS,
+        "faqs": [faq_row(faq) for faq in result.scalars().all()],
+    }
+    body = json.dumps(document, separators=(",", ":"), ensure_ascii=False).encode()
+    # mtime=0 so every worker produces the same bytes for the same data
+    compressed = await anyio.to_thread.run_sync(lambda: gzip.compress(body, compresslevel=9, mtime=0))
+    _snapshot = (version, compressed)
+    return compressed
+
+async def get_faq_delta(db: AsyncSession, since: int, version: int) -> dict:
+    """FAQs changed and ids deleted after `since`, up to at least `version`"""
+    changed = await db.execute(select(FAQ).where(FAQ.version > since).order_by(FAQ.version))
+    deleted = await db.execute(select(FAQTombstone.faq_id).where(FAQTombstone.version > since).order_by(FAQTombstone.version))
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "since": since,
+        "version": version,
+        "fields": FAQ_FIELDS,
+        "faqs": [faq_row(faq) for faq in changed.scalars().all()],
+        "deleted": deleted.scalars().all(),
+    }
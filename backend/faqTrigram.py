@@ -0,0 +1,52 @@
+import os
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from faqIndex import FAQIndex, faq_synonyms
+from models import FAQ, FAQSynonym
+
+# FAQs Postgres hands back for Python to re-rank
+TRIGRAM_CANDIDATES = int(os.getenv("FAQ_TRGM_CANDIDATES", "20"))
+# pg_trgm similarity a question or synonym needs to be considered at all
+TRIGRAM_SIMILARITY = float(os.getenv("FAQ_TRGM_SIMILARITY", "0.2"))
+
+# Best trigram similarity per FAQ over its question and synonyms. The % operator
+# is what lets Postgres use the GIN trigram indexes.
+TRIGRAM_CANDIDATES_SQL = text("""
+    SELECT faq.*
+    FROM faq
+    JOIN (
+        SELECT faq_id, max(sim) AS sim
+        FROM (
+            SELECT id AS faq_id, similarity(question, :query) AS sim
+            FROM faq WHERE question % :query
+            UNION ALL
+            SELECT faq_id, similarity(synonym, :query) AS sim
+            FROM faq_synonym WHERE synonym % :query
+        ) AS hits
+        GROUP BY faq_id
+        ORDER BY sim DESC, faq_id
+        LIMIT :limit
+    ) AS best ON best.faq_id = faq.id
+    ORDER BY best.sim DESC, faq.id
+""")
+
+
+async def fetch_trigram_candidates(db: AsyncSession, query: str, limit: int = TRIGRAM_CANDIDATES) -> list:
+    """FAQ rows whose question or a synonym is trigram-similar to the query, best first"""
+    # Transaction-local, so pooled connections keep the server default
+    await db.execute(text("SELECT set_config('pg_trgm.similarity_threshold', :threshold, true)"),
+                     {"threshold": str(TRIGRAM_SIMILARITY)})
+    result = await db.execute(select(FAQ).from_statement(TRIGRAM_CANDIDATES_SQL), {"query": query, "limit": limit})
+    return result.scalars().all()
+
+async def get_trigram_index(db: AsyncSession, query: str) -> FAQIndex:
+    """A small FAQIndex over the Postgres shortlist for this query"""
+    return FAQIndex(await fetch_trigram_candidates(db, query))
+
+def set_faq_synonyms(db: Session, faq: FAQ):
+    """Mirror faq.synonyms into faq_synonym. The caller commits."""
+    db.execute(delete(FAQSynonym).where(FAQSynonym.faq_id == faq.id))
+    db.add_all([FAQSynonym(faq_id=faq.id, synonym=synonym) for synonym in faq_synonyms(faq)])
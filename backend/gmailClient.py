@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import os
+import random
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Gmail calls in flight at once per process; the rest wait their turn
+GMAIL_MAX_CONCURRENCY = int(os.getenv("GMAIL_MAX_CONCURRENCY", "8"))
+# Seconds for a whole Gmail call, and for opening a connection
+GMAIL_TIMEOUT = float(os.getenv("GMAIL_TIMEOUT", "30"))
+GMAIL_CONNECT_TIMEOUT = float(os.getenv("GMAIL_CONNECT_TIMEOUT", "10"))
+# Seconds an idle connection is kept for the next call; covers the 90 s reply poll
+GMAIL_KEEPALIVE = float(os.getenv("GMAIL_KEEPALIVE", "120"))
+# Multiplex calls over one HTTP/2 connection when the h2 package is installed
+GMAIL_HTTP2 = os.getenv("GMAIL_HTTP2", "true").lower() in ("1", "true", "yes")
+
+# Gmail's per-user quota: GMAIL_QUOTA_RATE units per second shared by every
+# worker's calls, each costing its method's units. The mailbox allows 250
+# per second in all; the rest is headroom.
+GMAIL_QUOTA_RATE = float(os.getenv("GMAIL_QUOTA_RATE", "200"))
+# Units that can be spent at once after a quiet spell; at least one send
+GMAIL_QUOTA_BURST = float(os.getenv("GMAIL_QUOTA_BURST", "250"))
+# Retries of a call Gmail throttled or failed on its side, and the pause
+# before them, doubling from the base up to the max, with jitter
+GMAIL_MAX_RETRIES = int(os.getenv("GMAIL_MAX_RETRIES", "3"))
+GMAIL_BACKOFF_BASE = float(os.getenv("GMAIL_BACKOFF_BASE", "1"))
+GMAIL_BACKOFF_MAX = float(os.getenv("GMAIL_BACKOFF_MAX", "60"))
+GMAIL_QUOTA_UNITS = {
+    "messages.send": 100,
+    "messages.list": 5,
+    "messages.get": 5,
+    "messages.modify": 5,
+    "messages.batchModify": 50,
+    "threads.get": 10,
+    "history.list": 2,
+    "getProfile": 1,
+}
+# Reasons Gmail gives with a 403 when the rate, not the permission, was the problem
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+# Statuses that repeating the call won't change, such as a thread deleted since it was listed
+PERMANENT_STATUSES = {400, 404}
+
+try:
+    import h2  # noqa: F401  httpx needs it for HTTP/2
+except ImportError:
+    if GMAIL_HTTP2:
+        logger.warning("h2 is not installed; Gmail calls use HTTP/1.1")
+    GMAIL_HTTP2 = False
+
+
+def should_back_off(status: int, reason: str = None) -> bool:
+    """Whether a Gmail error status means slowing down: throttling, or Gmail failing on its side"""
+    return status == 429 or status >= 500 or (status == 403 and reason in RATE_LIMIT_REASONS)
+
+
+class GmailError(Exception):
+    """
+        A failed Gmail call. status is None when no response arrived
+        (timeout, connection error); retry_after is the server's Retry-After
+        in seconds, if it sent one.
+    """
+
+    def __init__(self, message: str, status: int = None, reason: str = None, retry_after: float = None):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def throttled(self) -> bool:
+        return self.status is not None and should_back_off(self.status, self.reason)
+
+    @property
+    def permanent(self) -> bool:
+        """Whether repeating the call would fail the same way"""
+        return self.status in PERMANENT_STATUSES
+
+
+class GmailClient:
+    """
+        Async client for the Gmail REST API calls the app makes, on one
+        pooled httpx client: connections are reused across calls, and
+        multiplexed over HTTP/2 when available, instead of each call
+        blocking a thread on its own httplib2 connection.
+
+        At most max_concurrency calls are in flight; others wait. With a
+        limiter (a rateLimiter.TokenBucket), each call first takes its
+        method's GMAIL_QUOTA_UNITS from it. Each call has a timeout.
+        token_source() returns the access token to send, and
+        token_refresher(rejected) a new one after a 401, upon which the call
+        is retried once. Responses are the API's JSON as dicts.
+
+        Calls Gmail throttles (429, or 403 for the rate) or fails on (5xx),
+        and reads that got no response, are retried up to max_retries
+        times. Each such failure pauses the limiter for a jittered,
+        doubling delay, so every call backs off together; without a
+        limiter only the failed call waits. A send is retried only when
+        Gmail refused it for the rate, since after any other failure it may
+        have gone out.
+    """
+
+    def __init__(self, base_url: str, token_source, token_refresher, max_concurrency: int = GMAIL_MAX_CONCURRENCY,
+                 timeout: float = GMAIL_TIMEOUT, http2: bool = GMAIL_HTTP2, limiter=None,
+                 max_retries: int = GMAIL_MAX_RETRIES):
+        self.base_url = base_url.rstrip("/") + "/gmail/v1/users/me/"
+        self.max_concurrency = max_concurrency
+        self.timeout = httpx.Timeout(timeout, connect=min(GMAIL_CONNECT_TIMEOUT, timeout))
+        self.http2 = http2
+        self.token_source = token_source
+        self.token_refresher = token_refresher
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self._client = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.calls = 0
+        self.errors = 0
+        self.refreshes = 0
+        self.retries = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.seconds = 0.0
+        self.http_version = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, http2=self.http2, timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency,
+                                    keepalive_expiry=GMAIL_KEEPALIVE))
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(self, call: str, method: str, path: str, params: dict = None, json: dict = None) -> dict:
+        """One Gmail call, named as in GMAIL_QUOTA_UNITS, with path relative to users/me/"""
+        for attempt in range(self.max_retries + 1):
+            if self.limiter is not None:
+                # Waiting for quota doesn't hold one of the max_concurrency slots
+                await self.limiter.acquire(GMAIL_QUOTA_UNITS.get(call, 5))
+            try:
+                result = await self._call(method, path, params, json)
+            except GmailError as e:
+                if not self._retryable(call, e):
+                    raise
+                # Back off even after the last attempt, so the calls that follow slow down too
+                if self.limiter is not None:
+                    delay = self.limiter.throttled(e.retry_after)
+                else:
+                    delay = e.retry_after or (min(GMAIL_BACKOFF_MAX, GMAIL_BACKOFF_BASE * 2 ** attempt)
+                                              * random.uniform(0.5, 1.0))
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                logger.warning("Gmail %s failed, retrying in %.1fs: %s", call, delay, e)
+                if self.limiter is None:
+                    await asyncio.sleep(delay)
+                continue
+            if self.limiter is not None:
+                self.limiter.succeeded()
+            return result
+
+    @staticmethod
+    def _retryable(call: str, error: GmailError) -> bool:
+        if call == "messages.send":
+            # Any other failure may have come after the message went out
+            return error.status in (429, 403) and error.throttled
+        return error.throttled or error.status is None
+
+    async def _call(self, method: str, path: str, params: dict, json: dict) -> dict:
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await self._request(method, path, params, json)
+        finally:
+            self.in_flight -= 1
+            self.seconds += time.perf_counter() - started
+            self._semaphore.release()
+
+    async def _request(self, method: str, path: str, params: dict, json: dict) -> dict:
+        if params:
+            params = {key: value for key, value in params.items() if value is not None}
+        token = await self.token_source()
+        for attempt in range(2):
+            self.calls += 1
+            try:
+                response = await self._http().request(method, path, params=params, json=json,
+                                                      headers={"Authorization": f"Bearer {token}"})
+            except httpx.HTTPError as e:
+                self.errors += 1
+                raise GmailError(f"{method} {path}: {e!r}") from e
+            self.http_version = response.http_version
+            if response.status_code == 401 and attempt == 0:
+                self.refreshes += 1
+                token = await self.token_refresher(token)
+                continue
+            break
+
+        if response.status_code >= 400:
+            self.errors += 1
+            try:
+                error = response.json()["error"]
+                message = error.get("message", "")
+                reason = (error.get("errors") or [{}])[0].get("reason") or error.get("status")
+            except (ValueError, KeyError, TypeError, AttributeError):
+                message, reason = response.text[:200], None
+            try:
+                retry_after = float(response.headers["Retry-After"])
+            except (KeyError, ValueError):
+                retry_after = None
+            raise GmailError(f"{method} {path} returned {response.status_code}: {message}",
+                             status=response.status_code, reason=reason, retry_after=retry_after)
+        return response.json() if response.content else {}
+
+    async def send(self, raw: str, thread_id: str = None) -> dict:
+        """messages.send for a base64url-encoded RFC 2822 message"""
+        body = {"raw": raw}
+        if thread_id:
+            body["threadId"] = thread_id
+        return await self.request("messages.send", "POST", "messages/send", json=body)
+
+    async def list_messages(self, q: str = None, label_ids: list = None, max_results: int = None,
+                            page_token: str = None) -> dict:
+        return await self.request("messages.list", "GET", "messages", params={"q": q, "labelIds": label_ids,
+                                                             "maxResults": max_results, "pageToken": page_token})
+
+    async def get_message(self, message_id: str, format: str = "full", metadata_headers: list = None) -> dict:
+        return await self.request("messages.get", "GET", f"messages/{message_id}",
+                                  params={"format": format, "metadataHeaders": metadata_headers})
+
+    async def get_thread(self, thread_id: str, format: str = "full", metadata_headers: list = None) -> dict:
+        return await self.request("threads.get", "GET", f"threads/{thread_id}",
+                                  params={"format": format, "metadataHeaders": metadata_headers})
+
+    async def modify_message(self, message_id: str, add_label_ids: list = None, remove_label_ids: list = None) -> dict:
+        return await self.request("messages.modify", "POST", f"messages/{message_id}/modify",
+                                  json={"addLabelIds": add_label_ids or [], "removeLabelIds": remove_label_ids or []})
+
+    async def batch_modify_messages(self, message_ids: list, add_label_ids: list = None,
+                                    remove_label_ids: list = None) -> dict:
+        """Change the labels of up to 1000 messages in one call"""
+        return await self.request("messages.batchModify", "POST", "messages/batchModify",
+                                  json={"ids": message_ids, "addLabelIds": add_label_ids or [],
+                                        "removeLabelIds": remove_label_ids or []})
+
+    async def list_history(self, start_history_id: str, history_types: list = None, label_id: str = None,
+                           max_results: int = None, page_token: str = None) -> dict:
+        return await self.request("history.list", "GET", "history", params={"startHistoryId": start_history_id,
+                                                            "historyTypes": history_types, "labelId": label_id,
+                                                            "maxResults": max_results, "pageToken": page_token})
+
+    async def get_profile(self) -> dict:
+        """Mailbox address, message counts and current historyId"""
+        return await self.request("getProfile", "GET", "profile")
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "refreshes": self.refreshes,
+            "retries": self.retries,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "seconds": round(self.seconds, 3),
+            "http2": self.http2,
+            "http_version": self.http_version,
+            "quota": self.limiter.stats() if self.limiter is not None else None,
+        }
+
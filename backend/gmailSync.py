@@ -0,0 +1,115 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from gmailClient import GmailError
+from models import GmailProcessedMessage, GmailSyncState
+from otp import gmail_client
+
+logger = logging.getLogger(__name__)
+
+# Changes per history.list page
+GMAIL_HISTORY_PAGE_SIZE = int(os.getenv("GMAIL_HISTORY_PAGE_SIZE", "500"))
+# Messages the fallback search takes per query, when there is no usable checkpoint
+GMAIL_FULL_SYNC_LIMIT = int(os.getenv("GMAIL_FULL_SYNC_LIMIT", "100"))
+# Days a processed message is remembered; far longer than Gmail keeps history
+GMAIL_PROCESSED_RETENTION_DAYS = float(os.getenv("GMAIL_PROCESSED_RETENTION_DAYS", "30"))
+
+sync_stats = {
+    "cycles": 0,
+    "full_syncs": 0,
+    "history_pages": 0,
+    "changes": 0,
+    "already_processed": 0,
+    "history_id": None,
+}
+
+
+def get_checkpoint(db: Session, name: str):
+    return db.scalar(select(GmailSyncState.history_id).where(GmailSyncState.name == name))
+
+def save_checkpoint(db: Session, name: str, history_id: int):
+    """Move the checkpoint forward, never back, should another worker have read further. The caller commits."""
+    statement = pg_insert(GmailSyncState).values(name=name, history_id=history_id)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[GmailSyncState.name],
+        set_={"history_id": func.greatest(GmailSyncState.history_id, statement.excluded.history_id),
+              "updated_at": func.now()}))
+    sync_stats["history_id"] = history_id
+
+async def read_history(start_history_id: int) -> tuple:
+    """
+        (messages, history id) for the messages added to the inbox after
+        start_history_id, oldest first, one entry per message. Raises
+        GmailError with status 404 when Gmail no longer has that history.
+    """
+    messages = {}
+    page_token = None
+    while True:
+        page = await gmail_client.list_history(start_history_id, history_types=["messageAdded"], label_id="INBOX",
+                                               max_results=GMAIL_HISTORY_PAGE_SIZE, page_token=page_token)
+        sync_stats["history_pages"] += 1
+        for record in page.get("history", []):
+            for added in record.get("messagesAdded", []):
+                message = added["message"]
+                messages[message["id"]] = {"id": message["id"], "threadId": message["threadId"]}
+        page_token = page.get("nextPageToken")
+        if not page_token:
+            return list(messages.values()), int(page["historyId"])
+
+async def search_unread(queries: list) -> list:
+    """Unread messages matching any of the Gmail search queries, the way the pollers used to look"""
+    messages = {}
+    for query in queries:
+        page = await gmail_client.list_messages(q=f"{query} is:unread", max_results=GMAIL_FULL_SYNC_LIMIT)
+        for message in page.get("messages", []):
+            messages[message["id"]] = message
+    return list(messages.values())
+
+async def changed_messages(db: Session, name: str, full_sync_queries: list) -> tuple:
+    """
+        (messages, history id) for the inbox messages that arrived since
+        the `name` checkpoint and have not been processed yet. Save the
+        history id with save_checkpoint() once they are handled.
+
+        Without a checkpoint, or when Gmail has expired the history since
+        it, the unread messages matching full_sync_queries are returned
+        instead, and the current history id becomes the checkpoint.
+    """
+    sync_stats["cycles"] += 1
+    checkpoint = get_checkpoint(db, name)
+    messages = None
+    if checkpoint is not None:
+        try:
+            messages, history_id = await read_history(checkpoint)
+        except GmailError as e:
+            if e.status != 404:
+                raise
+            logger.warning("Gmail history since %s has expired; searching unread mail instead", checkpoint)
+    if messages is None:
+        sync_stats["full_syncs"] += 1
+        # Read the history id first, so mail arriving during the search is read next cycle
+        history_id = int((await gmail_client.get_profile())["historyId"])
+        messages = await search_unread(full_sync_queries)
+
+    sync_stats["changes"] += len(messages)
+    if messages:
+        processed = set(db.scalars(select(GmailProcessedMessage.message_id).where(
+            GmailProcessedMessage.message_id.in_([message["id"] for message in messages]))))
+        sync_stats["already_processed"] += len(processed)
+        messages = [message for message in messages if message["id"] not in processed]
+    return messages, history_id
+
+def record_processed(db: Session, message_ids: list, thread_id: str, kind: str, outcome: str):
+    """Remember messages as handled, in the transaction of what handling them changed. The caller commits."""
+    for message_id in message_ids:
+        db.add(GmailProcessedMessage(message_id=message_id, thread_id=thread_id, kind=kind, outcome=outcome))
+
+def prune_processed(db: Session):
+    """Forget processed messages past the retention period. The caller commits."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=GMAIL_PROCESSED_RETENTION_DAYS)
+    db.execute(delete(GmailProcessedMessage).where(GmailProcessedMessage.processed_at < cutoff))
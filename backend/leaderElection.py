@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import logging
+import os
+import random
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select
+
+from database import get_async_engine
+
+logger = logging.getLogger(__name__)
+
+# Seconds between a follower's attempts to take over a job
+LEADER_RETRY_INTERVAL = float(os.getenv("LEADER_RETRY_INTERVAL", "15"))
+# Seconds between the leader's checks that its lock connection is still alive
+LEADER_CHECK_INTERVAL = float(os.getenv("LEADER_CHECK_INTERVAL", "15"))
+# Namespace of the advisory lock keys, so other apps on the database don't collide
+LEADER_LOCK_PREFIX = os.getenv("LEADER_LOCK_PREFIX", "rtu-kiosk")
+
+# name -> this worker's view of the job's election
+leader_stats = {}
+
+
+def lock_key(name: str) -> int:
+    """The 64-bit advisory lock key of a job, the same in every process"""
+    digest = hashlib.blake2b(f"{LEADER_LOCK_PREFIX}:{name}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+async def run_as_leader(name: str, job):
+    """
+        Run the coroutine function `job` in one worker at a time, across
+        every process using the database.
+
+        Each worker tries to take a Postgres session-level advisory lock
+        named after the job, on a connection it keeps for as long as it
+        leads. The one that gets it runs the job; the others retry every
+        LEADER_RETRY_INTERVAL. Postgres releases the lock when its
+        connection closes, so when the leader dies, or loses the database,
+        another worker takes over on its next attempt. A leader whose lock
+        connection fails stops the job within LEADER_CHECK_INTERVAL, which
+        is why that interval should not exceed LEADER_RETRY_INTERVAL.
+    """
+    stats = leader_stats.setdefault(name, {"leader": False, "since": None, "elections": 0, "terms": 0,
+                                           "lost": 0, "errors": 0, "lock_key": lock_key(name)})
+    if get_async_engine().dialect.name != "postgresql":
+        logger.warning("No advisory locks on %s; running %s in this worker", get_async_engine().dialect.name, name)
+        stats.update(leader=True, since=datetime.now(timezone.utc).isoformat())
+        return await job()
+
+    while True:
+        try:
+            await _campaign(name, job, stats)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            stats["errors"] += 1
+            logger.warning("Leader election for %s failed: %s", name, e)
+        # Jitter keeps the followers from all asking at the same moment
+        await asyncio.sleep(LEADER_RETRY_INTERVAL * random.uniform(0.8, 1.2))
+
+async def _campaign(name: str, job, stats: dict):
+    """Lead the job if its lock is free, until the job ends or the lock's connection fails"""
+    key = lock_key(name)
+    async with get_async_engine().connect() as connection:
+        stats["elections"] += 1
+        acquired = await connection.scalar(select(func.pg_try_advisory_lock(key)))
+        # The lock belongs to the session; don't leave a transaction open while leading
+        await connection.commit()
+        if not acquired:
+            return
+        stats.update(leader=True, since=datetime.now(timezone.utc).isoformat(), terms=stats["terms"] + 1)
+        logger.info("Worker %d now leads %s", os.getpid(), name)
+        task = asyncio.create_task(job())
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=LEADER_CHECK_INTERVAL)
+                if not task.done():
+                    await connection.scalar(select(1))
+                    await connection.commit()
+            task.result()
+        except BaseException as e:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            # Never return a connection to the pool still holding the lock
+            await connection.invalidate()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            stats["lost"] += 1
+            logger.error("Worker %d stopped leading %s: %s", os.getpid(), name, e)
+            return
+        finally:
+            stats.update(leader=False, since=None)
+        await connection.scalar(select(func.pg_advisory_unlock(key)))
+        await connection.commit()
+
+@asynccontextmanager
+async def job_lock(name: str):
+    """
+        Take the job's advisory lock for one run, if it is free; yields
+        whether it was. A worker leading the job through run_as_leader()
+        holds the same lock, so a run never overlaps it, or another run.
+    """
+    engine = get_async_engine()
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    key = lock_key(name)
+    async with engine.connect() as connection:
+        acquired = await connection.scalar(select(func.pg_try_advisory_lock(key)))
+        await connection.commit()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    await connection.scalar(select(func.pg_advisory_unlock(key)))
+                    await connection.commit()
+                except BaseException:
+                    # Never return a connection to the pool still holding the lock
+                    await connection.invalidate()
+                    raise
+
+def get_leader_stats() -> dict:
+    return {name: dict(stats) for name, stats in leader_stats.items()}
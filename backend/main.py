@@ -3,39 +3,77 @@ import logging
 from fastapi import FastAPI, HTTPException,status
 from fastapi.middleware.cors import CORSMiddleware
 from models import Image
-from database import db_dependency
+from sqlalchemy import select
+from database import async_db_dependency, db_dependency, dispose_async_engine, dispose_engine, pool_stats
 from auth import router as auth_router, user_dependency
 from adcrud import router as adcrud_router, periodic_cleanup
-from chatcrud import router as chat_router
+from chatcrud import router as chat_router, warm_chat_cache
 from appointmentCore import router as appointment_router, check_email_periodically
 from professorCore import router as professor_router
-from otp import router as otp_router, cleanup_expired_otp
+from otp import router as otp_router, cleanup_expired_otp, get_gmail_stats, gmail_client
+from unknownQueries import flush_unknown_queries, flush_unknown_queries_periodically
+from faqHits import flush_faq_hits, flush_faq_hits_periodically
+from gmailSync import sync_stats as gmail_sync_stats
+from emailOutbox import OUTBOX_WORKERS, count_outbox_by_status, outbox_stats, run_outbox_worker
+from leaderElection import get_leader_stats, run_as_leader
 from mapCore import router as map_router
 from contextlib import asynccontextmanager
 import asyncio
 import os
 env = os.getenv("ENV")
+# Set to false when scheduler.py runs the periodic jobs instead of the web workers
+RUN_SCHEDULED_JOBS = os.getenv("RUN_SCHEDULED_JOBS", "true").lower() in ("1", "true", "yes")
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 background_tasks = set()
 
+async def warm_up():
+    """Load the FAQ index and cache the popular answers in the background, so startup isn't delayed"""
+    try:
+        warmed = await warm_chat_cache()
+        logger.info("Warmed the chat cache with %d answers", warmed)
+    except Exception as e:
+        logger.error("Chat cache warm-up failed: %s", e)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logging.info("Starting background tasks...")
     
-    task1 = asyncio.create_task(periodic_cleanup())
-    background_tasks.add(task1)
-    task1.add_done_callback(background_tasks.discard)
-
-    task2 = asyncio.create_task(cleanup_expired_otp())
-    background_tasks.add(task2)
-    task2.add_done_callback(background_tasks.discard)
-
-    task3 = asyncio.create_task(check_email_periodically())
-    background_tasks.add(task3)
-    task3.add_done_callback(background_tasks.discard)
+    # Jobs on shared state run in one worker at a time, whichever leads them;
+    # the flushers and outbox workers below run in every worker
+    if RUN_SCHEDULED_JOBS:
+        task1 = asyncio.create_task(run_as_leader("image_cleanup", periodic_cleanup))
+        background_tasks.add(task1)
+        task1.add_done_callback(background_tasks.discard)
+
+        task2 = asyncio.create_task(run_as_leader("otp_cleanup", cleanup_expired_otp))
+        background_tasks.add(task2)
+        task2.add_done_callback(background_tasks.discard)
+
+        task3 = asyncio.create_task(run_as_leader("email_check", check_email_periodically))
+        background_tasks.add(task3)
+        task3.add_done_callback(background_tasks.discard)
+    else:
+        logging.info("Periodic jobs are left to the scheduler process")
+
+    task4 = asyncio.create_task(flush_unknown_queries_periodically())
+    background_tasks.add(task4)
+    task4.add_done_callback(background_tasks.discard)
+
+    task5 = asyncio.create_task(flush_faq_hits_periodically())
+    background_tasks.add(task5)
+    task5.add_done_callback(background_tasks.discard)
+
+    task6 = asyncio.create_task(warm_up())
+    background_tasks.add(task6)
+    task6.add_done_callback(background_tasks.discard)
+
+    for _ in range(OUTBOX_WORKERS):
+        outbox_task = asyncio.create_task(run_outbox_worker())
+        background_tasks.add(outbox_task)
+        outbox_task.add_done_callback(background_tasks.discard)
 
     logging.info("Background tasks started successfully")
     yield
@@ -48,6 +86,17 @@ async def lifespan(app: FastAPI):
     # Wait for all tasks to be cancelled
     await asyncio.gather(*background_tasks, return_exceptions=True)
     logging.info("All background tasks stopped")
+    try:
+        await flush_unknown_queries()
+    except Exception as e:
+        logger.error("Could not flush unknown queries on shutdown: %s", e)
+    try:
+        await flush_faq_hits()
+    except Exception as e:
+        logger.error("Could not flush FAQ hit counts on shutdown: %s", e)
+    await gmail_client.aclose()
+    dispose_engine()
+    await dispose_async_engine()
 
 if env == "development":
     app = FastAPI(title="Running in development environment", lifespan=lifespan)
@@ -70,6 +119,7 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "ETag"],
 )
 
 @app.get("/ping", status_code=status.HTTP_200_OK)
@@ -82,19 +132,42 @@ async def getLogin(user: user_dependency, db: db_dependency):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed")
     return {"message" : "Welcome Admin!"}
 
+@app.get("/pool-stats", status_code=status.HTTP_200_OK)
+async def get_pool_stats(user: user_dependency):
+    """Database connection pool usage for this worker"""
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed")
+    return {"pid": os.getpid(), **pool_stats()}
+
+@app.get("/gmail-stats", status_code=status.HTTP_200_OK)
+async def gmail_stats(user: user_dependency):
+    """Gmail service builds and token refreshes, and outbox deliveries, for this worker"""
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed")
+    return {"pid": os.getpid(), **get_gmail_stats(),
+            "reply_sync": gmail_sync_stats,
+            "outbox": {**outbox_stats, "by_status": await count_outbox_by_status()}}
+
+@app.get("/leader-stats", status_code=status.HTTP_200_OK)
+async def leader_stats(user: user_dependency):
+    """Which background jobs this worker leads, and its elections for them"""
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed")
+    return {"pid": os.getpid(), "jobs": get_leader_stats()}
+
 
 # Get all images filename
 @app.get('/')
-async def get_images(db: db_dependency):
-    images = db.query(Image).all()
+async def get_images(db: async_db_dependency):
+    images = await db.execute(select(Image.filename, Image.duration))
     list_of_images = []
     for image in images:
         list_of_images.append({"filename": image.filename, "duration": image.duration})
     return list_of_images
 
 @app.get('/api/images')
-async def get_images_api(db: db_dependency):
-    images = db.query(Image).all()
+async def get_images_api(db: async_db_dependency):
+    images = await db.execute(select(Image.filename, Image.duration))
     list_of_images = []
     for image in images:
         list_of_images.append({"filename": image.filename, "duration": image.duration})
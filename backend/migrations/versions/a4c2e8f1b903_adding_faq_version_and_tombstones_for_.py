@@ -0,0 +1,79 @@
+"""adding faq version and tombstones for kiosk delta sync
+
+Revision ID: a4c2e8f1b903
+Revises: e3b1f0a2c7d4
+Create Date: 2026-10-18 14:26:53.104877
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c2e8f1b903'
+down_revision: Union[str, None] = 'e3b1f0a2c7d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE SEQUENCE faq_version_seq')
+    # nextval is volatile, so every existing row gets its own version
+    op.add_column('faq', sa.Column('version', sa.BigInteger(), server_default=sa.text("nextval('faq_version_seq')"), nullable=False))
+    op.create_index(op.f('ix_faq_version'), 'faq', ['version'], unique=False)
+
+    op.create_table('faq_tombstone',
+    sa.Column('faq_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('faq_id')
+    )
+    op.create_index(op.f('ix_faq_tombstone_version'), 'faq_tombstone', ['version'], unique=False)
+
+    # Only changes to what kiosks store draw a new version. Writers take a
+    # transaction-scoped advisory lock before drawing one, so versions become
+    # visible in commit order and a kiosk that synced up to version N can
+    # never miss a change numbered below N.
+    op.execute("""
+        CREATE FUNCTION faq_bump_version() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE'
+               AND (NEW.question, NEW.synonyms, NEW.answer, NEW."isPinned")
+                   IS NOT DISTINCT FROM (OLD.question, OLD.synonyms, OLD.answer, OLD."isPinned") THEN
+                NEW.version := OLD.version;
+                RETURN NEW;
+            END IF;
+            PERFORM pg_advisory_xact_lock(hashtext('faq_version'));
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO faq_tombstone (faq_id, version) VALUES (OLD.id, nextval('faq_version_seq'))
+                ON CONFLICT (faq_id) DO UPDATE SET version = excluded.version, deleted_at = now();
+                RETURN OLD;
+            END IF;
+            NEW.version := nextval('faq_version_seq');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER faq_version_write BEFORE INSERT OR UPDATE ON faq
+        FOR EACH ROW EXECUTE FUNCTION faq_bump_version()
+    """)
+    op.execute("""
+        CREATE TRIGGER faq_version_delete AFTER DELETE ON faq
+        FOR EACH ROW EXECUTE FUNCTION faq_bump_version()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER faq_version_delete ON faq')
+    op.execute('DROP TRIGGER faq_version_write ON faq')
+    op.execute('DROP FUNCTION faq_bump_version()')
+    op.drop_index(op.f('ix_faq_tombstone_version'), table_name='faq_tombstone')
+    op.drop_table('faq_tombstone')
+    op.drop_index(op.f('ix_faq_version'), table_name='faq')
+    op.drop_column('faq', 'version')
+    op.execute('DROP SEQUENCE faq_version_seq')
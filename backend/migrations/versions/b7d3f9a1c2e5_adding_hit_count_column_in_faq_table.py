@@ -0,0 +1,30 @@
+"""adding hit_count column in faq table
+
+Revision ID: b7d3f9a1c2e5
+Revises: a4c2e8f1b903
+Create Date: 2026-10-18 15:22:41.508317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d3f9a1c2e5'
+down_revision: Union[str, None] = 'a4c2e8f1b903'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Not among the columns faq_bump_version() tracks, so counting hits
+    # doesn't change the FAQ version kiosks sync by
+    op.add_column('faq', sa.Column('hit_count', sa.BigInteger(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('faq', 'hit_count')
@@ -0,0 +1,44 @@
+"""adding gmail_sync_state and gmail_processed_message tables
+
+Revision ID: d2f7b3c9e1a4
+Revises: c5e8a2d4f6b1
+Create Date: 2026-10-18 19:05:41.218364
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f7b3c9e1a4'
+down_revision: Union[str, None] = 'c5e8a2d4f6b1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('gmail_sync_state',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('history_id', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.create_table('gmail_processed_message',
+    sa.Column('message_id', sa.String(), nullable=False),
+    sa.Column('thread_id', sa.String(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('outcome', sa.String(), nullable=False),
+    sa.Column('processed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('message_id')
+    )
+    op.create_index(op.f('ix_gmail_processed_message_processed_at'), 'gmail_processed_message', ['processed_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_gmail_processed_message_processed_at'), table_name='gmail_processed_message')
+    op.drop_table('gmail_processed_message')
+    op.drop_table('gmail_sync_state')
@@ -0,0 +1,53 @@
+"""adding faq_synonym table and trigram indexes for faq search
+
+Revision ID: d9cd7d667af9
+Revises: c8c8b740cf5b
+Create Date: 2026-10-18 09:12:41.530214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9cd7d667af9'
+down_revision: Union[str, None] = 'c8c8b740cf5b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_table('faq_synonym',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('faq_id', sa.Integer(), nullable=False),
+    sa.Column('synonym', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['faq_id'], ['faq.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_faq_synonym_id'), 'faq_synonym', ['id'], unique=False)
+    op.create_index(op.f('ix_faq_synonym_faq_id'), 'faq_synonym', ['faq_id'], unique=False)
+    op.create_index('ix_faq_synonym_synonym_trgm', 'faq_synonym', ['synonym'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'synonym': 'gin_trgm_ops'})
+    op.create_index('ix_faq_question_trgm', 'faq', ['question'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'question': 'gin_trgm_ops'})
+
+    # Copy the synonyms already stored in faq.synonyms
+    op.execute("""
+        INSERT INTO faq_synonym (faq_id, synonym)
+        SELECT faq.id, synonym
+        FROM faq, jsonb_array_elements_text(faq.synonyms) AS synonym
+        WHERE jsonb_typeof(faq.synonyms) = 'array'
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_faq_question_trgm', table_name='faq', postgresql_using='gin')
+    op.drop_index('ix_faq_synonym_synonym_trgm', table_name='faq_synonym', postgresql_using='gin')
+    op.drop_index(op.f('ix_faq_synonym_faq_id'), table_name='faq_synonym')
+    op.drop_index(op.f('ix_faq_synonym_id'), table_name='faq_synonym')
+    op.drop_table('faq_synonym')
@@ -0,0 +1,69 @@
+"""aggregating user_faq by normalized query with counts and timestamps
+
+Revision ID: e3b1f0a2c7d4
+Revises: d9cd7d667af9
+Create Date: 2026-10-18 11:04:17.286431
+
+"""
+import string
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b1f0a2c7d4'
+down_revision: Union[str, None] = 'd9cd7d667af9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user_faq', sa.Column('normalized_query', sa.String(), nullable=True))
+    op.add_column('user_faq', sa.Column('count', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('user_faq', sa.Column('first_seen', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+    op.add_column('user_faq', sa.Column('last_seen', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+
+    # Same normalization as faqIndex.normalize: trim, lowercase, drop punctuation
+    op.execute(sa.text("""
+        UPDATE user_faq
+        SET query = btrim(query, E' \\t\\n\\r\\f\\v'),
+            normalized_query = coalesce(
+                nullif(translate(lower(btrim(query, E' \\t\\n\\r\\f\\v')), :punctuation, ''), ''),
+                lower(btrim(query, E' \\t\\n\\r\\f\\v')))
+    """).bindparams(punctuation=string.punctuation))
+
+    # Fold duplicates into the oldest row, keeping the number of times each was asked
+    op.execute("""
+        UPDATE user_faq
+        SET count = dupes.total
+        FROM (
+            SELECT min(id) AS keep_id, count(*) AS total
+            FROM user_faq
+            GROUP BY normalized_query
+        ) AS dupes
+        WHERE user_faq.id = dupes.keep_id
+    """)
+    op.execute("""
+        DELETE FROM user_faq
+        USING user_faq AS kept
+        WHERE user_faq.normalized_query = kept.normalized_query AND user_faq.id > kept.id
+    """)
+
+    op.alter_column('user_faq', 'normalized_query', nullable=False)
+    op.create_unique_constraint('user_faq_normalized_query_key', 'user_faq', ['normalized_query'])
+    op.create_index(op.f('ix_user_faq_count'), 'user_faq', ['count'], unique=False)
+    op.create_index(op.f('ix_user_faq_last_seen'), 'user_faq', ['last_seen'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_user_faq_last_seen'), table_name='user_faq')
+    op.drop_index(op.f('ix_user_faq_count'), table_name='user_faq')
+    op.drop_constraint('user_faq_normalized_query_key', 'user_faq', type_='unique')
+    op.drop_column('user_faq', 'last_seen')
+    op.drop_column('user_faq', 'first_seen')
+    op.drop_column('user_faq', 'count')
+    op.drop_column('user_faq', 'normalized_query')
@@ -1,11 +1,13 @@
 from sqlalchemy.orm import declarative_base, relationship
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, func, ForeignKey
+from sqlalchemy import BigInteger, Column, FetchedValue, Integer, Sequence, String, Text, DateTime, Boolean, func, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.sql import expression
 from datetime import datetime, timedelta
 
 Base = declarative_base()
 
+faq_version_seq = Sequence('faq_version_seq', metadata=Base.metadata)
+
 class User(Base):
     __tablename__ = "users"
     
@@ -34,6 +36,34 @@ class FAQ(Base):
     synonyms = Column(JSONB, nullable=True)
     answer = Column(String, nullable=False)
     isPinned = Column(Boolean, server_default=expression.false(), nullable=False)
+    # Bumped from faq_version_seq by a trigger whenever question, synonyms,
+    # answer or isPinned change; kiosks sync deltas by it
+    version = Column(BigInteger, server_default=faq_version_seq.next_value(), server_onupdate=FetchedValue(),
+                     nullable=False, index=True)
+    # Chat queries this FAQ answered, flushed from the workers' counters
+    hit_count = Column(BigInteger, server_default='0', nullable=False)
+
+    __table_args__ = (
+        Index('ix_faq_question_trgm', 'question', postgresql_using='gin', postgresql_ops={'question': 'gin_trgm_ops'}),
+    )
+
+class FAQSynonym(Base):
+    __tablename__ = "faq_synonym"   # One row per synonym so Postgres can trigram-index them
+
+    id = Column(Integer, primary_key=True, index=True)
+    faq_id = Column(Integer, ForeignKey("faq.id", ondelete="CASCADE"), nullable=False, index=True)
+    synonym = Column(String, nullable=False)
+
+    __table_args__ = (
+        Index('ix_faq_synonym_synonym_trgm', 'synonym', postgresql_using='gin', postgresql_ops={'synonym': 'gin_trgm_ops'}),
+    )
+
+class FAQTombstone(Base):
+    __tablename__ = "faq_tombstone"   # Written by a trigger when an FAQ is deleted
+
+    faq_id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, index=True)
+    deleted_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
 class ProfessorInformation(Base):
     __tablename__ = "professor_information"
@@ -89,7 +119,48 @@ class OTPSecret(Base):
         return cls(email=email, secret=secret, expires_at=expires_at, is_used=False)
     
 class UserFAQ(Base):
-    __tablename__ = "user_faq"
+    __tablename__ = "user_faq"   # One row per distinct unknown question
 
     id = Column(Integer, primary_key=True, index=True)
     query = Column(String, nullable=False)
+    normalized_query = Column(String, unique=True, nullable=False)
+    count = Column(Integer, nullable=False, server_default='1', index=True)
+    first_seen = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_seen = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"   # Emails written with the change they announce, sent by the outbox workers
+
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String, nullable=False)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    raw = Column(Text, nullable=False)   # base64url-encoded MIME message, as Gmail's send takes it
+    status = Column(String, nullable=False, server_default='pending')   # pending, sending, sent or dead
+    attempts = Column(Integer, nullable=False, server_default='0')
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    gmail_message_id = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+class GmailSyncState(Base):
+    __tablename__ = "gmail_sync_state"   # How far each mailbox reader has read Gmail's history
+
+    name = Column(String, primary_key=True)
+    history_id = Column(BigInteger, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class GmailProcessedMessage(Base):
+    __tablename__ = "gmail_processed_message"   # Replies already acted on, written with the change they caused
+
+    message_id = Column(String, primary_key=True)
+    thread_id = Column(String, nullable=False)
+    kind = Column(String, nullable=False)
+    outcome = Column(String, nullable=False)
+    processed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
@@ -1,16 +1,28 @@
 import os.path
 import os
 import base64
-from datetime import datetime
+import fcntl
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 import asyncio
 import logging
+import anyio
+import httplib2
 import pyotp
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest, HttpRequest
+
+from gmailClient import (GMAIL_BACKOFF_BASE, GMAIL_BACKOFF_MAX, GMAIL_QUOTA_BURST, GMAIL_QUOTA_RATE, GmailClient,
+                         GmailError)
+from rateLimiter import SharedTokenBucket, TokenBucket
 
 from email.message import EmailMessage
 from fastapi import APIRouter, HTTPException, Depends
@@ -18,11 +30,10 @@ from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.orm import Session
 
 from models import OTPSecret
-from database import create_session, db_connect, get_db
+from database import create_session, get_db
 from schemas import OTPRequest, OTPVerify
 
 router = APIRouter(prefix="/otp", tags=["gmail"])
-session = create_session(db_connect()[0])
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.ERROR)
@@ -30,48 +41,212 @@ logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.ERROR)
 
 SCOPES = ["https://www.googleapis.com/auth/gmail.send", "https://www.googleapis.com/auth/gmail.modify"]
 
+# The file token.json stores the user's access and refresh tokens, and is
+# created automatically when the authorization flow completes for the first time.
+GMAIL_TOKEN_FILE = os.getenv("GMAIL_TOKEN_FILE", "token.json")
+GMAIL_CREDENTIALS_FILE = os.getenv("GMAIL_CREDENTIALS_FILE", "credentials.json")
+# Seconds before expiry at which the access token is refreshed ahead of use
+GMAIL_REFRESH_MARGIN = float(os.getenv("GMAIL_REFRESH_MARGIN", "300"))
+# Gmail API root; set to a local fake server to exercise the mail code offline
+GMAIL_API_ENDPOINT = os.getenv("GMAIL_API_ENDPOINT", "https://gmail.googleapis.com/").rstrip("/") + "/"
+# OAuth token endpoint override, to go with a fake API endpoint; token.json can't set it
+GMAIL_TOKEN_URI = os.getenv("GMAIL_TOKEN_URI")
+# The client builds batch URLs from the discovery document, ignoring the endpoint above
+GMAIL_BATCH_URI = GMAIL_API_ENDPOINT + "batch/gmail/v1"
+# Calls Gmail accepts in one batch request
+GMAIL_BATCH_LIMIT = 100
+# File through which the workers on this host share the Gmail quota; empty
+# to give each process its own
+GMAIL_QUOTA_FILE = os.getenv("GMAIL_QUOTA_FILE", GMAIL_TOKEN_FILE + ".quota")
+
+# One Gmail service per process, rebuilt only when the credentials are replaced
+_service = None
+_creds = None
+_service_lock = threading.Lock()
+# httplib2 connections are not thread-safe, so each thread gets its own
+_thread_http = threading.local()
+
+gmail_stats = {
+    "calls": 0,
+    "builds": 0,
+    "build_seconds": 0.0,
+    "refreshes": 0,
+    "refresh_seconds": 0.0,
+    "refresh_failures": 0,
+    "reloads": 0,
+    "batches": 0,
+}
+
 def get_gmail_service():
     """
-        Shows basic usage of the Gmail API.
+        This process's Gmail API service. Credentials are loaded from
+        token.json once and refreshed shortly before they expire; the
+        service is built once from the bundled discovery document.
     """
+    global _service
+    gmail_stats["calls"] += 1
+    service = _service
+    if service is not None and not _needs_refresh(_creds):
+        return service
+
+    with _service_lock:
+        if _creds is None:
+            _load_credentials()
+        elif _needs_refresh(_creds):
+            _refresh_credentials()
+        if _service is None:
+            started = time.perf_counter()
+            # static_discovery uses the discovery document shipped with the
+            # client, so building makes no HTTP request
+            _service = build("gmail", "v1", credentials=_creds, static_discovery=True,
+                             cache_discovery=False, requestBuilder=_build_request,
+                             client_options={"api_endpoint": GMAIL_API_ENDPOINT})
+            gmail_stats["builds"] += 1
+            gmail_stats["build_seconds"] += time.perf_counter() - started
+        return _service
+
+def get_gmail_credentials():
+    """This process's Gmail credentials, refreshed shortly before they expire. Blocks while refreshing."""
+    creds = _creds
+    if creds is not None and not _needs_refresh(creds):
+        return creds
+    with _service_lock:
+        if _creds is None:
+            _load_credentials()
+        elif _needs_refresh(_creds):
+            _refresh_credentials()
+        return _creds
+
+async def get_gmail_access_token() -> str:
+    """The current access token, refreshed in a thread when it is about to expire"""
+    creds = _creds
+    if creds is not None and not _needs_refresh(creds):
+        return creds.token
+    return (await anyio.to_thread.run_sync(get_gmail_credentials)).token
+
+async def refresh_gmail_access_token(rejected: str) -> str:
+    """A new access token after Gmail rejected `rejected`, unless another caller already replaced it"""
+    def refresh():
+        with _service_lock:
+            if _creds is None:
+                _load_credentials()
+            elif _creds.token == rejected:
+                _refresh_credentials()
+            return _creds.token
+    return await anyio.to_thread.run_sync(refresh)
+
+def _needs_refresh(creds) -> bool:
+    if creds is None or not creds.token:
+        return True
+    if creds.expiry is None:
+        return False
+    # google-auth keeps expiry as a naive UTC datetime
+    return creds.expiry - datetime.now(timezone.utc).replace(tzinfo=None) < timedelta(seconds=GMAIL_REFRESH_MARGIN)
+
+def _load_credentials():
+    """Credentials from token.json, refreshed or authorized as needed. Caller holds _service_lock."""
+    global _creds
     creds = None
-    # The file token.json stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first
-    # time.
-    if os.path.exists("token.json"):
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-  # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                "credentials.json", SCOPES
-            )
-            creds = flow.run_console()
-        # Save the credentials for the next run
-        with open("token.json", "w") as token:
-            token.write(creds.to_json())
-
-    service = build("gmail", "v1", credentials=creds)
-    return service
-
-  # try:
-  #   # Call the Gmail API
-  #   service = build("gmail", "v1", credentials=creds)
-  #   results = service.users().labels().list(userId="me").execute()
-  #   labels = results.get("labels", [])
-
-  #   if not labels:
-  #     print("No labels found.")
-  #     return
-  #   print("Labels:")
-  #   for label in labels:
-  #     print(label["name"])
-
-  # except HttpError as error:
-  #   # TODO(developer) - Handle errors from gmail API.
-  #   print(f"An error occurred: {error}")
+    if os.path.exists(GMAIL_TOKEN_FILE):
+        creds = Credentials.from_authorized_user_file(GMAIL_TOKEN_FILE, SCOPES)
+    # If there are no (valid) credentials available, let the user log in.
+    if not creds or not creds.refresh_token:
+        flow = InstalledAppFlow.from_client_secrets_file(GMAIL_CREDENTIALS_FILE, SCOPES)
+        creds = flow.run_console()
+        with _token_file_lock():
+            _write_token(creds)
+    if GMAIL_TOKEN_URI:
+        creds = creds.with_token_uri(GMAIL_TOKEN_URI)
+    _creds = creds
+    if _needs_refresh(creds):
+        _refresh_credentials()
+    return _creds
+
+def _refresh_credentials():
+    """
+        Refresh the shared credentials in place. Caller holds _service_lock.
+
+        Workers share token.json, so the refresh happens under a file lock,
+        and a token another worker refreshed meanwhile is reused instead of
+        refreshing again.
+    """
+    with _token_file_lock():
+        if os.path.exists(GMAIL_TOKEN_FILE):
+            on_disk = Credentials.from_authorized_user_file(GMAIL_TOKEN_FILE, SCOPES)
+            if on_disk.token and on_disk.token != _creds.token and not _needs_refresh(on_disk):
+                _creds.token = on_disk.token
+                _creds.expiry = on_disk.expiry
+                gmail_stats["reloads"] += 1
+                return
+        started = time.perf_counter()
+        try:
+            _creds.refresh(Request())
+        except Exception:
+            gmail_stats["refresh_failures"] += 1
+            raise
+        finally:
+            gmail_stats["refresh_seconds"] += time.perf_counter() - started
+        gmail_stats["refreshes"] += 1
+        _write_token(_creds)
+
+@contextmanager
+def _token_file_lock():
+    """Exclusive lock shared by every worker process using token.json"""
+    with open(GMAIL_TOKEN_FILE + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _write_token(creds):
+    """Replace token.json atomically, so no worker ever reads a half-written file"""
+    directory = os.path.dirname(os.path.abspath(GMAIL_TOKEN_FILE))
+    fd, temp_path = tempfile.mkstemp(prefix=".token-", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as temp_file:
+            temp_file.write(creds.to_json())
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, GMAIL_TOKEN_FILE)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def _build_request(http, *args, **kwargs):
+    # The service is shared between threads; its requests go through a per-thread connection
+    authorized_http = getattr(_thread_http, "http", None)
+    if authorized_http is None or authorized_http.credentials is not _creds:
+        authorized_http = _thread_http.http = AuthorizedHttp(_creds, http=httplib2.Http())
+    return HttpRequest(authorized_http, *args, **kwargs)
+
+def new_gmail_batch(callback=None) -> BatchHttpRequest:
+    """
+        An empty Gmail batch request: up to GMAIL_BATCH_LIMIT calls sent in
+        one HTTP round trip, with callback(request_id, response, exception)
+        run once per call.
+    """
+    gmail_stats["batches"] += 1
+    return BatchHttpRequest(callback=callback, batch_uri=GMAIL_BATCH_URI)
+
+# Every Gmail call and send, from any worker, draws on one quota
+if GMAIL_QUOTA_FILE:
+    gmail_quota = SharedTokenBucket(GMAIL_QUOTA_FILE, GMAIL_QUOTA_RATE, GMAIL_QUOTA_BURST,
+                                    backoff_base=GMAIL_BACKOFF_BASE, backoff_max=GMAIL_BACKOFF_MAX)
+else:
+    gmail_quota = TokenBucket(GMAIL_QUOTA_RATE, GMAIL_QUOTA_BURST,
+                              backoff_base=GMAIL_BACKOFF_BASE, backoff_max=GMAIL_BACKOFF_MAX)
+# Async Gmail calls from this process share one connection pool
+gmail_client = GmailClient(GMAIL_API_ENDPOINT, get_gmail_access_token, refresh_gmail_access_token,
+                           limiter=gmail_quota)
+
+def get_gmail_stats() -> dict:
+    stats = dict(gmail_stats)
+    stats["build_seconds"] = round(stats["build_seconds"], 3)
+    stats["refresh_seconds"] = round(stats["refresh_seconds"], 3)
+    stats["token_expiry"] = _creds.expiry.isoformat() + "Z" if _creds is not None and _creds.expiry else None
+    stats["client"] = gmail_client.stats()
+    return stats
 
 @router.post("/send-otp")
 async def send_otp(request: OTPRequest, db: Session = Depends(get_db)):
@@ -88,7 +263,6 @@ async def send_otp(request: OTPRequest, db: Session = Depends(get_db)):
     create_otp_secret(email, secret, db)
 
     try:
-        service = get_gmail_service()
         message = EmailMessage()
 
         # Create email content
@@ -104,16 +278,10 @@ async def send_otp(request: OTPRequest, db: Session = Depends(get_db)):
 
         # Encode and send message
         encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-        create_message = {"raw": encoded_message}
         
-        send_message = (
-            service.users()
-            .messages()
-            .send(userId="me", body=create_message)
-            .execute()
-        )
+        send_message = await gmail_client.send(encoded_message)
         return {"message_id": send_message["id"], "status": "sent"}
-    except HttpError as error:
+    except GmailError as error:
         raise HTTPException(status_code=500, detail=str(error))
     
 @router.post("/verify-otp")
@@ -187,12 +355,16 @@ async def delete_expired_and_used_otp(db: Session):   # Delete expired otp
     db.commit()
     return {"message": f"Deleted {len(expired_otp)} expired OTPs and {len(used_otp)} used OTPs"}
 
+async def run_otp_cleanup():
+    """One pass of the expired and used OTP cleanup"""
+    with create_session() as db:
+        # logging.info(f"Deleting expired OTPs at {datetime.now()}")
+        return await delete_expired_and_used_otp(db)
+
 async def cleanup_expired_otp():
     while True:
         try:
-            with session as db:
-                # logging.info(f"Deleting expired OTPs at {datetime.now()}")
-                await delete_expired_and_used_otp(db)
+            await run_otp_cleanup()
         except Exception as e:
             logger.error(f"Error deleting expired OTPs: {e}")
         await asyncio.sleep(30)  # Run every 30 seconds
@@ -1,7 +1,8 @@
 from typing import List
-from database import get_db
+from database import async_db_dependency, get_db
 from auth import register, superuser_required
 from sqlalchemy.orm import Session
+from sqlalchemy import select
 from schemas import CreateProfessor, CreateUser, RegisterProfessor, UpdateProfessor, UserBase, DeleteProfessors
 from fastapi import APIRouter, Depends, HTTPException, status
 from models import ProfessorInformation, User
@@ -10,7 +11,7 @@ from uuid import uuid4
 router = APIRouter(prefix='/professor', tags=['professor'])
 
 @router.get('/get-professors')
-async def get_professors(db: Session = Depends(get_db)):
+async def get_professors(db: async_db_dependency):
     """
         Get a list of names of professors
 
@@ -20,7 +21,7 @@ async def get_professors(db: Session = Depends(get_db)):
 
     """
 
-    professors = db.query(ProfessorInformation).all()
+    professors = (await db.execute(select(ProfessorInformation))).scalars().all()
     professors_list = []
     for professor in professors:
         professors_list.append({
@@ -0,0 +1,179 @@
+import asyncio
+import fcntl
+import os
+import random
+import struct
+import time
+from contextlib import nullcontext
+
+
+class TokenBucket:
+    """
+        Async token bucket for an API quota: `rate` units refill per second,
+        up to `capacity` saved up for a burst. acquire(units) reserves the
+        units at once, going into debt if short, and waits until the debt is
+        repaid; callers are thus served in the order they arrived, and a
+        request larger than the capacity still goes through.
+
+        When the API pushes back anyway, throttled() empties the bucket and
+        pauses every caller for a jittered delay (or the server's
+        Retry-After). The delay doubles with each throttle in a row until
+        succeeded() is called; throttles reported during a pause, such as
+        the other calls already in flight, share it instead.
+    """
+
+    def __init__(self, rate: float, capacity: float, backoff_base: float = 1.0, backoff_max: float = 60.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._tokens = capacity
+        # When _tokens was counted; in the future while paused
+        self._updated = time.time()
+        self._strikes = 0
+        self.acquired = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.throttles = 0
+        self.backoff_seconds = 0.0
+
+    def _locked(self):
+        return nullcontext()
+
+    def _read(self) -> tuple:
+        return self._tokens, self._updated
+
+    def _write(self, tokens: float, updated: float):
+        self._tokens, self._updated = tokens, updated
+
+    def _refilled(self, now: float) -> tuple:
+        tokens, updated = self._read()
+        if now > updated:
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            updated = now
+        return tokens, updated
+
+    def _reserve(self, units: float) -> float:
+        """Take units now; returns the seconds until they are paid for"""
+        with self._locked():
+            now = time.time()
+            tokens, updated = self._refilled(now)
+            tokens -= units
+            self._write(tokens, updated)
+        return updated - now + max(0.0, -tokens) / self.rate
+
+    def paused_for(self) -> float:
+        """Seconds left of the current pause, if any"""
+        with self._locked():
+            _, updated = self._read()
+        return max(0.0, updated - time.time())
+
+    async def acquire(self, units: float = 1) -> float:
+        """Take `units`, waiting for them if needed; returns the seconds waited"""
+        started = time.monotonic()
+        delay = self._reserve(units)
+        if delay > 0:
+            self.waits += 1
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            try:
+                while delay > 0:
+                    await asyncio.sleep(delay)
+                    # A pause that began meanwhile holds back callers already waiting too
+                    delay = self.paused_for()
+            finally:
+                self.waiting -= 1
+        self.acquired += units
+        waited = time.monotonic() - started
+        self.wait_seconds += waited
+        self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def throttled(self, retry_after: float = None) -> float:
+        """The API refused a call for its rate; pause all callers. Returns the seconds until the pause ends."""
+        self.throttles += 1
+        with self._locked():
+            now = time.time()
+            tokens, updated = self._refilled(now)
+            if updated > now and retry_after is None:
+                return updated - now
+            self._strikes += 1
+            if retry_after is None:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (self._strikes - 1)) * random.uniform(0.5, 1.0)
+            else:
+                delay = min(retry_after, self.backoff_max)
+            self._write(min(tokens, 0.0), max(updated, now + delay))
+        self.backoff_seconds += delay
+        return max(updated, now + delay) - now
+
+    def succeeded(self):
+        """The API accepted a call; the next throttle starts from the base delay again"""
+        self._strikes = 0
+
+    def stats(self) -> dict:
+        with self._locked():
+            tokens, _ = self._refilled(time.time())
+        return {
+            "rate": self.rate,
+            "capacity": self.capacity,
+            "available": round(tokens, 1),
+            "acquired": round(self.acquired, 1),
+            "waits": self.waits,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "max_wait_seconds": round(self.max_wait, 3),
+            "throttles": self.throttles,
+            "backoff_seconds": round(self.backoff_seconds, 3),
+            "paused_seconds": round(self.paused_for(), 3),
+        }
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+        A TokenBucket kept in a small file, so every process on the host
+        opening the same path shares one quota and one pause. Each
+        reservation reads and rewrites the file under an exclusive flock,
+        held for microseconds. Queue depth and wait metrics stay per process.
+    """
+
+    STATE = struct.Struct("<dd")
+
+    def __init__(self, path: str, rate: float, capacity: float, **kwargs):
+        super().__init__(rate, capacity, **kwargs)
+        self.path = path
+        self._fd = None
+        self._pid = None
+
+    def _locked(self):
+        # flock belongs to the open file, and a descriptor inherited across
+        # fork would be shared with the parent, so each process opens its own
+        if self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._pid = os.getpid()
+        return _FileLock(self._fd)
+
+    def _read(self) -> tuple:
+        data = os.pread(self._fd, self.STATE.size, 0)
+        if len(data) < self.STATE.size:
+            return self.capacity, time.time()
+        tokens, updated = self.STATE.unpack(data)
+        # Left by a process with other settings, or before the clock was set back
+        return min(tokens, self.capacity), min(updated, time.time() + self.backoff_max)
+
+    def _write(self, tokens: float, updated: float):
+        os.pwrite(self._fd, self.STATE.pack(tokens, updated), 0)
+
+
+class _FileLock:
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def __enter__(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
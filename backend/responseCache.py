@@ -0,0 +1,131 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class _ComputeCancelled(Exception):
+    """The caller computing a value was cancelled before it finished"""
+
+
+class ResponseCache:
+    """
+        Bounded LRU cache whose entries also expire after `ttl` seconds.
+
+        get_or_compute() collapses concurrent calls for the same key into one
+        computation: the first caller computes, the others await its result.
+        If that caller is cancelled, the others retry rather than being
+        cancelled with it. Meant to be used from a single event loop.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+        self.retries = 0
+        # Bumped by clear(), so values computed before it aren't cached after it
+        self._generation = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Cached value for key, or None when missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """
+            Drop every entry. Computations already running still answer
+            their own callers, but their values are not cached, and later
+            callers compute afresh instead of waiting for them.
+        """
+        self._entries.clear()
+        self._inflight.clear()
+        self._generation += 1
+        self.invalidations += 1
+
+    async def get_or_compute(self, key, compute):
+        """
+            Return the cached value for key, computing it with `await compute()` on a miss.
+        """
+        while True:
+            value = self.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except _ComputeCancelled:
+                # Only the computing caller was cancelled, e.g. its kiosk
+                # disconnected; the first waiter to get here computes instead
+                self.retries += 1
+
+        self.misses += 1
+        generation = self._generation
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.set_exception(_ComputeCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # the waiters, if any, get it; don't warn when there are none
+            raise
+        else:
+            if self._generation == generation:
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            # Not a computation started after a clear()
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import uvicorn
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from fastapi import FastAPI, HTTPException, status
+
+from adcrud import run_image_cleanup
+from appointmentCore import run_email_check
+from database import dispose_async_engine, dispose_engine
+from leaderElection import job_lock
+from otp import gmail_client, run_otp_cleanup
+
+# Runs the periodic jobs in a process of its own, instead of in every web
+# worker: `python scheduler.py`, with RUN_SCHEDULED_JOBS=false for the web
+# app. GET /stats on SCHEDULER_PORT reports each job's runs and durations,
+# and GET /health fails when the scheduler has stopped.
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCHEDULER_HOST = os.getenv("SCHEDULER_HOST", "0.0.0.0")
+SCHEDULER_PORT = int(os.getenv("SCHEDULER_PORT", "8001"))
+# Seconds a run is moved by at random, so jobs don't all hit the database at once
+SCHEDULER_JITTER = float(os.getenv("SCHEDULER_JITTER", "5"))
+# Seconds late a run may still start, e.g. after the event loop was busy; later ones are skipped
+SCHEDULER_MISFIRE_GRACE = int(os.getenv("SCHEDULER_MISFIRE_GRACE", "30"))
+
+
+def job_setting(name: str, setting: str, default: str) -> float:
+    """A job's setting from SCHEDULER_<JOB>_<SETTING>, e.g. SCHEDULER_EMAIL_CHECK_INTERVAL"""
+    return float(os.getenv(f"SCHEDULER_{name.upper()}_{setting}", default))
+
+# name -> (one pass of the job, seconds between runs, seconds a run may take)
+JOBS = {
+    "image_cleanup": (run_image_cleanup, job_setting("image_cleanup", "INTERVAL", "90"),
+                      job_setting("image_cleanup", "TIMEOUT", "60")),
+    "otp_cleanup": (run_otp_cleanup, job_setting("otp_cleanup", "INTERVAL", "30"),
+                    job_setting("otp_cleanup", "TIMEOUT", "20")),
+    "email_check": (run_email_check, job_setting("email_check", "INTERVAL", "90"),
+                    job_setting("email_check", "TIMEOUT", "300")),
+}
+
+job_stats = {
+    name: {"interval": interval, "timeout": timeout, "runs": 0, "successes": 0, "failures": 0, "timeouts": 0,
+           "skipped_locked": 0, "skipped_overlap": 0, "missed": 0, "running": False, "last_started": None,
+           "last_success": None, "last_error": None, "last_seconds": None, "max_seconds": 0.0,
+           "total_seconds": 0.0}
+    for name, (_, interval, timeout) in JOBS.items()
+}
+
+scheduler = AsyncIOScheduler(timezone=timezone.utc)
+# Runs in progress, waited for on shutdown
+running_runs = set()
+
+
+async def run_job(name: str):
+    """
+        One run of a job, under its advisory lock and timeout. A failed or
+        timed-out run is logged and counted; the next one starts on schedule
+        as usual, so a job can't die the way a bare loop does.
+
+        The timeout cancels the run at its next await; blocking database
+        work in between finishes first.
+    """
+    job, _, timeout = JOBS[name]
+    stats = job_stats[name]
+    # Also held by a web worker still running the job itself, so the two never overlap
+    async with job_lock(name) as acquired:
+        if not acquired:
+            stats["skipped_locked"] += 1
+            logger.info("Skipping %s: another process is running it", name)
+            return
+        running_runs.add(asyncio.current_task())
+        stats["runs"] += 1
+        stats["running"] = True
+        stats["last_started"] = datetime.now(timezone.utc).isoformat()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(job(), timeout)
+        except TimeoutError:
+            stats["timeouts"] += 1
+            stats["failures"] += 1
+            stats["last_error"] = f"timed out after {timeout:g}s"
+            logger.error("Job %s timed out after %gs", name, timeout)
+        except Exception as e:
+            stats["failures"] += 1
+            stats["last_error"] = str(e)
+            logger.exception("Job %s failed", name)
+        else:
+            stats["successes"] += 1
+            stats["last_success"] = datetime.now(timezone.utc).isoformat()
+        finally:
+            elapsed = time.perf_counter() - started
+            running_runs.discard(asyncio.current_task())
+            stats["running"] = False
+            stats["last_seconds"] = round(elapsed, 3)
+            stats["max_seconds"] = round(max(stats["max_seconds"], elapsed), 3)
+            stats["total_seconds"] = round(stats["total_seconds"] + elapsed, 3)
+
+def count_skipped_run(event):
+    if event.code == EVENT_JOB_MAX_INSTANCES:
+        # The previous run is still going; max_instances=1 drops this one
+        job_stats[event.job_id]["skipped_overlap"] += 1
+        logger.warning("Skipping %s: its previous run is still going", event.job_id)
+    else:
+        job_stats[event.job_id]["missed"] += 1
+
+def start_scheduler():
+    for name, (_, interval, _) in JOBS.items():
+        # The first runs are spread over the jitter window rather than all at startup
+        first_run = datetime.now(timezone.utc) + timedelta(seconds=random.uniform(0, SCHEDULER_JITTER))
+        scheduler.add_job(run_job, IntervalTrigger(seconds=interval, jitter=SCHEDULER_JITTER), args=[name], id=name,
+                          name=name, max_instances=1, coalesce=True, misfire_grace_time=SCHEDULER_MISFIRE_GRACE,
+                          next_run_time=first_run)
+    scheduler.add_listener(count_skipped_run, EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
+    scheduler.start()
+    logger.info("Scheduler started with jobs: %s", ", ".join(JOBS))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_scheduler()
+    yield
+    # Stop starting runs, and let the ones in progress finish
+    scheduler.shutdown(wait=False)
+    await asyncio.gather(*running_runs, return_exceptions=True)
+    await gmail_client.aclose()
+    dispose_engine()
+    await dispose_async_engine()
+
+app = FastAPI(title="Job scheduler", docs_url=None, redoc_url=None, lifespan=lifespan)
+
+@app.get("/health", status_code=status.HTTP_200_OK)
+async def health():
+    if not scheduler.running:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Scheduler is not running")
+    return {"status": "ok"}
+
+@app.get("/stats", status_code=status.HTTP_200_OK)
+async def stats():
+    """Runs, outcomes and durations of each job, and when it runs next"""
+    jobs = {}
+    for name, job_stat in job_stats.items():
+        job = scheduler.get_job(name)
+        next_run = job.next_run_time.isoformat() if job is not None and job.next_run_time else None
+        average = job_stat["total_seconds"] / job_stat["runs"] if job_stat["runs"] else None
+        jobs[name] = {**job_stat, "next_run": next_run,
+                      "avg_seconds": round(average, 3) if average is not None else None}
+    return {"pid": os.getpid(), "running": scheduler.running, "jobs": jobs}
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=SCHEDULER_HOST, port=SCHEDULER_PORT)
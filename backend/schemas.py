@@ -53,6 +53,7 @@ class FAQOut(BaseModel):
     synonyms: List[str]
     answer: str
     isPinned: bool
+    hit_count: int = 0
 
     class Config:
         from_attributes = True
@@ -64,6 +65,51 @@ class QueryResponse(BaseModel):
     response: Optional[str] = None
     suggestions: Optional[List[str]] = None
 
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    threshold: float = 70
+    # Count the queries as FAQ hits or unknown questions, as /ray/chat does
+    record: bool = True
+
+class BatchQueryResult(QueryResponse):
+    query: str
+    matched_question: Optional[str] = None
+    score: Optional[float] = None
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryResult]
+
+class AutocompleteResponse(BaseModel):
+    query: str
+    suggestions: List[str]
+
+class FAQImportError(BaseModel):
+    line: int
+    detail: str
+
+class FAQImportResult(BaseModel):
+    format: str
+    rows: int
+    inserted: int
+    # Rows a dry run found valid and new; nothing is written
+    would_insert: int = 0
+    duplicates: int
+    invalid: int
+    errors: List[FAQImportError]
+    dry_run: bool
+    seconds: float
+    rows_per_second: float
+
+class UserFAQOut(BaseModel):
+    id: int
+    query: str
+    count: int
+    first_seen: datetime
+    last_seen: datetime
+
+    class Config:
+        from_attributes = True
+
 class CreateProfessor(BaseModel):
     first_name: str
     last_name: str
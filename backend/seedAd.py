@@ -1,13 +1,12 @@
 import os
 import shutil
 from datetime import datetime, timedelta
-from database import create_session, db_connect
+from database import create_session
 from models import Image
 
 def seed_default_ads():
     """Seed the database with default advertisements"""
-    engine, connection = db_connect()
-    session = create_session(engine)
+    session = create_session()
     
     # Define your default ads with very long expiration (10 years from now)
     default_ads = [
@@ -0,0 +1,68 @@
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from countBuffer import CountBuffer, flush_counts, flush_periodically
+from faqIndex import normalize
+from models import UserFAQ
+
+# Seconds between flushes of the buffered unknown queries
+FLUSH_INTERVAL = float(os.getenv("UNKNOWN_QUERY_FLUSH_INTERVAL", "30"))
+# Distinct queries held between flushes; new ones past this are dropped
+MAX_PENDING = int(os.getenv("UNKNOWN_QUERY_MAX_PENDING", "5000"))
+# Longer queries are cut before they are stored
+MAX_QUERY_LENGTH = 500
+# Rows per INSERT ... ON CONFLICT statement
+FLUSH_BATCH_SIZE = 500
+
+
+class UnknownQueryBuffer(CountBuffer):
+    """
+        Unknown chat queries counted in memory, keyed by normalized text.
+        Each entry also keeps the first wording seen, and when the query
+        was first and last asked: [count, query, first_seen, last_seen].
+    """
+
+    def __init__(self, max_pending: int = MAX_PENDING):
+        super().__init__(max_pending)
+
+    def record(self, query: str, count: int = 1, seen_at: datetime = None):
+        query = query.strip()[:MAX_QUERY_LENGTH]
+        if not query:
+            return
+        seen_at = seen_at or datetime.now(timezone.utc)
+        super().record(normalize(query) or query.lower(), count, query, seen_at, seen_at)
+
+    def merge(self, entry: list, fields: tuple):
+        _, first_seen, last_seen = fields
+        entry[2] = min(entry[2], first_seen)
+        entry[3] = max(entry[3], last_seen)
+
+
+unknown_queries = UnknownQueryBuffer()
+
+
+def upsert_statement(entries: list):
+    """One INSERT ... ON CONFLICT adding the counts of `entries` to user_faq"""
+    stmt = insert(UserFAQ).values([
+        {"query": query, "normalized_query": key, "count": count, "first_seen": first_seen, "last_seen": last_seen}
+        for key, count, query, first_seen, last_seen in entries
+    ])
+    return stmt.on_conflict_do_update(
+        index_elements=[UserFAQ.normalized_query],
+        set_={
+            "count": UserFAQ.count + stmt.excluded.count,
+            "first_seen": func.least(UserFAQ.first_seen, stmt.excluded.first_seen),
+            "last_seen": func.greatest(UserFAQ.last_seen, stmt.excluded.last_seen),
+        },
+    )
+
+async def flush_unknown_queries(buffer: UnknownQueryBuffer = unknown_queries) -> int:
+    """Write the buffered counts to user_faq. Returns the number of distinct queries written."""
+    return await flush_counts(buffer, upsert_statement, FLUSH_BATCH_SIZE)
+
+async def flush_unknown_queries_periodically():
+    """Background task: flush the unknown query buffer every FLUSH_INTERVAL seconds"""
+    await flush_periodically(flush_unknown_queries, FLUSH_INTERVAL, "unknown queries")
@@ -231,7 +231,7 @@ export async function starFAQ(param: FAQid) {
   return res.data;
 }
 
-export async function getUserFAQs() {
+export async function getUserFAQs(page: number = 1, pageSize: number = 50) {
   const token = localStorage.getItem("token");
   if (!token) return;
 
@@ -239,8 +239,13 @@ export async function getUserFAQs() {
     headers: {
       Authorization: `Bearer ${token}`,
     },
+    params: { page, page_size: pageSize },
   });
-  return res.data;
+  // The total across all pages comes in a header, the page itself in the body
+  return {
+    items: res.data,
+    total: Number(res.headers["x-total-count"] ?? res.data.length),
+  };
 }
 
 export async function deleteUserFAQ(user_faq: FAQid) {
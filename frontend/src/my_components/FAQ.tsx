@@ -305,13 +305,24 @@ export const FAQDialog = ({ onRefresh }: FAQDialogProps) => {
   );
 };
 //  <CopyButton text="TEST" className="h-10" />
+const USER_FAQ_PAGE_SIZE = 50;
+
 export function UserFAQ() {
   const [userFAQs, setUserFAQs] = useState([]);
+  const [page, setPage] = useState(1);
+  const [total, setTotal] = useState(0);
+  const pageCount = Math.max(1, Math.ceil(total / USER_FAQ_PAGE_SIZE));
 
   async function fetchUserFAQs() {
     try {
-      const res = await getUserFAQs();
-      setUserFAQs(res);
+      const res = await getUserFAQs(page, USER_FAQ_PAGE_SIZE);
+      if (!res) return;
+      setUserFAQs(res.items);
+      setTotal(res.total);
+      // Deleting the last question on the last page leaves that page empty
+      if (!res.items.length && page > 1) {
+        setPage(Math.max(1, Math.ceil(res.total / USER_FAQ_PAGE_SIZE)));
+      }
     } catch (error) {
       console.error("Failed to fetch user FAQs:", error);
       toast.error("Failed to fetch user FAQs");
@@ -333,7 +344,7 @@ export function UserFAQ() {
 
   useEffect(() => {
     fetchUserFAQs();
-  }, []);
+  }, [page]);
 
   return (
     <Dialog>
@@ -367,6 +378,25 @@ export function UserFAQ() {
             </div>
           ))}
         </div>
+        <div className="flex items-center justify-between">
+          <Button
+            variant="outline"
+            disabled={page <= 1}
+            onClick={() => setPage((prev) => prev - 1)}
+          >
+            Previous
+          </Button>
+          <Label>
+            Page {page} of {pageCount} ({total} questions)
+          </Label>
+          <Button
+            variant="outline"
+            disabled={page >= pageCount}
+            onClick={() => setPage((prev) => prev + 1)}
+          >
+            Next
+          </Button>
+        </div>
       </DialogContent>
     </Dialog>
   );